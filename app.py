@@ -1,16 +1,46 @@
-from flask import Flask, request, jsonify
+import startup
+
+# Timed individually for the /startup report; the imports below are then
+# served from sys.modules.
+startup.import_modules(
+    'flask', 'flask_cors', 'dotenv', 'database', 'breaker', 'extract', 'pipeline', 'jobs',
+    'llm_cache', 'blobstore', 'crawl', 'metrics', 'changes', 'export', 'search', 'retention'
+)
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from database import init_db, add_extraction, get_recent_extractions, close_connection
-from extract import process_url
+from database import (
+    init_db, get_change_version, get_data_version, get_latest_extractions, get_recent_extractions, close_connection,
+    find_extractions, get_feature_counts, get_price_summary
+)
+from pipeline import BATCH_MAX_URLS, normalize_url, run_batch, run_extraction
+from jobs import QueueFullError, enqueue_job, get_job, start_workers
+from retention import start_retention
+import llm_cache
+import blobstore
+import breaker
+from crawl import CRAWL_MAX_PAGES, CRAWL_MAX_PAGES_LIMIT, crawl_site
+import metrics
+from changes import (
+    CHANGES_MAX_WAIT, acquire_stream_slot, release_stream_slot, stream_changes, wait_for_changes
+)
+from export import EXPORT_FORMATS, stream_export
+from search import SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, search_extractions
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 
-init_db()
+with startup.phase('init_db'):
+    init_db()
+with startup.phase('start_workers'):
+    start_workers()
+    start_retention()
+    metrics.start_flusher()
+startup.mark_ready()
 
 @app.teardown_appcontext
 def close_db(error):
@@ -36,36 +66,48 @@ def extract_data():
                 "error": "URL is required"
             }), 400
         
-        url = data['url'].strip()
+        url = normalize_url(data['url'])
+        force_llm = bool(data.get('force_llm'))
         
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
+        if data.get('async') or request.args.get('async', type=int):
+            try:
+                job_id = enqueue_job(url, force_llm=force_llm)
+            except QueueFullError as e:
+                response = jsonify({
+                    "success": False,
+                    "error": str(e)
+                })
+                response.headers['Retry-After'] = '30'
+                return response, 429
+            
+            return jsonify({
+                "success": True,
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/jobs/{job_id}",
+                "url": url
+            }), 202
         
-        result = process_url(url)
+        result = run_extraction(url, force_llm=force_llm)
         
         if result['success']:
-            extraction_id = add_extraction(
-                url=url,
-                extracted_data=result['data'],
-                raw_html="",
-                status="success"
-            )
-            
             return jsonify({
                 "success": True,
-                "extraction_id": extraction_id,
+                "extraction_id": result['extraction_id'],
                 "data": result['data'],
+                "tier": result['tier'],
                 "url": url,
                 "message": "Data extracted successfully"
             })
+        elif result.get('retry_after'):
+            response = jsonify({
+                "success": False,
+                "error": result['error'],
+                "retry_after": result['retry_after']
+            })
+            response.headers['Retry-After'] = str(int(result['retry_after']) + 1)
+            return response, 429
         else:
-            add_extraction(
-                url=url,
-                extracted_data={},
-                raw_html="",
-                status="failed"
-            )
-            
             return jsonify({
                 "success": False,
                 "error": result['error']
@@ -77,16 +119,226 @@ def extract_data():
             "error": f"Server error: {str(e)}"
         }), 500
 
+@app.route('/extract/batch', methods=['POST'])
+def extract_batch():
+    try:
+        data = request.get_json()
+        urls = data.get('urls') if isinstance(data, dict) else None
+        
+        if not isinstance(urls, list) or not urls:
+            return jsonify({
+                "success": False,
+                "error": "A non-empty list of URLs is required"
+            }), 400
+        
+        if len(urls) > BATCH_MAX_URLS:
+            return jsonify({
+                "success": False,
+                "error": f"Too many URLs in one batch (max {BATCH_MAX_URLS})"
+            }), 400
+        
+        results = run_batch(urls, force_llm=bool(data.get('force_llm')))
+        succeeded = sum(1 for result in results if result['success'])
+        
+        return jsonify({
+            "success": True,
+            "results": results,
+            "count": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }), 500
+
+@app.route('/crawl', methods=['POST'])
+def crawl():
+    try:
+        data = request.get_json()
+        url = data.get('url') if isinstance(data, dict) else None
+        
+        if not isinstance(url, str) or not url.strip():
+            return jsonify({
+                "success": False,
+                "error": "URL is required"
+            }), 400
+        
+        max_pages = data.get('max_pages', CRAWL_MAX_PAGES)
+        if not isinstance(max_pages, int) or not 1 <= max_pages <= CRAWL_MAX_PAGES_LIMIT:
+            return jsonify({
+                "success": False,
+                "error": f"max_pages must be between 1 and {CRAWL_MAX_PAGES_LIMIT}"
+            }), 400
+        
+        result = crawl_site(url, max_pages=max_pages, force_llm=bool(data.get('force_llm')))
+        if not result['success']:
+            return jsonify(result), 403
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }), 500
+
 @app.route('/data', methods=['GET'])
 def get_data():
     try:
         limit = request.args.get('limit', 50, type=int)
-        extractions = get_recent_extractions(limit)
+        before_id = request.args.get('before_id', type=int)
+        latest = request.args.get('latest', '0') in ('1', 'true')
+        
+        # Dashboards poll this endpoint; answer unchanged polls from the ETag
+        # alone without running the page query or serializing rows.
+        etag = f"{get_data_version()}-{limit}-{before_id or ''}{'-latest' if latest else ''}"
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        if latest:
+            extractions = get_latest_extractions(limit, before_id)
+        else:
+            extractions = get_recent_extractions(limit, before_id)
+        
+        response = jsonify({
+            "success": True,
+            "data": extractions,
+            "count": len(extractions),
+            "next_before_id": extractions[-1]['id'] if len(extractions) == limit else None,
+            "last_event_id": get_change_version()
+        })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/data/changes', methods=['GET'])
+def get_data_changes():
+    try:
+        after_id = request.args.get('after_id', type=int)
+        timeout = min(request.args.get('timeout', 0, type=int), CHANGES_MAX_WAIT)
+        
+        if after_id is None:
+            return jsonify({
+                "success": True,
+                "data": [],
+                "count": 0,
+                "last_event_id": get_change_version(),
+                "reset": False
+            })
+        
+        # Over the per-worker cap the poll is answered at once rather than
+        # holding another thread; the client simply polls again.
+        waiting = timeout > 0 and acquire_stream_slot()
+        try:
+            changes, last_event_id, reset = wait_for_changes(after_id, timeout if waiting else 0)
+        finally:
+            if waiting:
+                release_stream_slot()
+        
+        return jsonify({
+            "success": True,
+            "data": changes,
+            "count": len(changes),
+            "last_event_id": last_event_id,
+            "reset": reset
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/data/stream', methods=['GET'])
+def stream_data():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    # EventSource gives up on a non-200 answer, and the dashboard then falls
+    # back to polling /data.
+    if not acquire_stream_slot():
+        return jsonify({
+            "success": False,
+            "error": "Too many open change streams on this worker; poll /data instead"
+        }), 503, {'Retry-After': '30'}
+    
+    response = Response(
+        stream_changes(last_event_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    response.call_on_close(release_stream_slot)
+    return response
+
+@app.route('/search', methods=['GET'])
+def search():
+    try:
+        query = (request.args.get('q') or '').strip()
+        limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        
+        if not query:
+            return jsonify({
+                "success": False,
+                "error": "q is required"
+            }), 400
+        
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+        offset = max(0, offset)
+        results, total = search_extractions(query, limit, offset)
+        
+        return jsonify({
+            "success": True,
+            "data": results,
+            "count": len(results),
+            "total": total,
+            "next_offset": offset + limit if offset + limit < total else None
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/products', methods=['GET'])
+def get_products():
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+        offset = max(0, request.args.get('offset', 0, type=int))
+        
+        extractions = find_extractions(
+            feature=request.args.get('feature'),
+            min_price=request.args.get('min_price', type=float),
+            max_price=request.args.get('max_price', type=float),
+            currency=request.args.get('currency'),
+            period=request.args.get('period'),
+            limit=limit,
+            offset=offset
+        )
         
         return jsonify({
             "success": True,
             "data": extractions,
-            "count": len(extractions)
+            "count": len(extractions),
+            "next_offset": offset + limit if len(extractions) == limit else None
         })
         
     except Exception as e:
@@ -95,6 +347,68 @@ def get_data():
             "error": f"Database error: {str(e)}"
         }), 500
 
+@app.route('/features', methods=['GET'])
+def get_features():
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        features = get_feature_counts(request.args.get('prefix'), limit)
+        
+        return jsonify({
+            "success": True,
+            "data": features,
+            "count": len(features)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/prices', methods=['GET'])
+def get_prices():
+    try:
+        summary = get_price_summary(request.args.get('feature'))
+        
+        return jsonify({
+            "success": True,
+            "data": summary,
+            "count": len(summary)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/export', methods=['GET'])
+def export_data():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            "success": False,
+            "error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+        }), 400
+    
+    filters = {
+        "since": request.args.get('since'),
+        "until": request.args.get('until'),
+        "status": request.args.get('status'),
+        "url_prefix": request.args.get('url_prefix')
+    }
+    
+    # Rows are written as they are read, so the full history can be pulled
+    # without building it in memory first.
+    return Response(
+        stream_export(export_format, filters),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename=extractions.{export_format}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @app.route('/extractions/<int:extraction_id>', methods=['GET'])
 def get_extraction(extraction_id):
     try:
@@ -104,7 +418,7 @@ def get_extraction(extraction_id):
         cursor = db.cursor()
         
         cursor.execute('''
-            SELECT id, url, name, description, features, pricing, extracted_at, status
+            SELECT id, url, name, description, features, pricing, extracted_at, status, tier
             FROM extractions
             WHERE id = ?
         ''', (extraction_id,))
@@ -120,7 +434,8 @@ def get_extraction(extraction_id):
                 'features': row[4],
                 'pricing': row[5],
                 'extracted_at': row[6],
-                'status': row[7]
+                'status': row[7],
+                'tier': row[8]
             }
             
             return jsonify({
@@ -139,6 +454,96 @@ def get_extraction(extraction_id):
             "error": f"Database error: {str(e)}"
         }), 500
 
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    try:
+        job = get_job(job_id)
+        
+        if job:
+            return jsonify({
+                "success": True,
+                "data": job
+            })
+        else:
+            return jsonify({
+                "success": False,
+                "error": "Job not found"
+            }), 404
+            
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    try:
+        return jsonify({
+            "success": True,
+            "data": dict(llm_cache.get_stats(), blobs=blobstore.get_stats())
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/admin/circuits', methods=['GET'])
+def get_circuits():
+    # Hosts with recent fetch failures (open circuits carry a retry_after)
+    # and URLs currently held in the negative cache, across all workers.
+    try:
+        return jsonify({
+            "success": True,
+            "data": breaker.get_state()
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/admin/circuits/<host>', methods=['DELETE'])
+def reset_circuit(host):
+    try:
+        if breaker.reset(host):
+            return jsonify({
+                "success": True,
+                "message": f"Circuit for {host} reset"
+            })
+        else:
+            return jsonify({
+                "success": False,
+                "error": "No circuit state for this host"
+            }), 404
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }), 500
+
+@app.route('/startup', methods=['GET'])
+def get_startup_report():
+    # How long this worker took to import and initialize, to diagnose cold
+    # starts on hosts that spin instances down when idle.
+    return jsonify({
+        "success": True,
+        "data": startup.get_report()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format, summed across every worker process.
+    try:
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+        
+    except Exception as e:
+        return Response(f"# metrics unavailable: {str(e)}\n", status=500, mimetype='text/plain')
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({"success": False, "error": "Endpoint not found"}), 404
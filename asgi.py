@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from database import (
+    init_db, get_change_version, get_data_version, get_extraction, get_latest_extractions, get_recent_extractions
+)
+from pipeline import normalize_url, run_extraction_async
+from jobs import QueueFullError, enqueue_job, start_workers
+from retention import start_retention
+from changes import CHANGES_MAX_WAIT, stream_changes_async, wait_for_changes_async
+import http_client
+import metrics
+
+# Async variant of the API in app.py for the I/O-bound endpoints, served by
+# uvicorn alongside wsgi:app. Page fetches and Gemini calls are awaited on
+# the event loop, so one worker holds many extractions in flight; SQLite and
+# HTML parsing run in threads. Response bodies match app.py byte for byte.
+
+load_dotenv()
+
+init_db()
+start_workers()
+start_retention()
+metrics.start_flusher()
+
+class FlaskJSONResponse(JSONResponse):
+    # Same serialization as Flask's jsonify: sorted keys, ASCII-escaped,
+    # compact separators and a trailing newline.
+    def render(self, content):
+        return (json.dumps(content, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+def _int_arg(request, name, default=None):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+def _etag_matches(request, etag):
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix('W/').strip('"') for tag in header.split(',')}
+    return '*' in tags or etag in tags
+
+async def health_check(request):
+    return FlaskJSONResponse({
+        "status": "healthy",
+        "service": "VisionFlow API",
+        "version": "1.0.0"
+    })
+
+async def extract_data(request):
+    try:
+        data = await request.json()
+        
+        if not data or 'url' not in data:
+            return FlaskJSONResponse({
+                "success": False,
+                "error": "URL is required"
+            }, status_code=400)
+        
+        url = normalize_url(data['url'])
+        force_llm = bool(data.get('force_llm'))
+        
+        if data.get('async') or _int_arg(request, 'async'):
+            try:
+                job_id = await asyncio.to_thread(enqueue_job, url, force_llm)
+            except QueueFullError as e:
+                return FlaskJSONResponse({
+                    "success": False,
+                    "error": str(e)
+                }, status_code=429, headers={'Retry-After': '30'})
+            
+            return FlaskJSONResponse({
+                "success": True,
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/jobs/{job_id}",
+                "url": url
+            }, status_code=202)
+        
+        result = await run_extraction_async(url, force_llm=force_llm)
+        
+        if result['success']:
+            return FlaskJSONResponse({
+                "success": True,
+                "extraction_id": result['extraction_id'],
+                "data": result['data'],
+                "tier": result['tier'],
+                "url": url,
+                "message": "Data extracted successfully"
+            })
+        elif result.get('retry_after'):
+            return FlaskJSONResponse({
+                "success": False,
+                "error": result['error'],
+                "retry_after": result['retry_after']
+            }, status_code=429, headers={'Retry-After': str(int(result['retry_after']) + 1)})
+        else:
+            return FlaskJSONResponse({
+                "success": False,
+                "error": result['error']
+            }, status_code=500)
+            
+    except Exception as e:
+        return FlaskJSONResponse({
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }, status_code=500)
+
+async def get_data(request):
+    try:
+        limit = _int_arg(request, 'limit', 50)
+        before_id = _int_arg(request, 'before_id')
+        latest = request.query_params.get('latest', '0') in ('1', 'true')
+        
+        etag = f"{await asyncio.to_thread(get_data_version)}-{limit}-{before_id or ''}{'-latest' if latest else ''}"
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        
+        query = get_latest_extractions if latest else get_recent_extractions
+        extractions = await asyncio.to_thread(query, limit, before_id)
+        
+        return FlaskJSONResponse({
+            "success": True,
+            "data": extractions,
+            "count": len(extractions),
+            "next_before_id": extractions[-1]['id'] if len(extractions) == limit else None,
+            "last_event_id": await asyncio.to_thread(get_change_version)
+        }, headers=headers)
+        
+    except Exception as e:
+        return FlaskJSONResponse({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }, status_code=500)
+
+async def get_data_changes(request):
+    try:
+        after_id = _int_arg(request, 'after_id')
+        timeout = min(_int_arg(request, 'timeout', 0), CHANGES_MAX_WAIT)
+        
+        if after_id is None:
+            return FlaskJSONResponse({
+                "success": True,
+                "data": [],
+                "count": 0,
+                "last_event_id": await asyncio.to_thread(get_change_version),
+                "reset": False
+            })
+        
+        changes, last_event_id, reset = await wait_for_changes_async(after_id, timeout)
+        
+        return FlaskJSONResponse({
+            "success": True,
+            "data": changes,
+            "count": len(changes),
+            "last_event_id": last_event_id,
+            "reset": reset
+        })
+        
+    except Exception as e:
+        return FlaskJSONResponse({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }, status_code=500)
+
+async def stream_data(request):
+    # An idle client here is a suspended coroutine rather than a thread, so
+    # this feed has no per-worker cap.
+    last_event_id = request.headers.get('last-event-id') or request.query_params.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    return StreamingResponse(
+        stream_changes_async(last_event_id),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+async def get_extraction_by_id(request):
+    try:
+        extraction = await asyncio.to_thread(get_extraction, request.path_params['extraction_id'])
+        
+        if extraction:
+            return FlaskJSONResponse({
+                "success": True,
+                "data": extraction
+            })
+        else:
+            return FlaskJSONResponse({
+                "success": False,
+                "error": "Extraction not found"
+            }, status_code=404)
+            
+    except Exception as e:
+        return FlaskJSONResponse({
+            "success": False,
+            "error": f"Database error: {str(e)}"
+        }, status_code=500)
+
+async def not_found(request, exc):
+    return FlaskJSONResponse({"success": False, "error": "Endpoint not found"}, status_code=404)
+
+async def http_error(request, exc):
+    return Response(exc.detail, status_code=exc.status_code, headers=exc.headers)
+
+async def internal_error(request, exc):
+    return FlaskJSONResponse({"success": False, "error": "Internal server error"}, status_code=500)
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await http_client.close_async_client()
+
+app = Starlette(
+    routes=[
+        Route('/', health_check, methods=['GET']),
+        Route('/extract', extract_data, methods=['POST']),
+        Route('/data', get_data, methods=['GET']),
+        Route('/data/changes', get_data_changes, methods=['GET']),
+        Route('/data/stream', stream_data, methods=['GET']),
+        Route('/extractions/{extraction_id:int}', get_extraction_by_id, methods=['GET'])
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    exception_handlers={
+        404: not_found,
+        HTTPException: http_error,
+        500: internal_error
+    },
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import zlib
+from collections import namedtuple
+
+from database import get_connection
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOB_STORE_ENABLED = os.getenv('BLOB_STORE_ENABLED', '1') != '0'
+BLOB_CODEC = os.getenv('BLOB_CODEC', 'zstd' if zstandard is not None else 'zlib')
+BLOB_COMPRESSION_LEVEL = int(os.getenv('BLOB_COMPRESSION_LEVEL', '6'))
+BLOB_MAX_BYTES = int(os.getenv('BLOB_MAX_BYTES', str(8 * 1024 * 1024)))
+
+Blob = namedtuple('Blob', ['hash', 'codec', 'size', 'data'])
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def compress(data):
+    if BLOB_CODEC == 'zstd' and zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=BLOB_COMPRESSION_LEVEL).compress(data)
+    return 'zlib', zlib.compress(data, BLOB_COMPRESSION_LEVEL)
+
+def decompress(codec, payload):
+    if codec == 'zlib':
+        return zlib.decompress(payload)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise Exception("Blob is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise Exception(f"Unknown blob codec: {codec}")
+
+def prepare_blob(text):
+    # Hashing and compression run in the caller's thread, outside the write
+    # transaction; a page that is already stored is not compressed again.
+    if not BLOB_STORE_ENABLED or not text:
+        return None
+
+    data = text.encode('utf-8') if isinstance(text, str) else text
+    if len(data) > BLOB_MAX_BYTES:
+        return None
+
+    digest = content_hash(data)
+    exists = get_connection().execute(
+        "SELECT 1 FROM page_blobs WHERE hash = ?", (digest,)
+    ).fetchone()
+    if exists:
+        return Blob(digest, None, len(data), None)
+
+    codec, payload = compress(data)
+    return Blob(digest, codec, len(data), payload)
+
+def get_blob(digest):
+    if not digest:
+        return None
+    row = get_connection().execute(
+        "SELECT codec, data FROM page_blobs WHERE hash = ?", (digest,)
+    ).fetchone()
+    if row is None:
+        return None
+    return decompress(row[0], row[1]).decode('utf-8')
+
+def load_source(extraction_id):
+    row = get_connection().execute(
+        "SELECT html_hash, text_hash FROM extractions WHERE id = ?", (extraction_id,)
+    ).fetchone()
+    if row is None or not (row[0] or row[1]):
+        return None
+    return {'html': get_blob(row[0]), 'text': get_blob(row[1])}
+
+def get_stats():
+    row = get_connection().execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM page_blobs"
+    ).fetchone()
+    return {
+        'enabled': BLOB_STORE_ENABLED,
+        'codec': BLOB_CODEC if BLOB_CODEC != 'zstd' or zstandard is not None else 'zlib',
+        'blobs': row[0],
+        'raw_bytes': row[1],
+        'stored_bytes': row[2],
+        'ratio': round(row[1] / row[2], 2) if row[2] else None
+    }
@@ -0,0 +1,184 @@
+import os
+import time
+from urllib.parse import urlsplit
+
+import metrics
+from database import get_connection, transaction
+
+BREAKER_ENABLED = os.getenv('BREAKER_ENABLED', '1') != '0'
+# Failures from one host within BREAKER_WINDOW seconds that open its circuit.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_WINDOW = float(os.getenv('BREAKER_WINDOW', '60'))
+# How long an open circuit rejects fetches; doubles each time a trial fetch
+# fails, up to BREAKER_MAX_OPEN_SECONDS.
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '60'))
+BREAKER_MAX_OPEN_SECONDS = float(os.getenv('BREAKER_MAX_OPEN_SECONDS', '900'))
+BREAKER_PROBE_SECONDS = float(os.getenv('BREAKER_PROBE_SECONDS', '30'))
+# A URL that just failed is not refetched for this long, whatever its host's
+# state; 0 disables the negative cache.
+NEGATIVE_CACHE_TTL = float(os.getenv('NEGATIVE_CACHE_TTL', '30'))
+
+# Statuses that say the host is down or refusing us. Others (e.g. a 404) only
+# go into the negative cache for that one URL.
+HOST_FAILURE_STATUSES = {403, 429}
+
+clock = time.time
+
+class CircuitOpenError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def host_of(url):
+    # Different ports are usually different servers.
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    return f"{host}:{port}" if port else host
+
+def _counts_against_host(status):
+    # None is a connection error or timeout.
+    return status is None or status >= 500 or status in HOST_FAILURE_STATUSES
+
+def check(url):
+    """Raise CircuitOpenError if url should not be fetched now. Returns whether
+    its host has failure state that a successful fetch should clear."""
+    if not BREAKER_ENABLED:
+        return False
+
+    now = clock()
+    conn = get_connection()
+    negative = conn.execute(
+        "SELECT error, expires_at FROM negative_cache WHERE url = ? AND expires_at > ?", (url, now)
+    ).fetchone()
+    if negative is not None:
+        metrics.inc('visionflow_fetch_rejected_total', reason='negative_cache')
+        retry_after = round(negative[1] - now, 1)
+        raise CircuitOpenError(
+            f"This URL failed moments ago ({negative[0]}); retry in {retry_after:.0f}s",
+            retry_after=retry_after
+        )
+
+    host = host_of(url)
+    row = conn.execute(
+        "SELECT state, open_until, failures, last_error FROM circuit_breakers WHERE host = ?", (host,)
+    ).fetchone()
+    if row is None:
+        return False
+
+    state, open_until, failures, last_error = row
+    if state != 'closed':
+        if now < open_until:
+            metrics.inc('visionflow_fetch_rejected_total', reason='circuit_open')
+            retry_after = round(open_until - now, 1)
+            raise CircuitOpenError(
+                f"{host} is failing ({failures} errors, last: {last_error}); "
+                f"not fetching it for another {retry_after:.0f}s",
+                retry_after=retry_after
+            )
+
+        # Cooldown over: exactly one request, across all workers, gets to
+        # try the host while the rest keep failing fast.
+        with transaction() as conn:
+            claimed = conn.execute('''
+                UPDATE circuit_breakers SET state = 'half_open', open_until = ?
+                WHERE host = ? AND state = ? AND open_until = ?
+            ''', (now + BREAKER_PROBE_SECONDS, host, state, open_until)).rowcount
+        if not claimed:
+            metrics.inc('visionflow_fetch_rejected_total', reason='circuit_open')
+            raise CircuitOpenError(
+                f"{host} is failing; a trial request is in progress, retry shortly",
+                retry_after=BREAKER_PROBE_SECONDS
+            )
+    return True
+
+def record_success(url):
+    with transaction() as conn:
+        conn.execute("DELETE FROM circuit_breakers WHERE host = ?", (host_of(url),))
+
+def record_failure(url, status, error):
+    if not BREAKER_ENABLED:
+        return
+
+    now = clock()
+    host = host_of(url)
+    error = str(error)[:300]
+    with transaction() as conn:
+        if NEGATIVE_CACHE_TTL > 0:
+            conn.execute('''
+                INSERT OR REPLACE INTO negative_cache (url, host, status, error, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (url, host, status, error, now + NEGATIVE_CACHE_TTL))
+            conn.execute("DELETE FROM negative_cache WHERE expires_at <= ?", (now,))
+
+        if not _counts_against_host(status):
+            return
+
+        row = conn.execute(
+            "SELECT state, failures, first_failure_at, open_until, trips FROM circuit_breakers WHERE host = ?",
+            (host,)
+        ).fetchone()
+        state, failures, first_failure_at, open_until, trips = row or ('closed', 0, now, 0, 0)
+
+        if state == 'closed' and now - first_failure_at > BREAKER_WINDOW:
+            failures, first_failure_at = 0, now
+        failures += 1
+
+        # A failed trial reopens the circuit for longer; requests that were
+        # already in flight when it opened do not extend it.
+        if state == 'half_open' or (state == 'closed' and failures >= BREAKER_FAILURE_THRESHOLD):
+            trips += 1
+            state = 'open'
+            open_until = now + min(BREAKER_OPEN_SECONDS * 2 ** (trips - 1), BREAKER_MAX_OPEN_SECONDS)
+            print(f"⚡ Circuit opened for {host} for {open_until - now:.0f}s after {failures} failures: {error}")
+
+        conn.execute('''
+            INSERT OR REPLACE INTO circuit_breakers
+                (host, state, failures, first_failure_at, open_until, trips, last_error, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (host, state, failures, first_failure_at, open_until, trips, error, now))
+
+def get_state():
+    now = clock()
+    conn = get_connection()
+    hosts = [
+        {
+            'host': row[0],
+            'state': row[1] if row[1] == 'closed' or row[4] > now else 'half_open',
+            'failures': row[2],
+            'trips': row[3],
+            'retry_after': round(max(0, row[4] - now), 1) if row[1] != 'closed' else None,
+            'last_error': row[5],
+            'updated_at': row[6]
+        }
+        for row in conn.execute('''
+            SELECT host, state, failures, trips, open_until, last_error, updated_at
+            FROM circuit_breakers
+            ORDER BY updated_at DESC
+        ''')
+    ]
+    urls = [
+        {
+            'url': row[0],
+            'status': row[1],
+            'error': row[2],
+            'retry_after': round(row[3] - now, 1)
+        }
+        for row in conn.execute('''
+            SELECT url, status, error, expires_at FROM negative_cache
+            WHERE expires_at > ?
+            ORDER BY expires_at DESC
+        ''', (now,))
+    ]
+    return {'hosts': hosts, 'urls': urls}
+
+def reset(host):
+    """Close a host's circuit and forget its failed URLs"""
+    host = host.lower()
+    with transaction() as conn:
+        hosts = conn.execute("DELETE FROM circuit_breakers WHERE host = ?", (host,)).rowcount
+        urls = conn.execute("DELETE FROM negative_cache WHERE host = ?", (host,)).rowcount
+    return hosts + urls > 0
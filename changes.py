@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from database import EXTRACTION_COLUMNS, extraction_to_dict, get_change_version, get_connection
+
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', '1.0'))
+CHANGES_MAX_WAIT = int(os.getenv('CHANGES_MAX_WAIT', '25'))
+CHANGES_BATCH_LIMIT = int(os.getenv('CHANGES_BATCH_LIMIT', '200'))
+STREAM_MAX_SECONDS = int(os.getenv('STREAM_MAX_SECONDS', '55'))
+STREAM_HEARTBEAT_SECONDS = int(os.getenv('STREAM_HEARTBEAT_SECONDS', '15'))
+STREAM_RETRY_MS = int(os.getenv('STREAM_RETRY_MS', '1000'))
+# Each /data/stream or waiting /data/changes client holds a gunicorn thread;
+# past this many per worker, streams are refused and long polls answer at
+# once, so /extract always has threads left. The async app (asgi.py) serves
+# both from its event loop and has no cap.
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', '4'))
+
+_stream_slots = threading.BoundedSemaphore(max(STREAM_MAX_CLIENTS, 1))
+
+def acquire_stream_slot():
+    if STREAM_MAX_CLIENTS <= 0:
+        return False
+    return _stream_slots.acquire(blocking=False)
+
+def release_stream_slot():
+    _stream_slots.release()
+
+def missed_changes(after_seq):
+    # Retention prunes the oldest change log entries; a client resuming from
+    # before them cannot catch up entry by entry and must reload /data.
+    oldest = get_connection().execute("SELECT MIN(seq) FROM extraction_changes").fetchone()[0]
+    return oldest is not None and after_seq < oldest - 1
+
+def get_changes(after_seq, limit=None):
+    # Several changes to the same row collapse into one entry carrying the
+    # row's current state, so clients only ever apply the latest version.
+    columns = ', '.join('e.' + column for column in EXTRACTION_COLUMNS.split(', '))
+    rows = get_connection().execute(f'''
+        SELECT c.seq, c.extraction_id, c.op, {columns}
+        FROM extraction_changes c
+        LEFT JOIN extractions e ON e.id = c.extraction_id
+        WHERE c.seq > ?
+        ORDER BY c.seq
+        LIMIT ?
+    ''', (after_seq, limit or CHANGES_BATCH_LIMIT)).fetchall()
+
+    latest = {}
+    for row in rows:
+        latest.pop(row[1], None)
+        latest[row[1]] = {
+            'seq': row[0],
+            'op': 'delete' if row[3] is None else row[2],
+            'id': row[1],
+            'data': None if row[3] is None else extraction_to_dict(tuple(row)[3:])
+        }
+
+    last_seq = rows[-1][0] if rows else after_seq
+    return list(latest.values()), last_seq
+
+def wait_for_changes(after_seq, timeout):
+    # The change log lives in the shared database file, so polling its newest
+    # sequence number sees commits from every worker process.
+    # Returns (changes, last_seq, reset); on a reset the client reloads /data
+    # and continues from last_seq.
+    if missed_changes(after_seq):
+        return [], get_change_version(), True
+    deadline = time.time() + max(0, timeout)
+    while True:
+        if get_change_version() > after_seq:
+            return (*get_changes(after_seq), False)
+        if time.time() >= deadline:
+            return [], after_seq, False
+        time.sleep(CHANGES_POLL_INTERVAL)
+
+async def wait_for_changes_async(after_seq, timeout):
+    if await asyncio.to_thread(missed_changes, after_seq):
+        return [], await asyncio.to_thread(get_change_version), True
+    deadline = time.time() + max(0, timeout)
+    while True:
+        if await asyncio.to_thread(get_change_version) > after_seq:
+            return (*await asyncio.to_thread(get_changes, after_seq), False)
+        if time.time() >= deadline:
+            return [], after_seq, False
+        await asyncio.sleep(CHANGES_POLL_INTERVAL)
+
+def _sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+def stream_changes(last_event_id=None):
+    # Each connection is closed after STREAM_MAX_SECONDS; EventSource then
+    # reconnects with Last-Event-ID and resumes without missing a change.
+    started = time.time()
+    last_beat = started
+    after_seq = last_event_id if last_event_id is not None else get_change_version()
+
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+    yield _sse('ready', {'last_event_id': after_seq}, after_seq)
+
+    while time.time() - started < STREAM_MAX_SECONDS:
+        if missed_changes(after_seq):
+            after_seq = get_change_version()
+            yield _sse('reset', {'last_event_id': after_seq}, after_seq)
+            last_beat = time.time()
+            continue
+
+        if get_change_version() > after_seq:
+            changes, after_seq = get_changes(after_seq)
+            for change in changes:
+                yield _sse(change['op'], change['data'] or {'id': change['id']}, change['seq'])
+            last_beat = time.time()
+            continue
+
+        if time.time() - last_beat >= STREAM_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            last_beat = time.time()
+        time.sleep(CHANGES_POLL_INTERVAL)
+
+async def stream_changes_async(last_event_id=None):
+    started = time.time()
+    last_beat = started
+    after_seq = last_event_id if last_event_id is not None else await asyncio.to_thread(get_change_version)
+
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+    yield _sse('ready', {'last_event_id': after_seq}, after_seq)
+
+    while time.time() - started < STREAM_MAX_SECONDS:
+        if await asyncio.to_thread(missed_changes, after_seq):
+            after_seq = await asyncio.to_thread(get_change_version)
+            yield _sse('reset', {'last_event_id': after_seq}, after_seq)
+            last_beat = time.time()
+            continue
+
+        if await asyncio.to_thread(get_change_version) > after_seq:
+            changes, after_seq = await asyncio.to_thread(get_changes, after_seq)
+            for change in changes:
+                yield _sse(change['op'], change['data'] or {'id': change['id']}, change['seq'])
+            last_beat = time.time()
+            continue
+
+        if time.time() - last_beat >= STREAM_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            last_beat = time.time()
+        await asyncio.sleep(CHANGES_POLL_INTERVAL)
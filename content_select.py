@@ -0,0 +1,110 @@
+import os
+import re
+
+import html_text
+
+CONTENT_SELECTION = os.getenv('CONTENT_SELECTION', '1') != '0'
+CONTENT_TOKEN_BUDGET = int(os.getenv('CONTENT_TOKEN_BUDGET', '1500'))
+CONTENT_SCAN_CHARS = int(os.getenv('CONTENT_SCAN_CHARS', '60000'))
+
+# Share of the budget reserved for the opening blocks, which is where the
+# product name and one-line description almost always live.
+LEAD_SHARE = 0.2
+CHARS_PER_TOKEN = 4
+
+_PRICING_TERMS = re.compile(
+    r'\b(pric\w*|plans?|per (month|year|user|seat)|billed|annual(ly)?|monthly|yearly|'
+    r'subscriptions?|free trial|free|enterprise|starter|basic|pro|premium|tiers?|cost|quote)\b',
+    re.IGNORECASE
+)
+_PRICE_AMOUNTS = re.compile(
+    r'[$€£¥]\s?\d|\d\s?(usd|eur|gbp)\b|/\s?(mo|month|yr|year|user|seat)\b',
+    re.IGNORECASE
+)
+_FEATURE_TERMS = re.compile(
+    r'\b(features?|integrat\w*|api|support|unlimited|includes?|analytics|security|sso|'
+    r'automat\w*|dashboards?|reports?|reporting|collaborat\w*|storage|workflows?|custom\w*)\b',
+    re.IGNORECASE
+)
+
+_KIND_WEIGHT = {'heading': 1.5, 'list': 1.3, 'table': 1.3, 'text': 1.0}
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def score_block(block):
+    pricing = len(_PRICING_TERMS.findall(block.text)) + 3 * len(_PRICE_AMOUNTS.findall(block.text))
+    features = len(_FEATURE_TERMS.findall(block.text))
+    return (2 * pricing + features) * _KIND_WEIGHT.get(block.kind, 1.0)
+
+def select_blocks(blocks, token_budget):
+    seen = set()
+    unique = []
+    for block in blocks:
+        if block.text not in seen:
+            seen.add(block.text)
+            unique.append(block)
+
+    if sum(estimate_tokens(block.text) for block in unique) <= token_budget:
+        return [block.text for block in unique]
+
+    # Each block inherits half of its section heading's relevance, so a plain
+    # paragraph under "Pricing" still outranks one under "Our story".
+    scores = {}
+    headings = {}
+    section = None
+    for block in unique:
+        score = score_block(block)
+        if block.kind == 'heading':
+            section = block
+        elif section is not None:
+            score += 0.5 * scores[section.position]
+            headings[block.position] = section
+        scores[block.position] = score
+
+    chosen = {}
+    remaining = token_budget
+
+    def take(block, limit):
+        nonlocal remaining
+        if block.position in chosen:
+            return True
+        cost = estimate_tokens(block.text)
+        if cost > limit:
+            if limit < 50:
+                return False
+            chosen[block.position] = block.text[:limit * CHARS_PER_TOKEN]
+            remaining -= limit
+            return True
+        chosen[block.position] = block.text
+        remaining -= cost
+        return True
+
+    lead_budget = int(token_budget * LEAD_SHARE)
+    for block in unique:
+        if lead_budget <= 0:
+            break
+        before = remaining
+        if not take(block, min(lead_budget, remaining)):
+            break
+        lead_budget -= before - remaining
+
+    ranked = sorted(
+        (block for block in unique if scores[block.position] > 0),
+        key=lambda block: scores[block.position] / estimate_tokens(block.text) ** 0.5,
+        reverse=True
+    )
+    for block in ranked:
+        if remaining <= 0:
+            break
+        heading = headings.get(block.position)
+        if heading is not None and heading.position not in chosen:
+            if estimate_tokens(heading.text) < remaining:
+                take(heading, remaining)
+        take(block, remaining)
+
+    return [chosen[position] for position in sorted(chosen)]
+
+def select_content(html, token_budget=None):
+    blocks = html_text.extract_blocks(html)
+    return '\n'.join(select_blocks(blocks, token_budget or CONTENT_TOKEN_BUDGET))
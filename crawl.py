@@ -0,0 +1,378 @@
+import gzip
+import html
+import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+from database import get_connection, transaction
+import content_select
+import extract
+import html_text
+import http_client
+from pipeline import HostLimiter, extract_page, normalize_url
+
+CRAWL_MAX_PAGES = int(os.getenv('CRAWL_MAX_PAGES', '5'))
+CRAWL_MAX_PAGES_LIMIT = int(os.getenv('CRAWL_MAX_PAGES_LIMIT', '25'))
+CRAWL_MAX_DEPTH = int(os.getenv('CRAWL_MAX_DEPTH', '2'))
+CRAWL_MAX_FETCHES = int(os.getenv('CRAWL_MAX_FETCHES', '30'))
+CRAWL_FRONTIER_WIDTH = int(os.getenv('CRAWL_FRONTIER_WIDTH', '8'))
+CRAWL_PER_HOST_LIMIT = int(os.getenv('CRAWL_PER_HOST_LIMIT', '2'))
+CRAWL_DELAY = float(os.getenv('CRAWL_DELAY', '1.0'))
+CRAWL_MAX_DELAY = float(os.getenv('CRAWL_MAX_DELAY', '10'))
+CRAWL_WORKERS = int(os.getenv('CRAWL_WORKERS', '4'))
+CRAWL_CACHE_TTL = int(os.getenv('CRAWL_CACHE_TTL', str(24 * 3600)))
+# robots.txt and sitemap fetches that failed with a network error, 429 or
+# 5xx are retried after this long instead of CRAWL_CACHE_TTL.
+CRAWL_ERROR_CACHE_TTL = int(os.getenv('CRAWL_ERROR_CACHE_TTL', '300'))
+CRAWL_SITEMAP_MAX_URLS = int(os.getenv('CRAWL_SITEMAP_MAX_URLS', '2000'))
+CRAWL_SITEMAP_MAX_FILES = int(os.getenv('CRAWL_SITEMAP_MAX_FILES', '5'))
+CRAWL_SITEMAP_MAX_BYTES = int(os.getenv('CRAWL_SITEMAP_MAX_BYTES', str(10 * 1024 * 1024)))
+CRAWL_USER_AGENT = os.getenv('CRAWL_USER_AGENT', 'VisionFlowBot')
+
+KEYWORD_WEIGHTS = {
+    'pricing': 6, 'prices': 5, 'price': 5, 'plans': 5, 'plan': 3, 'cost': 3, 'buy': 3, 'subscribe': 2,
+    'features': 4, 'feature': 3, 'product': 3, 'products': 3, 'platform': 2, 'solutions': 2,
+    'compare': 2, 'tour': 2, 'overview': 2, 'enterprise': 1, 'business': 1, 'teams': 1,
+    'integrations': 1, 'about': 1
+}
+NEGATIVE_WORDS = {
+    'blog', 'news', 'careers', 'jobs', 'legal', 'privacy', 'terms', 'cookie', 'cookies', 'login',
+    'signin', 'sign', 'logout', 'signup', 'register', 'account', 'cart', 'checkout', 'docs',
+    'documentation', 'help', 'support', 'status', 'press', 'events', 'webinar', 'podcast',
+    'author', 'tag', 'category', 'feed', 'rss', 'search', 'forum', 'community'
+}
+SKIP_EXTENSIONS = (
+    '.pdf', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico', '.zip', '.gz', '.mp4',
+    '.mp3', '.css', '.js', '.json', '.xml', '.txt', '.woff', '.woff2'
+)
+
+_WORD = re.compile(r'[a-z]+')
+_LOC = re.compile(r'<loc>\s*(.*?)\s*</loc>', re.IGNORECASE | re.DOTALL)
+
+class HostPacer:
+    # Spaces out request starts to each host by its politeness delay, across
+    # every crawl running in this process.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = {}
+
+    def wait(self, host, delay):
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next.get(host, 0.0))
+            self._next[host] = start + delay
+        if start > now:
+            time.sleep(start - now)
+
+_pacer = HostPacer()
+_limiter = HostLimiter(CRAWL_PER_HOST_LIMIT)
+_robots_lock = threading.Lock()
+_robots = {}
+
+def canonical_url(url):
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+
+def site_key(url):
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+def origin_of(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+def _keyword_score(words):
+    # The strongest keyword counts fully and the rest only a little, so a
+    # deep /pricing/enterprise page does not outrank /pricing itself.
+    weights = sorted((KEYWORD_WEIGHTS.get(word, 0) for word in words), reverse=True)
+    return weights[0] + 0.3 * sum(weights[1:]) if weights else 0
+
+def score_link(url, anchor='', depth=0):
+    # Path words count fully and anchor text at half weight; anything that
+    # looks like a blog, legal or account page is pushed below zero.
+    path = urlsplit(url).path.lower()
+    path_words = set(_WORD.findall(path))
+    anchor_words = set(_WORD.findall(anchor.lower()))
+
+    score = _keyword_score(path_words) + 0.5 * _keyword_score(anchor_words)
+    if (path_words | anchor_words) & NEGATIVE_WORDS:
+        score -= 5
+
+    segments = [segment for segment in path.split('/') if segment]
+    score -= 0.5 * max(0, len(segments) - 2) + depth
+    return score
+
+def _unreachable(status):
+    # Status 0 is a network error or an open circuit.
+    return status == 0 or status == 429 or status >= 500
+
+def _cache_ttl(status):
+    return CRAWL_ERROR_CACHE_TTL if _unreachable(status) else CRAWL_CACHE_TTL
+
+def _load_cached(url, kind):
+    row = get_connection().execute(
+        "SELECT status, body, fetched_at FROM crawl_cache WHERE url = ? AND kind = ?", (url, kind)
+    ).fetchone()
+    if row is not None and row[2] + _cache_ttl(row[0]) > time.time():
+        return row[0], row[1]
+    return None
+
+def _store_cached(url, kind, status, body):
+    with transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO crawl_cache (url, kind, status, body, fetched_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (url, kind, status, body, time.time()))
+
+def _get(url):
+    response = http_client.get_session().get(
+        url, headers={'User-Agent': CRAWL_USER_AGENT}, timeout=http_client.FETCH_TIMEOUT
+    )
+    # Raised so the circuit breaker counts it; other statuses are answers.
+    if _unreachable(response.status_code):
+        response.raise_for_status()
+    return response
+
+def _fetch_text(url):
+    # robots.txt and sitemaps are fetched as politely as pages: under the
+    # crawler's own User-Agent, paced and limited per host, and through the
+    # circuit breaker.
+    try:
+        with _limiter.get(url):
+            _pacer.wait(urlsplit(url).netloc.lower(), CRAWL_DELAY)
+            response = http_client.guarded(url, lambda: _get(url))
+    except requests.HTTPError as e:
+        return e.response.status_code, ''
+    body = response.content[:CRAWL_SITEMAP_MAX_BYTES]
+    if body[:2] == b'\x1f\x8b':
+        body = gzip.GzipFile(fileobj=io.BytesIO(body)).read(CRAWL_SITEMAP_MAX_BYTES)
+    return response.status_code, body.decode(response.encoding or 'utf-8', errors='replace')
+
+def get_robots(origin):
+    # Parsed rules are kept in memory; the raw file is cached in SQLite so
+    # other workers and later crawls do not refetch it.
+    now = time.time()
+    with _robots_lock:
+        entry = _robots.get(origin)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    url = origin + '/robots.txt'
+    cached = _load_cached(url, 'robots')
+    if cached is None:
+        try:
+            cached = _fetch_text(url)
+        except Exception:
+            cached = (0, '')
+        _store_cached(url, 'robots', *cached)
+    status, body = cached
+
+    # As in RFC 9309 and RobotFileParser.read(): an unreachable robots.txt
+    # disallows everything until it can be fetched again, a missing one
+    # allows everything.
+    parser = RobotFileParser(url)
+    if status in (401, 403) or _unreachable(status):
+        parser.disallow_all = True
+    elif 200 <= status < 300:
+        parser.parse(body.splitlines())
+    else:
+        parser.allow_all = True
+
+    with _robots_lock:
+        _robots[origin] = (parser, now + _cache_ttl(status))
+    return parser
+
+def parse_sitemap(body):
+    locs = [html.unescape(loc) for loc in _LOC.findall(body)[:CRAWL_SITEMAP_MAX_URLS]]
+    if '<sitemapindex' in body[:4096].lower():
+        return {'urls': [], 'sitemaps': locs}
+    return {'urls': locs, 'sitemaps': []}
+
+def get_sitemap_urls(origin, robots):
+    # Follows sitemap indexes, most promising child sitemaps first, up to
+    # CRAWL_SITEMAP_MAX_FILES files.
+    queue = robots.site_maps() or [origin + '/sitemap.xml']
+    seen = set()
+    found = []
+    while queue and len(seen) < CRAWL_SITEMAP_MAX_FILES and len(found) < CRAWL_SITEMAP_MAX_URLS:
+        url = queue.pop(0)
+        if url in seen or not robots.can_fetch(CRAWL_USER_AGENT, url):
+            continue
+        seen.add(url)
+
+        cached = _load_cached(url, 'sitemap')
+        if cached is None:
+            try:
+                status, body = _fetch_text(url)
+            except Exception:
+                status, body = 0, ''
+            entries = parse_sitemap(body) if 200 <= status < 300 else {'urls': [], 'sitemaps': []}
+            _store_cached(url, 'sitemap', status, json.dumps(entries))
+        else:
+            entries = json.loads(cached[1])
+
+        found.extend(entries['urls'])
+        queue = sorted(queue + entries['sitemaps'], key=lambda sitemap: -score_link(sitemap))
+    return found[:CRAWL_SITEMAP_MAX_URLS]
+
+def discover_links(page_url, html_content):
+    base, links = html_text.extract_links(html_content)
+    base_url = urljoin(page_url, base) if base else page_url
+    for href, anchor in links:
+        if not href or href.startswith(('#', 'mailto:', 'tel:', 'javascript:', 'data:')):
+            continue
+        url = canonical_url(urljoin(base_url, href))
+        if url.startswith(('http://', 'https://')) and not urlsplit(url).path.lower().endswith(SKIP_EXTENSIONS):
+            yield url, anchor
+
+class Crawl:
+    def __init__(self, url, max_pages=None, force_llm=False):
+        self.seed = canonical_url(normalize_url(url))
+        self.site = site_key(self.seed)
+        self.max_pages = max_pages or CRAWL_MAX_PAGES
+        self.force_llm = force_llm
+        self.candidates = {}
+        self.pages = {}
+        self.errors = {}
+        self.fetches = 0
+
+    def allowed(self, url):
+        return (
+            site_key(url) == self.site
+            and get_robots(origin_of(url)).can_fetch(CRAWL_USER_AGENT, url)
+        )
+
+    def add(self, url, depth, source, anchor=''):
+        if not self.allowed(url):
+            return
+        candidate = self.candidates.get(url)
+        if candidate is None:
+            candidate = self.candidates[url] = {
+                'url': url, 'depth': depth, 'source': source, 'anchor': anchor, 'score': None
+            }
+        elif depth < candidate['depth']:
+            candidate['depth'] = depth
+        if anchor and anchor not in candidate['anchor']:
+            candidate['anchor'] = (candidate['anchor'] + ' ' + anchor).strip()
+        candidate['score'] = score_link(url, candidate['anchor'], candidate['depth'])
+
+    def fetch(self, url):
+        robots = get_robots(origin_of(url))
+        delay = min(CRAWL_MAX_DELAY, robots.crawl_delay(CRAWL_USER_AGENT) or CRAWL_DELAY)
+        with _limiter.get(url):
+            _pacer.wait(urlsplit(url).netloc.lower(), delay)
+            return extract.fetch_page(
+                url,
+                max_chars=content_select.CONTENT_SCAN_CHARS if content_select.CONTENT_SELECTION else None,
+                headers={'User-Agent': CRAWL_USER_AGENT}
+            )
+
+    def fetch_all(self, urls):
+        urls = [url for url in urls if url not in self.pages and url not in self.errors]
+        self.fetches += len(urls)
+        with ThreadPoolExecutor(max_workers=max(1, min(CRAWL_PER_HOST_LIMIT, len(urls) or 1))) as executor:
+            futures = [(url, executor.submit(self.fetch, url)) for url in urls]
+            for url, future in futures:
+                try:
+                    self.pages[url] = future.result()
+                except Exception as e:
+                    self.errors[url] = str(e)
+        return [url for url in urls if url in self.pages]
+
+    def explore(self):
+        # Bounded BFS: each level only expands the best-scoring unvisited
+        # candidates, within an overall fetch budget.
+        origin = origin_of(self.seed)
+        robots = get_robots(origin)
+        self.add(self.seed, 0, 'seed')
+        for url in get_sitemap_urls(origin, robots):
+            self.add(canonical_url(url), 1, 'sitemap')
+
+        frontier = [self.seed] if self.seed in self.candidates else []
+        for depth in range(CRAWL_MAX_DEPTH + 1):
+            budget = CRAWL_MAX_FETCHES - self.fetches
+            if not frontier or budget <= 0:
+                break
+            for url in self.fetch_all(frontier[:budget]):
+                if depth < CRAWL_MAX_DEPTH:
+                    for link, anchor in discover_links(url, self.pages[url].html):
+                        self.add(link, depth + 1, 'link', anchor)
+
+            frontier = sorted(
+                (
+                    candidate for candidate in self.candidates.values()
+                    if candidate['depth'] == depth + 1 and candidate['score'] > 0
+                    and candidate['url'] not in self.pages and candidate['url'] not in self.errors
+                ),
+                key=lambda candidate: -candidate['score']
+            )[:CRAWL_FRONTIER_WIDTH]
+            frontier = [candidate['url'] for candidate in frontier]
+
+    def select(self):
+        # The page the user asked for always comes first.
+        ranked = sorted(
+            (
+                candidate for candidate in self.candidates.values()
+                if candidate['url'] != self.seed and candidate['score'] > 0
+            ),
+            key=lambda candidate: (-candidate['score'], candidate['depth'], candidate['url'])
+        )
+        selected = [self.candidates[self.seed]] if self.seed in self.candidates else []
+        return (selected + ranked)[:self.max_pages]
+
+    def run(self):
+        if not self.allowed(self.seed):
+            return {
+                "success": False,
+                "error": "robots.txt does not allow crawling this URL"
+            }
+
+        self.explore()
+        selected = self.select()
+        self.fetch_all([candidate['url'] for candidate in selected])
+
+        def work(candidate):
+            url = candidate['url']
+            entry = {
+                "url": url,
+                "score": round(candidate['score'], 2),
+                "depth": candidate['depth'],
+                "source": candidate['source']
+            }
+            if url not in self.pages:
+                entry.update(success=False, error=self.errors.get(url, "Page was not fetched"))
+                return entry
+
+            result = extract_page(url, self.pages[url], force_llm=self.force_llm)
+            entry.update(success=result['success'], extraction_id=result['extraction_id'])
+            if result['success']:
+                entry.update(data=result['data'], tier=result['tier'])
+            else:
+                entry['error'] = result['error']
+            return entry
+
+        with ThreadPoolExecutor(max_workers=max(1, min(CRAWL_WORKERS, len(selected) or 1))) as executor:
+            results = list(executor.map(work, selected))
+
+        succeeded = sum(1 for entry in results if entry['success'])
+        return {
+            "success": True,
+            "url": self.seed,
+            "pages": results,
+            "count": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "discovered": len(self.candidates),
+            "fetched": len(self.pages)
+        }
+
+def crawl_site(url, max_pages=None, force_llm=False):
+    return Crawl(url, max_pages=max_pages, force_llm=force_llm).run()
@@ -1,20 +1,112 @@
+import os
+import queue
 import sqlite3
 import datetime
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 from flask import g
 
+from facets import feature_key, parse_prices, split_features
+
 DATABASE = 'extractions.db'
 
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '30000'))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+DB_WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', '0') == '1'
+DB_WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', '100'))
+DB_WRITE_FLUSH_INTERVAL = float(os.getenv('DB_WRITE_FLUSH_INTERVAL', '0.05'))
+
+# Bump whenever the schema in init_db() changes. The database records the
+# version it was migrated to (PRAGMA user_version), so the DDL below runs once
+# per deployment instead of in every worker at startup.
+SCHEMA_VERSION = 8
+
+_local = threading.local()
+
+def connect():
+    conn = sqlite3.connect(DATABASE, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    return conn
+
+def get_connection():
+    # One autocommit connection per thread, reused for the life of the thread.
+    # The owning pid is recorded so a connection inherited across fork() is
+    # never shared between processes.
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        conn = _local.conn = connect()
+        _local.pid = os.getpid()
+    return conn
+
+@contextmanager
+def transaction(immediate=True):
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        db = g._database = get_connection()
     return db
 
+def add_column_if_missing(cursor, table, column, definition):
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
 def init_db():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+    conn = sqlite3.connect(DATABASE, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    try:
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return False
+        
+        # Only possible before the first table is created; databases created
+        # without it are converted by scripts/enable_incremental_vacuum.py.
+        if not conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Workers starting together queue on the write lock; whichever gets it
+        # first migrates and the rest find the new version and skip the DDL.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migrated = get_schema_version(conn) < SCHEMA_VERSION
+            if migrated:
+                migrate(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
     
+    if migrated:
+        print(f"Database migrated to schema version {SCHEMA_VERSION}")
+    return migrated
+
+def migrate(cursor):
+    # Every statement is idempotent, so a database created before schema
+    # versioning (user_version 0) is brought up to date in place.
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS extractions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -25,21 +117,440 @@ def init_db():
             pricing TEXT,
             raw_html TEXT,
             extracted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status TEXT DEFAULT 'success'
+            status TEXT DEFAULT 'success',
+            tier TEXT
         )
     ''')
     
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully!")
-
-def add_extraction(url, extracted_data, raw_html="", status="success"):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+    add_column_if_missing(cursor, 'extractions', 'tier', 'TEXT')
+    add_column_if_missing(cursor, 'extractions', 'html_hash', 'TEXT')
+    add_column_if_missing(cursor, 'extractions', 'text_hash', 'TEXT')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_extractions_extracted_at_id ON extractions (extracted_at, id)
+    ''')
     
     cursor.execute('''
-        INSERT INTO extractions (url, name, description, features, pricing, raw_html, status)
+        CREATE INDEX IF NOT EXISTS idx_extractions_url ON extractions (url)
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS extraction_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            extraction_id INTEGER NOT NULL,
+            op TEXT NOT NULL
+        )
+    ''')
+    
+    for op, event in (('insert', 'INSERT'), ('update', 'UPDATE'), ('delete', 'DELETE')):
+        row = 'OLD' if op == 'delete' else 'NEW'
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_extractions_{op}_change AFTER {event} ON extractions
+            BEGIN
+                INSERT INTO extraction_changes (extraction_id, op) VALUES ({row}.id, '{op}');
+            END
+        ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS extraction_leases (
+            key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limiter (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            concurrency REAL NOT NULL,
+            cooldown_until REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limiter_slots (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            result TEXT,
+            error TEXT,
+            extraction_id INTEGER,
+            attempts INTEGER DEFAULT 0,
+            force_llm INTEGER DEFAULT 0,
+            lease_expires REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    
+    add_column_if_missing(cursor, 'jobs', 'force_llm', 'INTEGER DEFAULT 0')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed_at ON llm_cache (accessed_at)
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    # Bodies are stored compressed and last in the row, so summing
+    # stored_bytes for the size cap never reads them. The table is only a
+    # cache: one from before compression is dropped rather than converted.
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(page_cache)")]
+    if columns and 'codec' not in columns:
+        cursor.execute("DROP TABLE page_cache")
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS page_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            encoding TEXT,
+            codec TEXT NOT NULL,
+            stored_bytes INTEGER NOT NULL,
+            truncated INTEGER NOT NULL DEFAULT 0,
+            fetched_at REAL NOT NULL,
+            body BLOB NOT NULL
+        )
+    ''')
+    
+    # A streamed read that stopped early stores the prefix it read.
+    add_column_if_missing(cursor, 'page_cache', 'truncated', 'INTEGER NOT NULL DEFAULT 0')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_page_cache_fetched_at ON page_cache (fetched_at, stored_bytes)
+    ''')
+    
+    # Fetched HTML and cleaned text, compressed and keyed by the SHA-256 of
+    # the uncompressed bytes, so identical pages are stored once and the
+    # extractions table stays narrow.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS page_blobs (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    
+    # robots.txt bodies and parsed sitemap URL lists for crawl mode.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_cache (
+            url TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            body TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+    
+    # Checkpoints for scripts/backfill.py: rows are re-extracted in id order,
+    # so last_id is enough to resume an interrupted run.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_runs (
+            id TEXT PRIMARY KEY,
+            filters TEXT NOT NULL,
+            max_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    
+    # Rows a backfill run could not re-extract; the checkpoint moves past
+    # them, and the next run of the same command retries them first.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_failures (
+            run_id TEXT NOT NULL,
+            extraction_id INTEGER NOT NULL,
+            error TEXT,
+            PRIMARY KEY (run_id, extraction_id)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metrics_snapshots (
+            instance TEXT PRIMARY KEY,
+            snapshot TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    
+    # Full-text index over the extracted fields for /search. It stores no
+    # text of its own (content='extractions'); triggers keep it in step with
+    # every insert, update and delete.
+    fts_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'extractions_fts'"
+    ).fetchone()
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS extractions_fts USING fts5(
+            name, description, features, pricing,
+            content='extractions', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_extractions_fts_insert AFTER INSERT ON extractions
+        BEGIN
+            INSERT INTO extractions_fts (rowid, name, description, features, pricing)
+            VALUES (NEW.id, NEW.name, NEW.description, NEW.features, NEW.pricing);
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_extractions_fts_delete AFTER DELETE ON extractions
+        BEGIN
+            INSERT INTO extractions_fts (extractions_fts, rowid, name, description, features, pricing)
+            VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.features, OLD.pricing);
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_extractions_fts_update
+        AFTER UPDATE OF name, description, features, pricing ON extractions
+        BEGIN
+            INSERT INTO extractions_fts (extractions_fts, rowid, name, description, features, pricing)
+            VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.features, OLD.pricing);
+            INSERT INTO extractions_fts (rowid, name, description, features, pricing)
+            VALUES (NEW.id, NEW.name, NEW.description, NEW.features, NEW.pricing);
+        END
+    ''')
+    
+    # Rows stored before the index existed.
+    if not fts_exists:
+        cursor.execute("INSERT INTO extractions_fts (extractions_fts) VALUES ('rebuild')")
+    
+    # Individual features and parsed price points of each extraction, so
+    # "has feature X" and "costs under N" are index lookups rather than
+    # string matching over every row. Written with the extraction itself.
+    facets_exist = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'extraction_features'"
+    ).fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS extraction_features (
+            extraction_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            feature TEXT NOT NULL,
+            feature_key TEXT NOT NULL,
+            PRIMARY KEY (extraction_id, position)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_extraction_features_key ON extraction_features (feature_key, extraction_id)
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS extraction_prices (
+            extraction_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            tier TEXT,
+            amount REAL NOT NULL,
+            currency TEXT,
+            period TEXT,
+            raw TEXT NOT NULL,
+            PRIMARY KEY (extraction_id, position)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_extraction_prices_amount ON extraction_prices (currency, period, amount)
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_extractions_facets_delete AFTER DELETE ON extractions
+        BEGIN
+            DELETE FROM extraction_features WHERE extraction_id = OLD.id;
+            DELETE FROM extraction_prices WHERE extraction_id = OLD.id;
+        END
+    ''')
+    
+    if not facets_exist:
+        rows = cursor.execute("SELECT id, features, pricing FROM extractions").fetchall()
+        for extraction_id, features, pricing in rows:
+            _insert_facets(cursor, extraction_id, {'features': features, 'pricing': pricing})
+    
+    # The newest successful extraction of each URL, for /data?latest=1 and so
+    # retention can tell superseded rows apart. Triggers keep it current
+    # however rows are written, updated or pruned.
+    latest_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'latest_extractions'"
+    ).fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS latest_extractions (
+            url TEXT PRIMARY KEY,
+            extraction_id INTEGER NOT NULL,
+            extracted_at TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_latest_extractions_extracted_at ON latest_extractions (extracted_at, extraction_id)
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_latest_extractions_extraction_id ON latest_extractions (extraction_id)
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_extractions_latest_insert AFTER INSERT ON extractions
+        WHEN NEW.status = 'success'
+        BEGIN
+            INSERT INTO latest_extractions (url, extraction_id, extracted_at)
+            VALUES (NEW.url, NEW.id, NEW.extracted_at)
+            ON CONFLICT (url) DO UPDATE SET
+                extraction_id = excluded.extraction_id, extracted_at = excluded.extracted_at
+            WHERE excluded.extraction_id > latest_extractions.extraction_id;
+        END
+    ''')
+    
+    # An update (e.g. a backfill turning a failed row into a success) or the
+    # deletion of the current latest row re-selects the newest success.
+    for op, event, row, condition in (
+        ('update', 'UPDATE OF status', 'NEW', ''),
+        ('delete', 'DELETE', 'OLD',
+         "WHEN EXISTS (SELECT 1 FROM latest_extractions WHERE extraction_id = OLD.id)")
+    ):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_extractions_latest_{op} AFTER {event} ON extractions
+            {condition}
+            BEGIN
+                DELETE FROM latest_extractions WHERE url = {row}.url;
+                INSERT INTO latest_extractions (url, extraction_id, extracted_at)
+                SELECT url, id, extracted_at FROM extractions
+                WHERE url = {row}.url AND status = 'success'
+                ORDER BY id DESC
+                LIMIT 1;
+            END
+        ''')
+    
+    if not latest_exists:
+        cursor.execute('''
+            INSERT INTO latest_extractions (url, extraction_id, extracted_at)
+            SELECT e.url, e.id, e.extracted_at
+            FROM extractions e
+            JOIN (
+                SELECT MAX(id) AS id FROM extractions WHERE status = 'success' GROUP BY url
+            ) newest ON newest.id = e.id
+        ''')
+    
+    # Lets retention find page blobs no longer referenced by any row.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_extractions_html_hash ON extractions (html_hash)
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_extractions_text_hash ON extractions (text_hash)
+    ''')
+    
+    # When each periodic maintenance task last ran, shared by all workers.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance (
+            name TEXT PRIMARY KEY,
+            ran_at REAL NOT NULL
+        )
+    ''')
+    
+    # Per-host circuit breaker and recently failed URLs (breaker.py), shared
+    # so every worker stops fetching a failing site at once.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS circuit_breakers (
+            host TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            failures INTEGER NOT NULL,
+            first_failure_at REAL NOT NULL,
+            open_until REAL NOT NULL,
+            trips INTEGER NOT NULL,
+            last_error TEXT,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS negative_cache (
+            url TEXT PRIMARY KEY,
+            host TEXT NOT NULL,
+            status INTEGER,
+            error TEXT,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_negative_cache_expires_at ON negative_cache (expires_at)
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_negative_cache_host ON negative_cache (host)
+    ''')
+
+def _insert_blob(conn, blob):
+    # A blob prepared without data was already stored when it was hashed.
+    if blob is None:
+        return None
+    if blob.data is not None:
+        conn.execute('''
+            INSERT OR IGNORE INTO page_blobs (hash, codec, size, data, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (blob.hash, blob.codec, blob.size, blob.data, datetime.datetime.now().timestamp()))
+    return blob.hash
+
+def _insert_facets(conn, extraction_id, extracted_data):
+    conn.execute("DELETE FROM extraction_features WHERE extraction_id = ?", (extraction_id,))
+    conn.execute("DELETE FROM extraction_prices WHERE extraction_id = ?", (extraction_id,))
+    conn.executemany('''
+        INSERT INTO extraction_features (extraction_id, position, feature, feature_key) VALUES (?, ?, ?, ?)
+    ''', [
+        (extraction_id, position, feature, feature_key(feature))
+        for position, feature in enumerate(split_features(extracted_data.get('features')))
+    ])
+    conn.executemany('''
+        INSERT INTO extraction_prices (extraction_id, position, tier, amount, currency, period, raw)
         VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (extraction_id, position, point.tier, point.amount, point.currency, point.period, point.raw)
+        for position, point in enumerate(parse_prices(extracted_data.get('pricing')))
+    ])
+
+def _insert_extraction(conn, url, extracted_data, raw_html, status, tier, html_blob=None, text_blob=None):
+    cursor = conn.execute('''
+        INSERT INTO extractions (url, name, description, features, pricing, raw_html, status, tier, html_hash, text_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
         url,
         extracted_data.get('name', ''),
@@ -47,29 +558,95 @@ def add_extraction(url, extracted_data, raw_html="", status="success"):
         extracted_data.get('features', ''),
         extracted_data.get('pricing', ''),
         raw_html,
-        status
+        status,
+        tier,
+        _insert_blob(conn, html_blob),
+        _insert_blob(conn, text_blob)
     ))
-    
-    conn.commit()
-    extraction_id = cursor.lastrowid
-    conn.close()
-    return extraction_id
+    _insert_facets(conn, cursor.lastrowid, extracted_data)
+    return cursor.lastrowid
 
-def get_recent_extractions(limit=50):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, url, name, description, features, pricing, extracted_at, status
-        FROM extractions
-        ORDER BY extracted_at DESC
-        LIMIT ?
-    ''', (limit,))
-    
-    extractions = cursor.fetchall()
-    conn.close()
+def update_extraction(conn, extraction_id, extracted_data, status, tier, html_blob=None, text_blob=None):
+    # Blob references are only replaced when a new page was fetched.
+    conn.execute('''
+        UPDATE extractions
+        SET name = ?, description = ?, features = ?, pricing = ?, status = ?, tier = ?,
+            html_hash = COALESCE(?, html_hash), text_hash = COALESCE(?, text_hash)
+        WHERE id = ?
+    ''', (
+        extracted_data.get('name', ''),
+        extracted_data.get('description', ''),
+        extracted_data.get('features', ''),
+        extracted_data.get('pricing', ''),
+        status,
+        tier,
+        _insert_blob(conn, html_blob),
+        _insert_blob(conn, text_blob),
+        extraction_id
+    ))
+    _insert_facets(conn, extraction_id, extracted_data)
+
+def add_extraction(url, extracted_data, raw_html="", status="success", tier=None, html_blob=None, text_blob=None):
+    if DB_WRITE_BEHIND:
+        return queue_extraction(url, extracted_data, raw_html, status, tier, html_blob, text_blob).result()
     
-    return [{
+    with transaction() as conn:
+        return _insert_extraction(conn, url, extracted_data, raw_html, status, tier, html_blob, text_blob)
+
+class WriteBehindBuffer:
+    # Concurrent add_extraction calls are handed to a single writer thread,
+    # which commits whatever has queued up in one transaction (group commit)
+    # instead of paying for a write lock and WAL sync per row.
+    def __init__(self, batch_size=DB_WRITE_BATCH_SIZE, flush_interval=DB_WRITE_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def submit(self, args):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((args, future))
+        return future
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="db-write-behind", daemon=True).start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            with transaction() as conn:
+                ids = [_insert_extraction(conn, *args) for args, _ in batch]
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), extraction_id in zip(batch, ids):
+            future.set_result(extraction_id)
+
+_write_buffer = WriteBehindBuffer()
+
+def queue_extraction(url, extracted_data, raw_html="", status="success", tier=None, html_blob=None, text_blob=None):
+    return _write_buffer.submit((url, extracted_data, raw_html, status, tier, html_blob, text_blob))
+
+EXTRACTION_COLUMNS = 'id, url, name, description, features, pricing, extracted_at, status, tier'
+
+def extraction_to_dict(row):
+    return {
         'id': row[0],
         'url': row[1],
         'name': row[2],
@@ -77,10 +654,204 @@ def get_recent_extractions(limit=50):
         'features': row[4],
         'pricing': row[5],
         'extracted_at': row[6],
-        'status': row[7]
-    } for row in extractions]
+        'status': row[7],
+        'tier': row[8]
+    }
+
+def get_change_version():
+    row = get_connection().execute("SELECT MAX(seq) FROM extraction_changes").fetchone()
+    return row[0] or 0
+
+def get_data_version():
+    # Every insert, update and delete on extractions appends to the change
+    # log, so the newest id plus the newest change identifies the contents.
+    row = get_connection().execute('''
+        SELECT (SELECT MAX(id) FROM extractions), (SELECT MAX(seq) FROM extraction_changes)
+    ''').fetchone()
+    return f"{row[0] or 0}.{row[1] or 0}"
+
+def get_recent_extractions(limit=50, before_id=None):
+    conn = get_connection()
+    
+    cursor_row = None
+    if before_id is not None:
+        cursor_row = conn.execute(
+            "SELECT extracted_at, id FROM extractions WHERE id = ?", (before_id,)
+        ).fetchone()
+    
+    if cursor_row is not None:
+        extractions = conn.execute('''
+            SELECT id, url, name, description, features, pricing, extracted_at, status, tier
+            FROM extractions
+            WHERE (extracted_at, id) < (?, ?)
+            ORDER BY extracted_at DESC, id DESC
+            LIMIT ?
+        ''', (cursor_row[0], cursor_row[1], limit)).fetchall()
+    elif before_id is not None:
+        extractions = conn.execute('''
+            SELECT id, url, name, description, features, pricing, extracted_at, status, tier
+            FROM extractions
+            WHERE id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (before_id, limit)).fetchall()
+    else:
+        extractions = conn.execute('''
+            SELECT id, url, name, description, features, pricing, extracted_at, status, tier
+            FROM extractions
+            ORDER BY extracted_at DESC, id DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    
+    return [extraction_to_dict(row) for row in extractions]
+
+def get_latest_extractions(limit=50, before_id=None):
+    # The newest successful extraction of each URL, paged like
+    # get_recent_extractions but read from the much smaller latest table.
+    conn = get_connection()
+    columns = ', '.join('e.' + column for column in EXTRACTION_COLUMNS.split(', '))
+    
+    cursor_row = None
+    if before_id is not None:
+        cursor_row = conn.execute(
+            "SELECT extracted_at, extraction_id FROM latest_extractions WHERE extraction_id = ?", (before_id,)
+        ).fetchone()
+    
+    where = ""
+    order = "l.extracted_at DESC, l.extraction_id DESC"
+    params = ()
+    if cursor_row is not None:
+        where = "WHERE (l.extracted_at, l.extraction_id) < (?, ?)"
+        params = (cursor_row[0], cursor_row[1])
+    elif before_id is not None:
+        where = "WHERE l.extraction_id < ?"
+        order = "l.extraction_id DESC"
+        params = (before_id,)
+    
+    extractions = conn.execute(f'''
+        SELECT {columns}
+        FROM latest_extractions l
+        JOIN extractions e ON e.id = l.extraction_id
+        {where}
+        ORDER BY {order}
+        LIMIT ?
+    ''', params + (limit,)).fetchall()
+    
+    return [extraction_to_dict(row) for row in extractions]
+
+def get_extraction(extraction_id):
+    row = get_connection().execute(
+        f"SELECT {EXTRACTION_COLUMNS} FROM extractions WHERE id = ?", (extraction_id,)
+    ).fetchone()
+    return extraction_to_dict(row) if row else None
+
+def get_facets(extraction_ids):
+    conn = get_connection()
+    placeholders = ', '.join('?' * len(extraction_ids))
+    facets = {extraction_id: {'features': [], 'prices': []} for extraction_id in extraction_ids}
+    for row in conn.execute(f'''
+        SELECT extraction_id, feature FROM extraction_features
+        WHERE extraction_id IN ({placeholders})
+        ORDER BY extraction_id, position
+    ''', extraction_ids):
+        facets[row[0]]['features'].append(row[1])
+    for row in conn.execute(f'''
+        SELECT extraction_id, tier, amount, currency, period FROM extraction_prices
+        WHERE extraction_id IN ({placeholders})
+        ORDER BY extraction_id, position
+    ''', extraction_ids):
+        facets[row[0]]['prices'].append({
+            'tier': row[1],
+            'amount': row[2],
+            'currency': row[3],
+            'period': row[4]
+        })
+    return facets
+
+def find_extractions(feature=None, min_price=None, max_price=None, currency=None, period=None, limit=50, offset=0):
+    clauses = []
+    params = []
+    if feature:
+        clauses.append("e.id IN (SELECT extraction_id FROM extraction_features WHERE feature_key = ?)")
+        params.append(feature_key(feature))
+    
+    # All price conditions apply to the same price point, so "under 20 USD a
+    # month" does not match a product with a $10/year and a $200/month plan.
+    price_clauses = []
+    for condition, value in (
+        ("amount >= ?", min_price),
+        ("amount <= ?", max_price),
+        ("currency = ?", currency.upper() if currency else None),
+        ("period = ?", period)
+    ):
+        if value is not None:
+            price_clauses.append(condition)
+            params.append(value)
+    if price_clauses:
+        clauses.append(
+            f"e.id IN (SELECT extraction_id FROM extraction_prices WHERE {' AND '.join(price_clauses)})"
+        )
+    
+    columns = ', '.join('e.' + column for column in EXTRACTION_COLUMNS.split(', '))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = get_connection().execute(f'''
+        SELECT {columns} FROM extractions e
+        {where}
+        ORDER BY e.id DESC
+        LIMIT ? OFFSET ?
+    ''', params + [limit, offset]).fetchall()
+    
+    extractions = [extraction_to_dict(row) for row in rows]
+    facets = get_facets([extraction['id'] for extraction in extractions])
+    for extraction in extractions:
+        extraction.update(facets[extraction['id']])
+    return extractions
+
+def get_feature_counts(prefix=None, limit=50):
+    params = []
+    where = ''
+    if prefix:
+        # A range on feature_key rather than LIKE, so the index is used.
+        where = "WHERE feature_key >= ? AND feature_key < ?"
+        key = feature_key(prefix)
+        params = [key, key + '\uffff']
+    rows = get_connection().execute(f'''
+        SELECT MIN(feature), feature_key, COUNT(DISTINCT extraction_id) AS extractions
+        FROM extraction_features
+        {where}
+        GROUP BY feature_key
+        ORDER BY extractions DESC, feature_key
+        LIMIT ?
+    ''', params + [limit]).fetchall()
+    return [{'feature': row[0], 'key': row[1], 'count': row[2]} for row in rows]
+
+def get_price_summary(feature=None):
+    params = []
+    where = ''
+    if feature:
+        where = "WHERE extraction_id IN (SELECT extraction_id FROM extraction_features WHERE feature_key = ?)"
+        params.append(feature_key(feature))
+    rows = get_connection().execute(f'''
+        SELECT currency, period, COUNT(*), COUNT(DISTINCT extraction_id), MIN(amount), MAX(amount), AVG(amount)
+        FROM extraction_prices
+        {where}
+        GROUP BY currency, period
+        ORDER BY COUNT(*) DESC
+    ''', params).fetchall()
+    return [
+        {
+            'currency': row[0],
+            'period': row[1],
+            'price_points': row[2],
+            'extractions': row[3],
+            'min': row[4],
+            'max': row[5],
+            'avg': round(row[6], 2)
+        }
+        for row in rows
+    ]
 
 def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
\ No newline at end of file
+    # The connection belongs to the thread, not the request; keep it open so
+    # the next request served by this thread reuses it.
+    g.pop('_database', None)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+import os
+
+from database import EXTRACTION_COLUMNS, connect, extraction_to_dict
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '500'))
+
+def export_query(since=None, until=None, status=None, url_prefix=None):
+    clauses = []
+    params = []
+    if since:
+        clauses.append("extracted_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("extracted_at < ?")
+        params.append(until)
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if url_prefix:
+        # substr() rather than a range on url keeps the planner walking the
+        # (extracted_at, id) index, so rows come out in order with no sort
+        # step buffering the whole result.
+        clauses.append("substr(url, 1, ?) = ?")
+        params.extend([len(url_prefix), url_prefix])
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    return f'''
+        SELECT {EXTRACTION_COLUMNS}
+        FROM extractions
+        {where}
+        ORDER BY extracted_at, id
+    ''', params
+
+def iter_extractions(filters):
+    # A dedicated connection: the export holds one read snapshot open for as
+    # long as the client keeps downloading, and fetchmany() keeps at most
+    # EXPORT_FETCH_SIZE rows in memory whatever the size of the table.
+    conn = connect()
+    try:
+        cursor = conn.execute(*export_query(**filters))
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            yield [extraction_to_dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def stream_ndjson(filters):
+    for batch in iter_extractions(filters):
+        yield ''.join(json.dumps(row) + '\n' for row in batch)
+
+def stream_csv(filters):
+    fields = EXTRACTION_COLUMNS.split(', ')
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for batch in iter_extractions(filters):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def stream_export(export_format, filters):
+    if export_format == 'csv':
+        return stream_csv(filters)
+    return stream_ndjson(filters)
@@ -1,45 +1,110 @@
 import requests
-from bs4 import BeautifulSoup
+import asyncio
 import json
 import os
+import re
+import threading
+import time
+from collections import namedtuple
 from dotenv import load_dotenv
-import google.generativeai as genai
+import breaker
+import content_select
+import html_text
+import http_client
+import llm_cache
+import metrics
+import ratelimit
+import structured
 
 load_dotenv()
 
+# Bump whenever the prompt or parsing below changes so cached results from the
+# previous version are not served for the new one.
+PROMPT_VERSION = '1'
+
+MAX_CONTENT_CHARS = int(os.getenv('MAX_CONTENT_CHARS', '8000'))
+FETCH_STREAMING = os.getenv('FETCH_STREAMING', '1') != '0'
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', str(2 * 1024 * 1024)))
+FORCE_LLM = os.getenv('FORCE_LLM', '0') == '1'
+
+# Pages whose prompt content fits under LLM_BATCH_MAX_PAGE_CHARS are sent to
+# the model LLM_BATCH_SIZE at a time when extracting in bulk; 1 disables it.
+LLM_BATCH_SIZE = int(os.getenv('LLM_BATCH_SIZE', '1'))
+LLM_BATCH_MAX_PAGE_CHARS = int(os.getenv('LLM_BATCH_MAX_PAGE_CHARS', '3000'))
+LLM_BATCH_MAX_CHARS = int(os.getenv('LLM_BATCH_MAX_CHARS', '24000'))
+
 api_key = os.getenv('GOOGLE_AI_API_KEY')
-if api_key:
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-flash-latest')
-else:
-    model = None
 
-def fetch_webpage_content(url):
+# Importing the Gemini SDK is most of a cold start, so the client is built on
+# the first model call. Assigning `extract.model` (tests, the benchmark)
+# still replaces it.
+model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global model
+    if model is None and api_key:
+        with _model_lock:
+            if model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                model = genai.GenerativeModel('gemini-flash-latest')
+    return model
+
+Page = namedtuple('Page', ['html', 'text'])
+
+def fetch_page(url, streaming=None, max_chars=None, headers=None):
+    max_chars = max_chars or MAX_CONTENT_CHARS
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        }
-        response = requests.get(url, headers=headers, timeout=15, verify=True)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        for script in soup(["script", "style", "nav", "footer", "header"]):
-            script.decompose()
+        if FETCH_STREAMING if streaming is None else streaming:
+            started = time.perf_counter()
+            stream = http_client.open_stream(url, headers=headers)
+            received = []
+            waited = [time.perf_counter() - started]
+            
+            # Reading and tokenizing are interleaved, so time blocked on the
+            # network is counted as fetch and the remainder as parse.
+            def chunks():
+                source = stream.iter_chunks(FETCH_MAX_BYTES)
+                try:
+                    while True:
+                        read_started = time.perf_counter()
+                        chunk = next(source, None)
+                        waited[0] += time.perf_counter() - read_started
+                        if chunk is None:
+                            break
+                        received.append(chunk)
+                        yield chunk
+                finally:
+                    source.close()
+            
+            text_content = html_text.extract_text_from_chunks(chunks(), stream.encoding, max_chars)
+            html = html_text.decode_html(b''.join(received), stream.encoding)
+            metrics.observe('visionflow_stage_duration_seconds', waited[0], stage='fetch')
+            metrics.observe(
+                'visionflow_stage_duration_seconds', time.perf_counter() - started - waited[0], stage='parse'
+            )
+            return Page(html, text_content)
         
-        text_content = soup.get_text()
+        with metrics.timer('fetch'):
+            page = http_client.fetch(url, headers=headers)
         
-        lines = (line.strip() for line in text_content.splitlines())
-        text_content = ' '.join(line for line in lines if line)
+        with metrics.timer('parse'):
+            # Only the non-streaming path uses BeautifulSoup; import it here
+            # so workers that never take it do not pay for it at startup.
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(page.content, 'html.parser', from_encoding=page.encoding)
+            html = html_text.decode_html(page.content, page.encoding or soup.original_encoding)
+            
+            for script in soup(["script", "style", "nav", "footer", "header"]):
+                script.decompose()
+            
+            text_content = html_text.normalize_text(soup.get_text())
         
-        return text_content[:8000]
+        return Page(html, text_content[:max_chars])
         
+    except breaker.CircuitOpenError:
+        raise
     except requests.exceptions.ConnectionError as e:
         raise Exception(f"Network connection failed. Unable to reach the website. This might be due to DNS issues or network connectivity problems. Error: {str(e)}")
     except requests.exceptions.Timeout as e:
@@ -49,11 +114,42 @@ def fetch_webpage_content(url):
     except Exception as e:
         raise Exception(f"Unexpected error while fetching webpage: {str(e)}")
 
-def extract_data_with_gemini(content):
+def fetch_webpage_content(url, streaming=None):
+    return fetch_page(url, streaming).text
+
+def _parse_fetched(fetched, max_chars):
+    with metrics.timer('parse'):
+        text_content = html_text.extract_text_from_chunks([fetched.content], fetched.encoding, max_chars)
+        html = html_text.decode_html(fetched.content, fetched.encoding)
+    return Page(html, text_content)
+
+async def fetch_page_async(url, max_chars=None):
+    # The body is read without blocking the event loop; parsing is CPU work
+    # and runs in a thread.
+    max_chars = max_chars or MAX_CONTENT_CHARS
+    httpx = http_client.httpx
     try:
-        if not model:
-            raise Exception("Google AI API key not configured. Please set GOOGLE_AI_API_KEY environment variable.")
-        prompt = """
+        with metrics.timer('fetch'):
+            fetched = await http_client.fetch_async(url, FETCH_MAX_BYTES)
+        return await asyncio.to_thread(_parse_fetched, fetched, max_chars)
+        
+    except breaker.CircuitOpenError:
+        raise
+    except httpx.ConnectError as e:
+        raise Exception(f"Network connection failed. Unable to reach the website. This might be due to DNS issues or network connectivity problems. Error: {str(e)}")
+    except httpx.TimeoutException as e:
+        raise Exception(f"Request timed out. The website took too long to respond. Try again later or check if the URL is accessible.")
+    except httpx.HTTPStatusError as e:
+        # Same wording as requests' raise_for_status() in the sync path.
+        status = e.response.status_code
+        kind = 'Client' if status < 500 else 'Server'
+        raise Exception(f"Failed to fetch webpage: {status} {kind} Error: {e.response.reason_phrase} for url: {e.request.url}")
+    except httpx.HTTPError as e:
+        raise Exception(f"Failed to fetch webpage: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Unexpected error while fetching webpage: {str(e)}")
+
+EXTRACTION_PROMPT = """
         Extract the following details from the provided webpage content:
         - Name or Title of the product/service/company
         - Description (brief summary of what it offers)
@@ -72,72 +168,360 @@ def extract_data_with_gemini(content):
         }
         
         Webpage content:
-        """ + content
+        """
 
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.1,
-                max_output_tokens=1000,
-            )
-        )
+BATCH_EXTRACTION_PROMPT = """
+        Each section below is a separate webpage, introduced by a line of the form
+        "=== PAGE <page_id> ===". For every page, extract:
+        - Name or Title of the product/service/company
+        - Description (brief summary of what it offers)
+        - Key Features (list key features or points)
+        - Pricing information (if any)
+
+        Return the result strictly as a valid JSON array with one object per page and keys:
+        page_id, name, description, features, pricing. Copy page_id exactly as given.
+        If any field is not available or unclear, use null for that field.
         
-        extracted_text = response.text.strip()
+        Example format:
+        [
+            {"page_id": "p1", "name": "OpenAI", "description": "AI research and deployment company",
+             "features": ["GPT models", "ChatGPT API"], "pricing": "Freemium model"}
+        ]
         
+        """
+
+def _strip_code_fence(text):
+    text = text.strip()
+    if text.startswith('```json'):
+        text = text[7:]
+    elif text.startswith('```'):
+        text = text[3:]
+    if text.endswith('```'):
+        text = text[:-3]
+    return text.strip()
+
+def _parse_json_response(text, pattern=r'\{.*\}'):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        json_match = re.search(pattern, text, re.DOTALL)
+        if json_match:
+            try:
+                return json.loads(json_match.group())
+            except json.JSONDecodeError:
+                pass
+    return None
+
+def _generation_config(max_output_tokens):
+    # A plain dict is accepted wherever genai.types.GenerationConfig is.
+    return {
+        "temperature": 0.1,
+        "max_output_tokens": max_output_tokens,
+    }
+
+def _record_call(error=None, text=None):
+    if error is not None:
+        outcome = 'throttled' if ratelimit.is_throttle(error) else 'error'
+        metrics.inc('visionflow_llm_calls_total', outcome=outcome)
+        return
+    metrics.inc('visionflow_llm_calls_total', outcome='ok')
+    metrics.observe('visionflow_response_chars', len(text))
+
+def _generate(prompt, max_output_tokens=1000):
+    # Every model call goes through the shared limiter, which queues under
+    # the quota and retries throttled or transient failures with backoff.
+    def call():
         try:
-            if extracted_text.startswith('```json'):
-                extracted_text = extracted_text[7:]
-            if extracted_text.endswith('```'):
-                extracted_text = extracted_text[:-3]
-            
-            extracted_data = json.loads(extracted_text)
-            return extracted_data
-            
-        except json.JSONDecodeError:
-            import re
-            json_match = re.search(r'\{.*\}', extracted_text, re.DOTALL)
-            if json_match:
-                try:
-                    return json.loads(json_match.group())
-                except:
-                    pass
+            with metrics.timer('llm'):
+                response = get_model().generate_content(
+                    prompt,
+                    generation_config=_generation_config(max_output_tokens)
+                )
+                text = response.text.strip()
+        except Exception as e:
+            _record_call(error=e)
+            raise
+        _record_call(text=text)
+        return text
+    
+    metrics.observe('visionflow_prompt_chars', len(prompt))
+    return ratelimit.call_with_retry(call)
+
+async def _generate_async(prompt, max_output_tokens=1000):
+    # Models without generate_content_async (e.g. test fakes) run in a thread.
+    async def call():
+        try:
+            client = get_model()
+            with metrics.timer('llm'):
+                if hasattr(client, 'generate_content_async'):
+                    response = await client.generate_content_async(
+                        prompt,
+                        generation_config=_generation_config(max_output_tokens)
+                    )
+                else:
+                    response = await asyncio.to_thread(
+                        client.generate_content,
+                        prompt,
+                        generation_config=_generation_config(max_output_tokens)
+                    )
+                text = response.text.strip()
+        except Exception as e:
+            _record_call(error=e)
+            raise
+        _record_call(text=text)
+        return text
+    
+    metrics.observe('visionflow_prompt_chars', len(prompt))
+    return await ratelimit.call_with_retry_async(call)
+
+def _interpret_response(extracted_text, cache_key):
+    extracted_text = _strip_code_fence(extracted_text)
+    
+    with metrics.timer('json_parse'):
+        extracted_data = _parse_json_response(extracted_text)
+    if isinstance(extracted_data, dict):
+        llm_cache.put(cache_key, extracted_data)
+        return extracted_data
+    
+    return {
+        "name": "Unknown",
+        "description": extracted_text[:200] + "..." if len(extracted_text) > 200 else extracted_text,
+        "features": [],
+        "pricing": "Not available"
+    }
+
+def extract_data_with_gemini(content):
+    try:
+        cache_key = llm_cache.make_key(content, PROMPT_VERSION)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        if not get_model():
+            raise Exception("Google AI API key not configured. Please set GOOGLE_AI_API_KEY environment variable.")
+        
+        with metrics.timer('prompt_build'):
+            prompt = EXTRACTION_PROMPT + content
+        
+        return _interpret_response(_generate(prompt), cache_key)
             
-            return {
-                "name": "Unknown",
-                "description": extracted_text[:200] + "..." if len(extracted_text) > 200 else extracted_text,
-                "features": [],
-                "pricing": "Not available"
-            }
+    except ratelimit.RateLimitExceeded:
+        raise
+    except Exception as e:
+        raise Exception(f"Gemini extraction failed: {str(e)}")
+
+async def extract_data_with_gemini_async(content):
+    try:
+        cache_key = llm_cache.make_key(content, PROMPT_VERSION)
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+        if cached is not None:
+            return cached
+        
+        if not get_model():
+            raise Exception("Google AI API key not configured. Please set GOOGLE_AI_API_KEY environment variable.")
+        
+        with metrics.timer('prompt_build'):
+            prompt = EXTRACTION_PROMPT + content
+        
+        extracted_text = await _generate_async(prompt)
+        return await asyncio.to_thread(_interpret_response, extracted_text, cache_key)
             
+    except ratelimit.RateLimitExceeded:
+        raise
     except Exception as e:
         raise Exception(f"Gemini extraction failed: {str(e)}")
 
-def process_url(url):
+def _iter_json_objects(text):
+    # Salvages whatever complete objects a truncated or malformed array still
+    # contains, so one bad item does not throw away the rest of the batch.
+    decoder = json.JSONDecoder()
+    index = text.find('{')
+    while index != -1:
+        try:
+            value, end = decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            index = text.find('{', index + 1)
+            continue
+        if isinstance(value, dict):
+            yield value
+        index = text.find('{', end)
+
+def parse_batch_response(text, page_ids):
+    with metrics.timer('json_parse'):
+        return _parse_batch_response(text, page_ids)
+
+def _parse_batch_response(text, page_ids):
+    text = _strip_code_fence(text)
+    items = _parse_json_response(text, pattern=r'\[.*\]')
+    if isinstance(items, dict):
+        items = items.get('pages') or items.get('results') or [items]
+    if not isinstance(items, list):
+        items = list(_iter_json_objects(text))
+
+    wanted = set(page_ids)
+    parsed = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        page_id = str(item.get('page_id', '')).strip()
+        if page_id in wanted and page_id not in parsed:
+            data = {field: item.get(field) for field in ('name', 'description', 'features', 'pricing')}
+            if any(value is not None for value in data.values()):
+                parsed[page_id] = data
+    return parsed
+
+def _plan_batches(items):
+    batches = []
+    current = []
+    size = 0
+    for page_id, content in items:
+        if current and (len(current) >= LLM_BATCH_SIZE or size + len(content) > LLM_BATCH_MAX_CHARS):
+            batches.append(current)
+            current = []
+            size = 0
+        current.append((page_id, content))
+        size += len(content)
+    if current:
+        batches.append(current)
+    return batches
+
+def _extract_single(content):
     try:
-        content = fetch_webpage_content(url)
+        return {"success": True, "data": extract_data_with_gemini(content)}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def extract_data_with_gemini_batch(contents):
+    results = [None] * len(contents)
+    pending = []
+    for index, content in enumerate(contents):
+        cached = llm_cache.get(llm_cache.make_key(content, PROMPT_VERSION))
+        if cached is not None:
+            results[index] = {"success": True, "data": cached}
+        elif LLM_BATCH_SIZE <= 1 or len(content) > LLM_BATCH_MAX_PAGE_CHARS:
+            results[index] = _extract_single(content)
+        else:
+            pending.append((f"p{index}", content))
+
+    for batch in _plan_batches(pending):
+        parsed = {}
+        if get_model() and len(batch) > 1:
+            with metrics.timer('prompt_build'):
+                prompt = BATCH_EXTRACTION_PROMPT + '\n'.join(
+                    f"=== PAGE {page_id} ===\n{content}" for page_id, content in batch
+                )
+            try:
+                parsed = parse_batch_response(
+                    _generate(prompt, max_output_tokens=min(8192, 1000 * len(batch))),
+                    [page_id for page_id, _ in batch]
+                )
+            except Exception:
+                parsed = {}
+
+        for page_id, content in batch:
+            index = int(page_id[1:])
+            if page_id in parsed:
+                llm_cache.put(llm_cache.make_key(content, PROMPT_VERSION), parsed[page_id])
+                results[index] = {"success": True, "data": parsed[page_id]}
+            else:
+                results[index] = _extract_single(content)
+
+    return results
+
+def prepare_url(url, force_llm=False):
+    # With content selection on, scan well past the prompt budget so that
+    # pricing and feature sections further down the page can be found.
+    page = fetch_page(
+        url,
+        max_chars=content_select.CONTENT_SCAN_CHARS if content_select.CONTENT_SELECTION else None
+    )
+    return prepare_page(page, force_llm=force_llm)
+
+def prepare_page(page, force_llm=False):
+    if not page.text:
+        raise Exception("No content found on webpage")
+    
+    prepared = {
+        "page": page,
+        "data": None,
+        "content": None,
+        "tier": "llm"
+    }
+    
+    # Pages that publish enough structured data (JSON-LD, OpenGraph,
+    # pricing markup) are answered without a model call.
+    if not (force_llm or FORCE_LLM):
+        with metrics.timer('structured'):
+            structured_data, confidence = structured.extract_structured_data(page.html)
+        if confidence >= structured.STRUCTURED_MIN_CONFIDENCE:
+            prepared["data"] = structured_data
+            prepared["tier"] = "structured"
+            return prepared
+    
+    content = None
+    with metrics.timer('prompt_build'):
+        if content_select.CONTENT_SELECTION:
+            content = content_select.select_content(page.html)
+        prepared["content"] = content or page.text[:MAX_CONTENT_CHARS]
+    return prepared
+
+def finalize_extraction(prepared, extracted_data):
+    extracted_data = dict(extracted_data)
+    
+    required_fields = ['name', 'description', 'features', 'pricing']
+    for field in required_fields:
+        if field not in extracted_data:
+            extracted_data[field] = "Not available"
+    
+    if isinstance(extracted_data.get('features'), list):
+        extracted_data['features'] = ', '.join(str(feature) for feature in extracted_data['features'])
+    
+    return {
+        "success": True,
+        "data": extracted_data,
+        "tier": prepared["tier"],
+        "raw_content_length": len(prepared["page"].text),
+        "page": prepared["page"]
+    }
+
+def process_url(url, force_llm=False, page=None):
+    # A page the caller already fetched (e.g. while crawling) is not refetched.
+    try:
+        if page is not None:
+            prepared = prepare_page(page, force_llm=force_llm)
+        else:
+            prepared = prepare_url(url, force_llm=force_llm)
         
-        if not content:
-            return {"error": "No content found on webpage"}
+        extracted_data = prepared["data"]
+        if extracted_data is None:
+            extracted_data = extract_data_with_gemini(prepared["content"])
         
-        extracted_data = extract_data_with_gemini(content)
+        return finalize_extraction(prepared, extracted_data)
         
-        required_fields = ['name', 'description', 'features', 'pricing']
-        for field in required_fields:
-            if field not in extracted_data:
-                extracted_data[field] = "Not available"
+    except Exception as e:
+        return _failure(e)
+
+async def process_url_async(url, force_llm=False):
+    try:
+        page = await fetch_page_async(
+            url,
+            max_chars=content_select.CONTENT_SCAN_CHARS if content_select.CONTENT_SELECTION else None
+        )
+        prepared = await asyncio.to_thread(prepare_page, page, force_llm)
         
-        if isinstance(extracted_data.get('features'), list):
-            extracted_data['features'] = ', '.join(extracted_data['features'])
+        extracted_data = prepared["data"]
+        if extracted_data is None:
+            extracted_data = await extract_data_with_gemini_async(prepared["content"])
         
-        return {
-            "success": True,
-            "data": extracted_data,
-            "raw_content_length": len(content)
-        }
+        return finalize_extraction(prepared, extracted_data)
         
     except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "data": None
-        }
\ No newline at end of file
+        return _failure(e)
+
+def _failure(error):
+    return {
+        "success": False,
+        "error": str(error),
+        "data": None,
+        "retry_after": getattr(error, 'retry_after', None)
+    }
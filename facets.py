@@ -0,0 +1,124 @@
+import re
+from collections import namedtuple
+
+# Splits the stored `features` and `pricing` text into individual features
+# and price points so they can be indexed in child tables. Pure parsing: the
+# tables themselves are written in database.py.
+
+MAX_FEATURES = 50
+MAX_FEATURE_CHARS = 200
+MAX_PRICE_POINTS = 20
+MAX_TIER_CHARS = 40
+
+PricePoint = namedtuple('PricePoint', ['tier', 'amount', 'currency', 'period', 'raw'])
+
+CURRENCY_CODES = {'$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '₹': 'INR'}
+PERIODS = (
+    ('hour', re.compile(r'^(hour|hr|h)$|^hourly$')),
+    ('day', re.compile(r'^(day|d)$|^daily$')),
+    ('week', re.compile(r'^(week|wk)$|^weekly$')),
+    ('month', re.compile(r'^(month|mo|mth|m)$|^monthly$')),
+    ('year', re.compile(r'^(year|yr|y|annum)$|^(annual|annually|yearly)$')),
+    ('one-time', re.compile(r'^(one[ -]time|once|lifetime)$')),
+)
+MISSING_VALUES = {'', 'not available', 'n/a', 'none', 'unknown'}
+
+_ITEM_SEPARATOR = re.compile(r'[;\n•|]|,(?![^(]*\))')
+_SEGMENT_SEPARATOR = re.compile(r'[;\n•|]|,(?!\d{3})')
+_BULLET = re.compile(r'^[\s*\-–—·>]+')
+_AMOUNT = r'\d[\d,]*(?:\.\d+)?'
+_PRICE = re.compile(
+    rf'(?P<symbol>[$€£¥₹])\s?(?P<amount>{_AMOUNT})\s?(?P<scale>[kK]\b)?'
+    rf'|(?P<code_before>USD|EUR|GBP|JPY|INR|CAD|AUD)\s?(?P<amount_after>{_AMOUNT})'
+    rf'|(?P<amount_before>{_AMOUNT})\s?(?P<code_after>USD|EUR|GBP|JPY|INR|CAD|AUD)\b'
+)
+# What follows an amount, e.g. "/month", "per user per month", "a year",
+# "/user/mo" or "billed annually".
+_PERIOD_WORDS = re.compile(r'(?:/|\bper\b|\ba\b|\ban\b|\bbilled\b|\beach\b)\s*([a-z][a-z -]*?)(?=$|[^a-z -])')
+_FREE = re.compile(r'\bfree\b(?!\s+trial)', re.IGNORECASE)
+_TIER_NOISE = re.compile(r'\b(from|starting at|starts at|starting|only|just|then|plan|tier)\b|[:\-–(=@]', re.IGNORECASE)
+_RANGE = re.compile(r'^\s*(-|–|to)\s*$')
+
+def feature_key(feature):
+    """Case- and whitespace-insensitive form used to match features"""
+    return ' '.join(feature.lower().split())
+
+def split_features(text):
+    if not isinstance(text, str) or text.strip().lower() in MISSING_VALUES:
+        return []
+
+    features = []
+    seen = set()
+    for item in _ITEM_SEPARATOR.split(text):
+        item = ' '.join(_BULLET.sub('', item).split()).strip(' .')[:MAX_FEATURE_CHARS]
+        key = feature_key(item)
+        if key and key not in seen and key not in MISSING_VALUES:
+            seen.add(key)
+            features.append(item)
+        if len(features) >= MAX_FEATURES:
+            break
+    return features
+
+def _period(tail):
+    for words in _PERIOD_WORDS.findall(tail.lower()):
+        for word in words.split():
+            for period, pattern in PERIODS:
+                if pattern.match(word):
+                    return period
+    if re.search(r'\b(annual|annually|yearly)\b', tail, re.IGNORECASE):
+        return 'year'
+    if re.search(r'\bmonthly\b', tail, re.IGNORECASE):
+        return 'month'
+    return None
+
+def _tier(label):
+    # "Pro: $29/mo" and "Pro $29/mo" name the tier; "from $29" does not.
+    label = ' '.join(_TIER_NOISE.sub(' ', label).split()).strip(' ,.')
+    if not label or len(label) > MAX_TIER_CHARS:
+        return None
+    return label
+
+def parse_prices(text):
+    if not isinstance(text, str) or text.strip().lower() in MISSING_VALUES:
+        return []
+
+    points = []
+    for segment in _SEGMENT_SEPARATOR.split(text):
+        segment = ' '.join(segment.split())
+        matches = list(_PRICE.finditer(segment))
+        if not matches:
+            if _FREE.search(segment):
+                label = segment.split(':', 1)[0] if ':' in segment else 'Free'
+                points.append(PricePoint(_tier(label) or 'Free', 0.0, None, None, segment))
+            continue
+
+        tier = _tier(segment[:matches[0].start()])
+        segment_points = []
+        for index, match in enumerate(matches):
+            amount = match.group('amount') or match.group('amount_after') or match.group('amount_before')
+            try:
+                amount = float(amount.replace(',', ''))
+            except ValueError:
+                continue
+            if match.group('scale'):
+                amount *= 1000
+            currency = (
+                CURRENCY_CODES.get(match.group('symbol'))
+                or match.group('code_before')
+                or match.group('code_after')
+            )
+            # The period is read from the text up to the next price, so in
+            # "$10/mo or $100/yr" each amount keeps its own.
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(segment)
+            tail = segment[match.end():end]
+            segment_points.append((PricePoint(tier, amount, currency, _period(tail), segment), tail))
+
+        # The low end of "$10 - $50 per month" shares the high end's period.
+        for index in range(len(segment_points) - 2, -1, -1):
+            point, tail = segment_points[index]
+            if point.period is None and _RANGE.match(tail):
+                segment_points[index] = (point._replace(period=segment_points[index + 1][0].period), tail)
+        points.extend(point for point, _ in segment_points)
+        if len(points) >= MAX_PRICE_POINTS:
+            break
+    return points[:MAX_PRICE_POINTS]
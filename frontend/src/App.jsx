@@ -56,9 +56,51 @@ function App() {
     };
     fetchWithRetry();
     
-    // Set up polling for real-time updates (silent updates)
-    const interval = setInterval(() => fetchData(false), 8000);
-    return () => clearInterval(interval);
+    // Prefer the server-sent change feed; it only delivers rows that changed.
+    // Fall back to polling when EventSource is unavailable or the stream is closed.
+    let interval = null;
+    let source = null;
+    const startPolling = () => {
+      if (!interval) {
+        interval = setInterval(() => fetchData(false), 8000);
+      }
+    };
+    
+    if (typeof window.EventSource === 'function') {
+      source = new EventSource(`${API_BASE_URL}/data/stream`);
+      const applyRow = (event) => {
+        const row = JSON.parse(event.data);
+        setExtractions(prev => {
+          const index = prev.findIndex(item => item.id === row.id);
+          if (index === -1) {
+            return [row, ...prev].slice(0, 50);
+          }
+          const next = [...prev];
+          next[index] = row;
+          return next;
+        });
+      };
+      source.addEventListener('insert', applyRow);
+      source.addEventListener('update', applyRow);
+      source.addEventListener('delete', (event) => {
+        const { id } = JSON.parse(event.data);
+        setExtractions(prev => prev.filter(item => item.id !== id));
+      });
+      // Sent when changes since our last event were pruned; reload instead.
+      source.addEventListener('reset', () => fetchData(false));
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          startPolling();
+        }
+      };
+    } else {
+      startPolling();
+    }
+    
+    return () => {
+      if (source) source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
   const fetchData = async (showLoading = false) => {
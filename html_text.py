@@ -0,0 +1,220 @@
+import codecs
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+
+SKIP_TAGS = {'script', 'style', 'nav', 'footer', 'header'}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+CONTAINER_TAGS = {'ul': 'list', 'ol': 'list', 'dl': 'list', 'table': 'table'}
+BREAK_TAGS = {
+    'p', 'div', 'section', 'article', 'main', 'aside', 'br', 'blockquote', 'pre',
+    'form', 'figure', 'figcaption', 'summary', 'details', 'li', 'tr', 'td', 'th', 'dt', 'dd'
+}
+
+Block = namedtuple('Block', ['kind', 'text', 'position'])
+
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+def normalize_text(text):
+    lines = (line.strip() for line in text.splitlines())
+    return ' '.join(line for line in lines if line)
+
+def sniff_encoding(head, default='utf-8'):
+    match = _META_CHARSET.search(head[:4096])
+    if match:
+        encoding = match.group(1).decode('ascii', 'ignore')
+        try:
+            codecs.lookup(encoding)
+            return encoding
+        except LookupError:
+            pass
+    return default
+
+def decode_html(raw, encoding=None):
+    try:
+        return raw.decode(encoding or sniff_encoding(raw), errors='replace')
+    except LookupError:
+        return raw.decode('utf-8', errors='replace')
+
+class TextExtractor(HTMLParser):
+    # Incremental equivalent of decomposing SKIP_TAGS in BeautifulSoup and
+    # calling get_text(): text is collected as markup is fed in, and `done`
+    # flips once `max_chars` of visible text has been gathered.
+    def __init__(self, max_chars):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.done = False
+        self._skip_depth = 0
+        self._parts = []
+        self._length = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth or self.done:
+            return
+        self._parts.append(data)
+        self._length += len(' '.join(data.split()))
+        if self._length >= self.max_chars:
+            self.done = True
+
+    def get_text(self):
+        return normalize_text(''.join(self._parts))[:self.max_chars]
+
+def extract_text_from_chunks(chunks, encoding, max_chars):
+    # `chunks` is an iterator of raw bytes; it is closed as soon as the text
+    # budget is met so the rest of the response is never downloaded.
+    parser = TextExtractor(max_chars)
+    decoder = None
+    try:
+        for chunk in chunks:
+            if decoder is None:
+                name = encoding or sniff_encoding(chunk)
+                try:
+                    decoder = codecs.getincrementaldecoder(name)(errors='replace')
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            parser.feed(decoder.decode(chunk))
+            if parser.done:
+                break
+        if decoder is not None and not parser.done:
+            parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+    return parser.get_text()
+
+class BlockExtractor(HTMLParser):
+    # Splits visible text into headings, whole lists, whole tables and plain
+    # text runs so that later stages can rank sections instead of characters.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self._parts = []
+        self._skip_depth = 0
+        self._heading = False
+        self._container = None
+        self._container_tag = None
+        self._container_depth = 0
+        self._first_cell = True
+
+    def _flush(self, kind):
+        text = ' '.join(''.join(self._parts).split()).strip(' ;|')
+        self._parts = []
+        if text:
+            self.blocks.append(Block(kind, text, len(self.blocks)))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+
+        if self._container:
+            if tag == self._container_tag:
+                self._container_depth += 1
+            elif tag in ('li', 'tr', 'dt'):
+                self._parts.append('; ')
+                self._first_cell = True
+            elif tag in ('td', 'th', 'dd'):
+                if not self._first_cell:
+                    self._parts.append(' | ')
+                self._first_cell = False
+            return
+
+        if tag in CONTAINER_TAGS:
+            self._flush('heading' if self._heading else 'text')
+            self._heading = False
+            self._container = CONTAINER_TAGS[tag]
+            self._container_tag = tag
+            self._container_depth = 1
+        elif tag in HEADING_TAGS:
+            self._flush('text')
+            self._heading = True
+        elif tag in BREAK_TAGS:
+            self._flush('heading' if self._heading else 'text')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            if self._skip_depth:
+                self._skip_depth -= 1
+            return
+        if self._skip_depth:
+            return
+
+        if self._container:
+            if tag == self._container_tag:
+                self._container_depth -= 1
+                if not self._container_depth:
+                    self._flush(self._container)
+                    self._container = None
+            return
+
+        if tag in HEADING_TAGS and self._heading:
+            self._flush('heading')
+            self._heading = False
+        elif tag in BREAK_TAGS:
+            self._flush('text')
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def close(self):
+        super().close()
+        self._flush(self._container or ('heading' if self._heading else 'text'))
+
+def extract_blocks(html):
+    parser = BlockExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.blocks
+
+class LinkExtractor(HTMLParser):
+    # Collects <a href> targets with their anchor text. Navigation, header
+    # and footer links are kept: that is usually where "Pricing" lives.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base = None
+        self.links = []
+        self._href = None
+        self._parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'base' and self.base is None:
+            self.base = dict(attrs).get('href')
+        elif tag == 'a':
+            self._close_link()
+            self._href = dict(attrs).get('href')
+        elif tag == 'img' and self._href is not None:
+            self._parts.append(' ' + (dict(attrs).get('alt') or ''))
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._close_link()
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._parts.append(data)
+
+    def _close_link(self):
+        if self._href:
+            self.links.append((self._href.strip(), ' '.join(''.join(self._parts).split())))
+        self._href = None
+        self._parts = []
+
+def extract_links(html):
+    parser = LinkExtractor()
+    parser.feed(html)
+    parser.close()
+    parser._close_link()
+    return parser.base, parser.links
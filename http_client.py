@@ -0,0 +1,373 @@
+import asyncio
+import os
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from database import get_connection, transaction
+import blobstore
+import breaker
+import metrics
+
+FETCH_TIMEOUT = int(os.getenv('FETCH_TIMEOUT', '15'))
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '32'))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', '1') != '0'
+# Total compressed bytes kept; the least recently fetched pages go first.
+PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+PAGE_CACHE_MAX_BODY_BYTES = int(os.getenv('PAGE_CACHE_MAX_BODY_BYTES', str(2 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', '16384'))
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+FetchResult = namedtuple('FetchResult', ['content', 'encoding', 'not_modified'])
+CachedPage = namedtuple('CachedPage', ['etag', 'last_modified', 'encoding', 'codec', 'truncated', 'data'])
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    # One session per process so connections (and their TLS state) are kept
+    # alive and reused across requests to the same host.
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=HTTP_POOL_SIZE
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(DEFAULT_HEADERS)
+                _session = session
+    return _session
+
+def load_cached_page(url):
+    if not PAGE_CACHE_ENABLED:
+        return None
+
+    row = get_connection().execute(
+        "SELECT etag, last_modified, encoding, codec, truncated, body FROM page_cache WHERE url = ?", (url,)
+    ).fetchone()
+    return CachedPage(*row) if row else None
+
+def cached_body(cached):
+    # Only decompressed when the server answers 304 and the body is replayed.
+    return blobstore.decompress(cached.codec, cached.data)
+
+def store_cached_page(url, etag, last_modified, body, encoding, truncated=False):
+    if not PAGE_CACHE_ENABLED or len(body) > PAGE_CACHE_MAX_BODY_BYTES:
+        return
+    if not etag and not last_modified:
+        return
+
+    # Compressed outside the write transaction, like page blobs.
+    codec, data = blobstore.compress(body)
+    with transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO page_cache
+                (url, etag, last_modified, encoding, codec, stored_bytes, truncated, fetched_at, body)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (url, etag, last_modified, encoding, codec, len(data), int(truncated), time.time(), data))
+
+        total = conn.execute("SELECT COALESCE(SUM(stored_bytes), 0) FROM page_cache").fetchone()[0]
+        if total <= PAGE_CACHE_MAX_BYTES:
+            return
+        evicted = []
+        for cached_url, stored_bytes in conn.execute(
+            "SELECT url, stored_bytes FROM page_cache ORDER BY fetched_at"
+        ):
+            if total <= PAGE_CACHE_MAX_BYTES:
+                break
+            evicted.append((cached_url,))
+            total -= stored_bytes
+        conn.executemany("DELETE FROM page_cache WHERE url = ?", evicted)
+
+def conditional_headers(cached):
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+    return headers
+
+def declared_encoding(response):
+    # requests falls back to ISO-8859-1 for any text/* response without a
+    # charset; only trust the encoding when the server actually sent one.
+    if 'charset=' in response.headers.get('Content-Type', '').lower():
+        return response.encoding
+    return None
+
+def _failure_status(error):
+    # (counted, status): only connection errors, timeouts and HTTP error
+    # responses say anything about the site; a malformed URL does not.
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True, None
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return True, error.response.status_code
+    if httpx is not None:
+        if isinstance(error, httpx.HTTPStatusError):
+            return True, error.response.status_code
+        if isinstance(error, httpx.TransportError):
+            return True, None
+    return False, None
+
+def guarded(url, fetcher):
+    # Every fetch passes the per-host circuit breaker and the negative URL
+    # cache first, so a failing site costs one timeout rather than one per
+    # request.
+    tracked = breaker.check(url)
+    try:
+        result = fetcher()
+    except Exception as e:
+        counted, status = _failure_status(e)
+        if counted:
+            breaker.record_failure(url, status, e)
+        raise
+    if tracked:
+        breaker.record_success(url)
+    return result
+
+def fetch(url, timeout=None, headers=None):
+    return guarded(url, lambda: _fetch(url, timeout, headers))
+
+def _fetch(url, timeout=None, headers=None):
+    # A prefix saved by a streamed read that stopped early cannot stand in
+    # for the whole body.
+    cached = load_cached_page(url)
+    if cached is not None and cached.truncated:
+        cached = None
+
+    response = get_session().get(
+        url,
+        headers=dict(conditional_headers(cached), **(headers or {})),
+        timeout=timeout or FETCH_TIMEOUT,
+        verify=True
+    )
+
+    if response.status_code == 304 and cached is not None:
+        metrics.inc('visionflow_cache_requests_total', cache='page', result='revalidated')
+        return FetchResult(cached_body(cached), cached.encoding, True)
+
+    response.raise_for_status()
+
+    metrics.inc('visionflow_cache_requests_total', cache='page', result='miss')
+    metrics.inc('visionflow_fetch_bytes_total', len(response.content))
+    metrics.observe('visionflow_fetch_bytes', len(response.content))
+
+    store_cached_page(
+        url,
+        response.headers.get('ETag'),
+        response.headers.get('Last-Modified'),
+        response.content,
+        declared_encoding(response)
+    )
+    return FetchResult(response.content, declared_encoding(response), False)
+
+class StreamedPage:
+    def __init__(self, url, response=None, cached=None, timeout=None, headers=None):
+        self.url = url
+        self._response = response
+        self._cached = cached
+        self._timeout = timeout
+        self._headers = headers
+        self.not_modified = cached is not None
+        self.encoding = cached.encoding if cached is not None else declared_encoding(response)
+
+    def iter_chunks(self, max_bytes, chunk_size=None):
+        if self._cached is None:
+            yield from self._read(self._response, max_bytes, chunk_size)
+            return
+
+        prefix = cached_body(self._cached)[:max_bytes]
+        yield prefix
+        if not self._cached.truncated or len(prefix) >= max_bytes:
+            return
+
+        # The caller wants more than the prefix an earlier read stopped at:
+        # fetch the page again in full and continue where the prefix ends.
+        response = guarded(self.url, lambda: _get_stream(self.url, self._timeout, self._headers))
+        yield from self._read(response, max_bytes, chunk_size, skip=len(prefix))
+
+    def _read(self, response, max_bytes, chunk_size=None, skip=0):
+        # Whatever was read is cached when the caller stops, whether at the
+        # end of the page, at max_bytes or because its text budget is full;
+        # a prefix is stored as truncated and replayed as such on a 304.
+        received = []
+        total = 0
+        complete = False
+        try:
+            for chunk in response.iter_content(chunk_size or STREAM_CHUNK_SIZE):
+                if not chunk:
+                    continue
+                chunk = chunk[:max_bytes - total]
+                total += len(chunk)
+                received.append(chunk)
+                if total > skip:
+                    yield chunk[max(0, skip - (total - len(chunk))):]
+                if total >= max_bytes:
+                    break
+            else:
+                complete = True
+        except GeneratorExit:
+            pass
+        except Exception:
+            received = None
+            raise
+        finally:
+            response.close()
+            metrics.inc('visionflow_fetch_bytes_total', total)
+            metrics.observe('visionflow_fetch_bytes', total)
+            if received is not None:
+                store_cached_page(
+                    self.url,
+                    response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'),
+                    b''.join(received),
+                    self.encoding,
+                    truncated=not complete
+                )
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+
+def open_stream(url, timeout=None, headers=None):
+    return guarded(url, lambda: _open_stream(url, timeout, headers))
+
+def _get_stream(url, timeout=None, headers=None, cached=None):
+    response = get_session().get(
+        url,
+        headers=dict(conditional_headers(cached), **(headers or {})),
+        timeout=timeout or FETCH_TIMEOUT,
+        verify=True,
+        stream=True
+    )
+    if response.status_code == 304 and cached is not None:
+        return response
+
+    try:
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+    return response
+
+def _open_stream(url, timeout=None, headers=None):
+    cached = load_cached_page(url)
+    response = _get_stream(url, timeout, headers, cached)
+
+    if response.status_code == 304 and cached is not None:
+        response.close()
+        metrics.inc('visionflow_cache_requests_total', cache='page', result='revalidated')
+        return StreamedPage(url, cached=cached, timeout=timeout, headers=headers)
+
+    metrics.inc('visionflow_cache_requests_total', cache='page', result='miss')
+    return StreamedPage(url, response=response)
+
+_async_client = None
+_async_client_loop = None
+
+def get_async_client():
+    # Used by the ASGI app (asgi.py); one client per event loop shares its
+    # connection pool across every in-flight request on that loop.
+    global _async_client, _async_client_loop
+    if httpx is None:
+        raise Exception("The async API requires the httpx package")
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client_loop = loop
+        _async_client = httpx.AsyncClient(
+            # httpx only decodes brotli when a brotli package is installed.
+            headers=dict(DEFAULT_HEADERS, **{'Accept-Encoding': 'gzip, deflate'}),
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE * 4
+            ),
+            timeout=FETCH_TIMEOUT,
+            follow_redirects=True
+        )
+    return _async_client
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+async def fetch_async(url, max_bytes, timeout=None):
+    tracked = await asyncio.to_thread(breaker.check, url)
+    try:
+        result = await _fetch_async(url, max_bytes, timeout)
+    except Exception as e:
+        counted, status = _failure_status(e)
+        if counted:
+            await asyncio.to_thread(breaker.record_failure, url, status, e)
+        raise
+    if tracked:
+        await asyncio.to_thread(breaker.record_success, url)
+    return result
+
+async def _fetch_async(url, max_bytes, timeout=None):
+    cached = await asyncio.to_thread(load_cached_page, url)
+    if cached is not None and cached.truncated:
+        cached = None
+
+    async with get_async_client().stream(
+        'GET',
+        url,
+        headers=conditional_headers(cached),
+        timeout=timeout or FETCH_TIMEOUT
+    ) as response:
+        if response.status_code == 304 and cached is not None:
+            metrics.inc('visionflow_cache_requests_total', cache='page', result='revalidated')
+            return FetchResult(cached_body(cached), cached.encoding, True)
+
+        response.raise_for_status()
+        metrics.inc('visionflow_cache_requests_total', cache='page', result='miss')
+
+        received = []
+        total = 0
+        complete = True
+        async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+            if total + len(chunk) > max_bytes:
+                received.append(chunk[:max_bytes - total])
+                total = max_bytes
+                complete = False
+                break
+            received.append(chunk)
+            total += len(chunk)
+
+        metrics.inc('visionflow_fetch_bytes_total', total)
+        metrics.observe('visionflow_fetch_bytes', total)
+
+        content = b''.join(received)
+        encoding = response.charset_encoding
+        if complete:
+            await asyncio.to_thread(
+                store_cached_page,
+                url,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'),
+                content,
+                encoding
+            )
+        return FetchResult(content, encoding, False)
@@ -0,0 +1,157 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from database import get_connection, transaction
+from pipeline import run_extraction
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '500'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+
+_wake = threading.Event()
+_start_lock = threading.Lock()
+_started_pid = None
+
+class QueueFullError(Exception):
+    pass
+
+def _job_to_dict(row):
+    return {
+        'id': row['id'],
+        'url': row['url'],
+        'status': row['status'],
+        'result': json.loads(row['result']) if row['result'] else None,
+        'error': row['error'],
+        'extraction_id': row['extraction_id'],
+        'attempts': row['attempts'],
+        'created_at': row['created_at'],
+        'started_at': row['started_at'],
+        'finished_at': row['finished_at']
+    }
+
+def enqueue_job(url, force_llm=False):
+    with transaction() as conn:
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()[0]
+
+        if pending >= JOB_MAX_PENDING:
+            raise QueueFullError(f"Job queue is full ({pending} pending jobs)")
+
+        job_id = conn.execute(
+            "INSERT INTO jobs (url, force_llm) VALUES (?, ?)", (url, int(force_llm))
+        ).lastrowid
+
+    start_workers()
+    _wake.set()
+    return job_id
+
+def get_job(job_id):
+    row = get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job_to_dict(row) if row else None
+
+def claim_job():
+    # A job stays 'running' under a lease; if the worker holding it dies the
+    # lease expires and the job is picked up again, so restarts lose nothing.
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE jobs
+            SET status = 'failed', error = 'Job abandoned after repeated worker failures',
+                finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND lease_expires < ? AND attempts >= ?
+        ''', (now, JOB_MAX_ATTEMPTS))
+        row = conn.execute('''
+            SELECT * FROM jobs
+            WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?)
+            ORDER BY id
+            LIMIT 1
+        ''', (now,)).fetchone()
+
+        if row is None:
+            return None
+
+        conn.execute('''
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1, lease_expires = ?,
+                started_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (now + JOB_LEASE_SECONDS, row['id']))
+        return {'id': row['id'], 'url': row['url'], 'force_llm': bool(row['force_llm'])}
+
+def finish_job(job_id, status, result=None, error=None, extraction_id=None):
+    get_connection().execute('''
+        UPDATE jobs
+        SET status = ?, result = ?, error = ?, extraction_id = ?,
+            lease_expires = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (
+        status,
+        json.dumps(result) if result is not None else None,
+        error,
+        extraction_id,
+        job_id
+    ))
+
+def run_job(job):
+    try:
+        result = run_extraction(job['url'], force_llm=job['force_llm'])
+    except Exception as e:
+        finish_job(job['id'], 'failed', error=f"Server error: {str(e)}")
+        return
+
+    if result['success']:
+        finish_job(
+            job['id'],
+            'done',
+            result={'data': result['data'], 'tier': result['tier'], 'url': job['url']},
+            extraction_id=result['extraction_id']
+        )
+    else:
+        finish_job(
+            job['id'],
+            'failed',
+            error=result['error'],
+            extraction_id=result['extraction_id']
+        )
+
+def _worker_loop():
+    while True:
+        try:
+            job = claim_job()
+        except sqlite3.Error:
+            job = None
+
+        if job is None:
+            _wake.wait(JOB_POLL_INTERVAL)
+            _wake.clear()
+            continue
+
+        # A failure here (e.g. the database staying locked past its busy
+        # timeout) must not kill the thread; the job's lease expires and
+        # another worker reclaims it.
+        try:
+            run_job(job)
+        except Exception as e:
+            print(f"⚠️ Job {job['id']} worker error: {e}")
+
+def start_workers(count=None):
+    # Threads do not survive a fork, so track the owning pid rather than a flag
+    # in case the app module was imported before gunicorn forked its workers.
+    global _started_pid
+    count = JOB_WORKERS if count is None else count
+    if count <= 0:
+        return
+
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        for index in range(count):
+            thread = threading.Thread(target=_worker_loop, name=f"job-worker-{index}", daemon=True)
+            thread.start()
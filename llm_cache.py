@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database import transaction
+import metrics
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') != '0'
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))
+LLM_CACHE_FRONT_SIZE = int(os.getenv('LLM_CACHE_FRONT_SIZE', '256'))
+
+_lock = threading.Lock()
+_front = OrderedDict()
+_counters = {'front_hits': 0, 'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_unflushed = dict.fromkeys(_counters, 0)
+
+def make_key(content, prompt_version):
+    digest = hashlib.sha256()
+    digest.update(prompt_version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(content.encode('utf-8'))
+    return digest.hexdigest()
+
+def _count(name):
+    _counters[name] += 1
+    _unflushed[name] += 1
+
+def _flush_counters(conn):
+    # Counters are bumped in memory and written out alongside the next
+    # statement that already touches SQLite, so front-cache hits stay free.
+    with _lock:
+        deltas = [(name, value) for name, value in _unflushed.items() if value]
+        for name, _ in deltas:
+            _unflushed[name] = 0
+
+    if deltas:
+        conn.executemany('''
+            INSERT INTO llm_cache_stats (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        ''', deltas)
+
+def _remember(key, value, expires_at):
+    with _lock:
+        _front[key] = (value, expires_at)
+        _front.move_to_end(key)
+        while len(_front) > LLM_CACHE_FRONT_SIZE:
+            _front.popitem(last=False)
+
+def get(key):
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    now = time.time()
+    value = None
+    with _lock:
+        entry = _front.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                _front.move_to_end(key)
+                _count('front_hits')
+                value = entry[0]
+            else:
+                del _front[key]
+
+    if value is not None:
+        metrics.inc('visionflow_cache_requests_total', cache='llm', result='front_hit')
+        return json.loads(value)
+
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is not None and row[1] + LLM_CACHE_TTL > now:
+            conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            with _lock:
+                _count('hits')
+            _remember(key, row[0], row[1] + LLM_CACHE_TTL)
+        else:
+            if row is not None:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            with _lock:
+                _count('misses')
+            row = None
+
+        _flush_counters(conn)
+
+    metrics.inc('visionflow_cache_requests_total', cache='llm', result='hit' if row else 'miss')
+    return json.loads(row[0]) if row else None
+
+def put(key, data):
+    if not LLM_CACHE_ENABLED:
+        return
+
+    now = time.time()
+    value = json.dumps(data)
+    _remember(key, value, now + LLM_CACHE_TTL)
+
+    with transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at)
+            VALUES (?, ?, ?, ?)
+        ''', (key, value, now, now))
+
+        size = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        evicted = 0
+        if size > LLM_CACHE_MAX_ENTRIES:
+            evicted = conn.execute('''
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?
+                )
+            ''', (size - LLM_CACHE_MAX_ENTRIES,)).rowcount
+
+        with _lock:
+            _count('stores')
+            _counters['evictions'] += evicted
+            _unflushed['evictions'] += evicted
+
+        _flush_counters(conn)
+
+def get_stats():
+    with transaction() as conn:
+        _flush_counters(conn)
+        totals = {row[0]: row[1] for row in conn.execute("SELECT name, value FROM llm_cache_stats")}
+        entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    with _lock:
+        worker = dict(_counters)
+        front_entries = len(_front)
+
+    return {
+        'enabled': LLM_CACHE_ENABLED,
+        'entries': entries,
+        'max_entries': LLM_CACHE_MAX_ENTRIES,
+        'ttl_seconds': LLM_CACHE_TTL,
+        'totals': {name: totals.get(name, 0) for name in _counters},
+        'worker': dict(worker, front_entries=front_entries)
+    }
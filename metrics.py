@@ -0,0 +1,257 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from database import transaction
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_RETIRE_SECONDS = float(os.getenv('METRICS_RETIRE_SECONDS', '3600'))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    'visionflow_stage_duration_seconds': (
+        'histogram', 'Time spent in each extraction pipeline stage.', DURATION_BUCKETS
+    ),
+    'visionflow_extractions_total': ('counter', 'Extractions stored, by status and tier.', None),
+    'visionflow_cache_requests_total': ('counter', 'Cache lookups, by cache and result.', None),
+    'visionflow_fetch_bytes_total': ('counter', 'Response body bytes read from target sites.', None),
+    'visionflow_fetch_bytes': ('histogram', 'Body bytes read per page fetch.', SIZE_BUCKETS),
+    'visionflow_prompt_chars': ('histogram', 'Characters sent to the model per call.', SIZE_BUCKETS),
+    'visionflow_response_chars': ('histogram', 'Characters returned by the model per call.', SIZE_BUCKETS),
+    'visionflow_llm_calls_total': ('counter', 'Model call attempts, by outcome.', None),
+    'visionflow_fetch_rejected_total': ('counter', 'Fetches refused by the circuit breaker, by reason.', None),
+    'visionflow_retention_deleted_total': ('counter', 'Rows removed by the retention policy, by kind.', None),
+}
+
+_lock = threading.Lock()
+# Only what was recorded since the last flush; the running totals live in
+# the database.
+_counters = {}
+_histograms = {}
+_instance = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_instance_pid = os.getpid()
+_last_flush = 0.0
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def inc(name, amount=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    _maybe_flush()
+
+def observe(name, value, **labels):
+    if not METRICS_ENABLED:
+        return
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram['counts'][index] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+    _maybe_flush()
+
+@contextmanager
+def timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('visionflow_stage_duration_seconds', time.perf_counter() - started, stage=stage)
+
+def _take_pending():
+    global _counters, _histograms, _instance, _instance_pid
+    with _lock:
+        # A forked worker starts its own row rather than writing into its
+        # parent's.
+        if _instance_pid != os.getpid():
+            _instance = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            _instance_pid = os.getpid()
+        pending = {
+            'counters': _counters,
+            'histograms': _histograms
+        }
+        _counters = {}
+        _histograms = {}
+    return pending
+
+def _restore_pending(pending):
+    with _lock:
+        for key, value in pending['counters'].items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, histogram in pending['histograms'].items():
+            current = _histograms.get(key)
+            if current is None:
+                _histograms[key] = histogram
+            else:
+                current['counts'] = [a + b for a, b in zip(current['counts'], histogram['counts'])]
+                current['sum'] += histogram['sum']
+                current['count'] += histogram['count']
+
+def flush():
+    # Each process adds what it recorded since its last flush to its own
+    # instance row; /metrics sums every instance, so any worker can answer a
+    # scrape. Writing deltas means a row that collect() already folded into
+    # 'retired' simply starts again from zero instead of being counted twice.
+    global _last_flush
+    _last_flush = time.time()
+    pending = _take_pending()
+    try:
+        with transaction() as conn:
+            row = conn.execute(
+                "SELECT snapshot FROM metrics_snapshots WHERE instance = ?", (_instance,)
+            ).fetchone()
+            total = {'counters': {}, 'histograms': {}}
+            if row is not None:
+                _merge(total, json.loads(row[0]))
+            for key, value in pending['counters'].items():
+                total['counters'][key] = total['counters'].get(key, 0) + value
+            _merge_histograms(total, pending['histograms'].items())
+            conn.execute('''
+                INSERT OR REPLACE INTO metrics_snapshots (instance, snapshot, updated_at)
+                VALUES (?, ?, ?)
+            ''', (_instance, _serialize(total), _last_flush))
+    except BaseException:
+        _restore_pending(pending)
+        raise
+
+def _maybe_flush():
+    if time.time() - _last_flush >= METRICS_FLUSH_INTERVAL:
+        try:
+            flush()
+        except Exception:
+            pass
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            pass
+
+def start_flusher():
+    # Flushing on a timer as well as on inc()/observe() keeps an idle worker's
+    # row fresh, so collect() never retires a process that is still running.
+    global _flusher_pid
+    if not METRICS_ENABLED or METRICS_FLUSH_INTERVAL <= 0:
+        return
+
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+def _merge_histograms(total, histograms):
+    for key, source in histograms:
+        histogram = total['histograms'].get(key)
+        if histogram is None:
+            histogram = total['histograms'][key] = {'counts': [0] * len(source['counts']), 'sum': 0.0, 'count': 0}
+        histogram['counts'] = [a + b for a, b in zip(histogram['counts'], source['counts'])]
+        histogram['sum'] += source['sum']
+        histogram['count'] += source['count']
+
+def _merge(total, snapshot):
+    for name, labels, value in snapshot.get('counters', []):
+        key = (name, tuple(tuple(label) for label in labels))
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    _merge_histograms(total, (
+        ((name, tuple(tuple(label) for label in labels)), {'counts': counts, 'sum': total_sum, 'count': count})
+        for name, labels, counts, total_sum, count in snapshot.get('histograms', [])
+    ))
+
+def _serialize(total):
+    return json.dumps({
+        'counters': [[name, list(labels), value] for (name, labels), value in total['counters'].items()],
+        'histograms': [
+            [name, list(labels), histogram['counts'], histogram['sum'], histogram['count']]
+            for (name, labels), histogram in total['histograms'].items()
+        ]
+    })
+
+def collect():
+    flush()
+    total = {'counters': {}, 'histograms': {}}
+    now = time.time()
+    with transaction() as conn:
+        rows = conn.execute("SELECT instance, snapshot, updated_at FROM metrics_snapshots").fetchall()
+
+        # Snapshots from processes that stopped reporting are folded into a
+        # single 'retired' row so counters stay monotonic without the table
+        # growing by one row per worker restart.
+        retired = {'counters': {}, 'histograms': {}}
+        stale = {row[0] for row in rows if row[0] != 'retired' and now - row[2] > METRICS_RETIRE_SECONDS}
+        if stale:
+            for row in rows:
+                if row[0] == 'retired' or row[0] in stale:
+                    _merge(retired, json.loads(row[1]))
+            conn.executemany(
+                "DELETE FROM metrics_snapshots WHERE instance = ?", [(instance,) for instance in stale]
+            )
+            conn.execute('''
+                INSERT OR REPLACE INTO metrics_snapshots (instance, snapshot, updated_at)
+                VALUES ('retired', ?, ?)
+            ''', (_serialize(retired), now))
+
+    for row in rows:
+        _merge(total, json.loads(row[1]))
+    return total
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def render():
+    total = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(total['counters'].items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+            continue
+
+        for (metric, labels), histogram in sorted(total['histograms'].items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, histogram['counts']):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_format_labels(labels, [('le', _format_number(float(bound)))])} {cumulative}"
+                )
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from database import add_extraction
+import blobstore
+import extract
+import metrics
+from extract import finalize_extraction, prepare_url, process_url
+from singleflight import coalesce_key, run_once, run_once_async
+
+BATCH_MAX_URLS = int(os.getenv('BATCH_MAX_URLS', '200'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+BATCH_PER_HOST_LIMIT = int(os.getenv('BATCH_PER_HOST_LIMIT', '2'))
+# How long a page that needs the model waits for others to share its call.
+LLM_BATCH_LINGER = float(os.getenv('LLM_BATCH_LINGER', '0.2'))
+
+def normalize_url(url):
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    return url
+
+def store_result(url, result):
+    # The fetched page is kept as compressed blobs referenced by hash, so it
+    # can be re-processed later without refetching; it is dropped from the
+    # result so it is never serialized into responses or job rows.
+    page = result.pop('page', None)
+    html_blob = text_blob = None
+    if result['success'] and page is not None:
+        with metrics.timer('compress'):
+            html_blob = blobstore.prepare_blob(page.html)
+            text_blob = blobstore.prepare_blob(page.text)
+    
+    with metrics.timer('db_insert'):
+        if result['success']:
+            result['extraction_id'] = add_extraction(
+                url=url,
+                extracted_data=result['data'],
+                raw_html="",
+                status="success",
+                tier=result['tier'],
+                html_blob=html_blob,
+                text_blob=text_blob
+            )
+        else:
+            result['extraction_id'] = add_extraction(
+                url=url,
+                extracted_data={},
+                raw_html="",
+                status="failed"
+            )
+
+    metrics.inc(
+        'visionflow_extractions_total',
+        status='success' if result['success'] else 'failed',
+        tier=result.get('tier') or 'none'
+    )
+    return result
+
+def extract_page(url, page, force_llm=False):
+    return store_result(url, process_url(url, force_llm=force_llm, page=page))
+
+def extraction_key(url, force_llm=False):
+    return coalesce_key(url) + ('#llm' if force_llm else '')
+
+def run_extraction(url, force_llm=False):
+    # Concurrent requests for the same page, from any worker, share a single
+    # fetch, model call and stored row.
+    return run_once(extraction_key(url, force_llm), lambda: store_result(url, process_url(url, force_llm=force_llm)))
+
+async def run_extraction_async(url, force_llm=False):
+    async def work():
+        result = await extract.process_url_async(url, force_llm=force_llm)
+        return await asyncio.to_thread(store_result, url, result)
+    
+    return await run_once_async(extraction_key(url, force_llm), work)
+
+class HostLimiter:
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def get(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return semaphore
+
+# Shared by every batch in the process, so concurrent batches together stay
+# within BATCH_MAX_WORKERS threads and BATCH_PER_HOST_LIMIT requests per host.
+_limiter = HostLimiter(BATCH_PER_HOST_LIMIT)
+_executor = ThreadPoolExecutor(max_workers=max(1, BATCH_MAX_WORKERS), thread_name_prefix='batch')
+
+def _interleave_by_host(items):
+    # Round-robin across hosts so a pool slot is rarely parked waiting on a
+    # per-host semaphore while URLs for other hosts are still queued.
+    buckets = {}
+    for index, url in items:
+        buckets.setdefault(urlparse(url).netloc.lower(), []).append((index, url))
+
+    ordered = []
+    queues = list(buckets.values())
+    while queues:
+        for queue in queues:
+            ordered.append(queue.pop(0))
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+def run_batch(urls, force_llm=False):
+    results = [None] * len(urls)
+
+    pending = []
+    for index, url in enumerate(urls):
+        if not isinstance(url, str) or not url.strip():
+            results[index] = {
+                "url": url,
+                "success": False,
+                "error": "URL must be a non-empty string"
+            }
+        else:
+            pending.append((index, normalize_url(url)))
+
+    def record(index, url, result):
+        if isinstance(result, Exception):
+            results[index] = {
+                "url": url,
+                "success": False,
+                "error": f"Server error: {str(result)}"
+            }
+            return
+
+        entry = {
+            "url": url,
+            "success": result['success'],
+            "extraction_id": result['extraction_id']
+        }
+        if result['success']:
+            entry['data'] = result['data']
+            entry['tier'] = result['tier']
+        else:
+            entry['error'] = result['error']
+        results[index] = entry
+
+    def work(index, url):
+        try:
+            with _limiter.get(url):
+                result = run_extraction(url, force_llm=force_llm)
+        except Exception as e:
+            result = e
+        record(index, url, result)
+
+    ordered = _interleave_by_host(pending)
+    if extract.LLM_BATCH_SIZE > 1:
+        _run_with_llm_batching(ordered, force_llm, record)
+    else:
+        wait([_executor.submit(work, index, url) for index, url in ordered])
+
+    return results
+
+class _LlmBatcher:
+    """Groups the pages of one batch that need the model into
+    extract_data_with_gemini_batch calls. A page waits at most
+    LLM_BATCH_LINGER seconds for its group to fill; the thread that fills
+    the group, or whose wait runs out, makes the call for all of them."""
+
+    def __init__(self, expected):
+        self._cond = threading.Condition()
+        self._queue = []
+        # URLs that have neither queued a page nor finished without one.
+        self._expected = expected
+
+    def skip(self):
+        with self._cond:
+            self._expected -= 1
+            self._cond.notify_all()
+
+    def extract(self, content):
+        slot = {"content": content, "result": None}
+        deadline = time.monotonic() + LLM_BATCH_LINGER
+        with self._cond:
+            self._queue.append(slot)
+            self._expected -= 1
+            self._cond.notify_all()
+            while slot["result"] is None:
+                queued = slot in self._queue
+                remaining = deadline - time.monotonic()
+                if queued and (
+                    len(self._queue) >= extract.LLM_BATCH_SIZE or self._expected <= 0 or remaining <= 0
+                ):
+                    group, self._queue = self._queue, []
+                    break
+                self._cond.wait(remaining if queued else None)
+            else:
+                return slot["result"]
+
+        try:
+            results = extract.extract_data_with_gemini_batch([item["content"] for item in group])
+        except Exception as e:
+            results = [{"success": False, "error": f"Gemini extraction failed: {str(e)}"}] * len(group)
+
+        with self._cond:
+            for item, result in zip(group, results):
+                item["result"] = result
+            self._cond.notify_all()
+        return slot["result"]
+
+def _run_with_llm_batching(ordered, force_llm, record):
+    # Each URL still goes through the coalescing key, so a page another
+    # request or worker is already extracting is shared, not refetched; the
+    # pages that need the model are sent in multi-page prompts instead of
+    # one call per URL.
+    batcher = _LlmBatcher(len(ordered))
+
+    def extract_batched(url, queued):
+        try:
+            with _limiter.get(url):
+                item = prepare_url(url, force_llm=force_llm)
+        except Exception as e:
+            return store_result(url, {"success": False, "error": str(e), "data": None})
+
+        if item["data"] is not None:
+            return store_result(url, finalize_extraction(item, item["data"]))
+
+        queued.append(url)
+        extracted = batcher.extract(item["content"])
+        if extracted["success"]:
+            result = finalize_extraction(item, extracted["data"])
+        else:
+            result = {"success": False, "error": extracted["error"], "data": None}
+        return store_result(url, result)
+
+    def work(index, url):
+        queued = []
+        try:
+            result = run_once(extraction_key(url, force_llm), lambda: extract_batched(url, queued))
+        except Exception as e:
+            result = e
+        finally:
+            if not queued:
+                batcher.skip()
+        record(index, url, result)
+
+    wait([_executor.submit(work, index, url) for index, url in ordered])
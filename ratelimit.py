@@ -0,0 +1,267 @@
+import asyncio
+import os
+import random
+import re
+import time
+import uuid
+
+from database import get_connection, transaction
+
+LLM_RATE_PER_MINUTE = float(os.getenv('LLM_RATE_PER_MINUTE', '15'))
+LLM_BURST = float(os.getenv('LLM_BURST', '5'))
+LLM_MAX_CONCURRENCY = float(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '1.0'))
+LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', '60'))
+LLM_LIMITER_MAX_WAIT = float(os.getenv('LLM_LIMITER_MAX_WAIT', '120'))
+LLM_SLOT_LEASE_SECONDS = float(os.getenv('LLM_SLOT_LEASE_SECONDS', '120'))
+
+LIMITER_NAME = 'gemini'
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'DeadlineExceeded',
+    'InternalServerError', 'GatewayTimeout', 'BadGateway', 'Aborted', 'Unavailable',
+    'ConnectionError', 'Timeout', 'TimeoutError'
+}
+THROTTLE_STATUS = {429}
+THROTTLE_NAMES = {'ResourceExhausted', 'TooManyRequests'}
+
+_RETRY_HINTS = [
+    re.compile(r'retry in ([\d.]+)\s*s', re.IGNORECASE),
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)', re.IGNORECASE),
+    re.compile(r'retry[- ]after:?\s*([\d.]+)', re.IGNORECASE)
+]
+
+# Clock and sleep are module attributes so tests and the benchmark can run
+# the limiter against a fake clock.
+clock = time.time
+sleep = time.sleep
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _status_code(error):
+    code = getattr(error, 'code', None)
+    if callable(code):
+        code = None
+    try:
+        return int(code) if code is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def is_throttle(error):
+    return _status_code(error) in THROTTLE_STATUS or type(error).__name__ in THROTTLE_NAMES
+
+def is_retryable(error):
+    return (
+        _status_code(error) in RETRYABLE_STATUS
+        or type(error).__name__ in RETRYABLE_NAMES
+        or is_throttle(error)
+    )
+
+def retry_hint(error):
+    for attribute in ('retry_after', 'retry_delay'):
+        value = getattr(error, attribute, None)
+        seconds = getattr(value, 'seconds', value)
+        if isinstance(seconds, (int, float)) and seconds > 0:
+            return float(seconds)
+
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    if headers.get('Retry-After', '').replace('.', '', 1).isdigit():
+        return float(headers['Retry-After'])
+
+    message = str(error)
+    for pattern in _RETRY_HINTS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+def backoff_delay(attempt, hint=None):
+    # Full jitter keeps retries from many workers from landing together; a
+    # server-provided hint is treated as a floor.
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+    if hint:
+        delay = max(delay, min(hint, LLM_RETRY_MAX_DELAY) + random.uniform(0, LLM_RETRY_BASE_DELAY))
+    return delay
+
+def _load_state(conn, now):
+    row = conn.execute(
+        "SELECT tokens, updated_at, concurrency, cooldown_until FROM rate_limiter WHERE name = ?",
+        (LIMITER_NAME,)
+    ).fetchone()
+    if row is None:
+        conn.execute('''
+            INSERT INTO rate_limiter (name, tokens, updated_at, concurrency, cooldown_until)
+            VALUES (?, ?, ?, ?, 0)
+        ''', (LIMITER_NAME, LLM_BURST, now, LLM_MAX_CONCURRENCY))
+        return LLM_BURST, now, LLM_MAX_CONCURRENCY, 0.0
+    return row[0], row[1], row[2], row[3]
+
+def _try_acquire(slot_id):
+    # Token bucket, adaptive concurrency window and cooldown all live in the
+    # shared database so every worker process draws from the same budget.
+    now = clock()
+    rate = LLM_RATE_PER_MINUTE / 60.0
+    with transaction() as conn:
+        tokens, updated_at, concurrency, cooldown_until = _load_state(conn, now)
+        tokens = min(LLM_BURST, tokens + max(0.0, now - updated_at) * rate)
+
+        conn.execute(
+            "DELETE FROM rate_limiter_slots WHERE name = ? AND expires_at < ?", (LIMITER_NAME, now)
+        )
+        in_flight = conn.execute(
+            "SELECT COUNT(*) FROM rate_limiter_slots WHERE name = ?", (LIMITER_NAME,)
+        ).fetchone()[0]
+
+        wait = 0.0
+        if cooldown_until > now:
+            wait = cooldown_until - now
+        elif tokens < 1:
+            wait = (1 - tokens) / rate
+        elif in_flight >= max(1, int(concurrency)):
+            wait = 0.25
+        else:
+            tokens -= 1
+            conn.execute('''
+                INSERT INTO rate_limiter_slots (id, name, expires_at) VALUES (?, ?, ?)
+            ''', (slot_id, LIMITER_NAME, now + LLM_SLOT_LEASE_SECONDS))
+
+        conn.execute(
+            "UPDATE rate_limiter SET tokens = ?, updated_at = ? WHERE name = ?",
+            (tokens, now, LIMITER_NAME)
+        )
+    return wait
+
+def acquire():
+    if LLM_RATE_PER_MINUTE <= 0:
+        return None
+
+    slot_id = uuid.uuid4().hex
+    deadline = clock() + LLM_LIMITER_MAX_WAIT
+    while True:
+        wait = _try_acquire(slot_id)
+        if not wait:
+            return slot_id
+        if clock() + wait > deadline:
+            raise RateLimitExceeded(
+                f"Gemini rate limit: no capacity within {int(LLM_LIMITER_MAX_WAIT)}s",
+                retry_after=wait
+            )
+        sleep(min(wait, 5.0))
+
+def release(slot_id, throttled=False, retry_after=None):
+    # Additive increase on success, multiplicative decrease on a 429.
+    if slot_id is None:
+        return
+
+    now = clock()
+    with transaction() as conn:
+        conn.execute("DELETE FROM rate_limiter_slots WHERE id = ?", (slot_id,))
+        _, _, concurrency, cooldown_until = _load_state(conn, now)
+        if throttled:
+            concurrency = max(1.0, concurrency / 2)
+            cooldown_until = max(cooldown_until, now + (retry_after or LLM_RETRY_BASE_DELAY))
+            conn.execute('''
+                UPDATE rate_limiter SET concurrency = ?, cooldown_until = ?, tokens = 0, updated_at = ?
+                WHERE name = ?
+            ''', (concurrency, cooldown_until, now, LIMITER_NAME))
+        else:
+            concurrency = min(LLM_MAX_CONCURRENCY, concurrency + 1.0 / concurrency)
+            conn.execute(
+                "UPDATE rate_limiter SET concurrency = ? WHERE name = ?",
+                (concurrency, LIMITER_NAME)
+            )
+
+def call_with_retry(fn):
+    attempt = 0
+    while True:
+        slot_id = acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            throttled = is_throttle(e)
+            hint = retry_hint(e)
+            release(slot_id, throttled=throttled, retry_after=hint)
+
+            if not is_retryable(e) or attempt >= LLM_MAX_RETRIES:
+                if throttled:
+                    raise RateLimitExceeded(
+                        f"Gemini quota exceeded after {attempt + 1} attempts: {str(e)}",
+                        retry_after=hint
+                    )
+                raise
+            sleep(backoff_delay(attempt, hint))
+            attempt += 1
+            continue
+
+        release(slot_id)
+        return result
+
+async def acquire_async():
+    # Same shared budget as acquire(); the database work runs in a thread and
+    # waiting does not block the event loop.
+    if LLM_RATE_PER_MINUTE <= 0:
+        return None
+
+    slot_id = uuid.uuid4().hex
+    deadline = clock() + LLM_LIMITER_MAX_WAIT
+    while True:
+        wait = await asyncio.to_thread(_try_acquire, slot_id)
+        if not wait:
+            return slot_id
+        if clock() + wait > deadline:
+            raise RateLimitExceeded(
+                f"Gemini rate limit: no capacity within {int(LLM_LIMITER_MAX_WAIT)}s",
+                retry_after=wait
+            )
+        await asyncio.sleep(min(wait, 5.0))
+
+async def call_with_retry_async(fn):
+    attempt = 0
+    while True:
+        slot_id = await acquire_async()
+        try:
+            result = await fn()
+        except Exception as e:
+            throttled = is_throttle(e)
+            hint = retry_hint(e)
+            await asyncio.to_thread(release, slot_id, throttled, hint)
+
+            if not is_retryable(e) or attempt >= LLM_MAX_RETRIES:
+                if throttled:
+                    raise RateLimitExceeded(
+                        f"Gemini quota exceeded after {attempt + 1} attempts: {str(e)}",
+                        retry_after=hint
+                    )
+                raise
+            await asyncio.sleep(backoff_delay(attempt, hint))
+            attempt += 1
+            continue
+
+        await asyncio.to_thread(release, slot_id)
+        return result
+
+def get_state():
+    now = clock()
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT tokens, updated_at, concurrency, cooldown_until FROM rate_limiter WHERE name = ?",
+        (LIMITER_NAME,)
+    ).fetchone()
+    in_flight = conn.execute(
+        "SELECT COUNT(*) FROM rate_limiter_slots WHERE name = ? AND expires_at >= ?",
+        (LIMITER_NAME, now)
+    ).fetchone()[0]
+    if row is None:
+        return {'tokens': LLM_BURST, 'concurrency': LLM_MAX_CONCURRENCY, 'in_flight': 0, 'cooldown_seconds': 0}
+    return {
+        'tokens': min(LLM_BURST, row[0] + max(0.0, now - row[1]) * LLM_RATE_PER_MINUTE / 60.0),
+        'concurrency': row[2],
+        'in_flight': in_flight,
+        'cooldown_seconds': max(0.0, row[3] - now)
+    }
@@ -0,0 +1,172 @@
+import os
+import random
+import threading
+import time
+
+import metrics
+from database import get_connection, transaction
+
+RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', '1') != '0'
+# Age in days after which failed rows, and successful rows that are no longer
+# the latest for their URL, are deleted; 0 keeps them forever.
+RETENTION_FAILED_DAYS = float(os.getenv('RETENTION_FAILED_DAYS', '7'))
+RETENTION_SUPERSEDED_DAYS = float(os.getenv('RETENTION_SUPERSEDED_DAYS', '30'))
+# Change log entries kept for /data/stream and /data/changes clients to
+# resume from.
+RETENTION_CHANGES_KEEP = int(os.getenv('RETENTION_CHANGES_KEEP', '10000'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '200'))
+RETENTION_BATCH_PAUSE = float(os.getenv('RETENTION_BATCH_PAUSE', '0.05'))
+RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', '500'))
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '3600'))
+RETENTION_CHECK_INTERVAL = int(os.getenv('RETENTION_CHECK_INTERVAL', '60'))
+
+PRUNE_CONDITIONS = {
+    'failed': "status = 'failed' AND extracted_at < datetime('now', ?)",
+    'superseded': '''
+        status = 'success' AND extracted_at < datetime('now', ?)
+        AND id NOT IN (SELECT extraction_id FROM latest_extractions)
+    '''
+}
+
+_start_lock = threading.Lock()
+_started_pid = None
+
+def _prune_batch(condition, age):
+    # Each batch is its own short write transaction, so extractions being
+    # stored meanwhile only ever wait for one batch.
+    with transaction() as conn:
+        rows = conn.execute(f'''
+            SELECT id, html_hash, text_hash FROM extractions
+            WHERE {condition}
+            ORDER BY id
+            LIMIT ?
+        ''', (age, RETENTION_BATCH_SIZE)).fetchall()
+        if not rows:
+            return 0, 0
+
+        conn.execute(
+            f"DELETE FROM extractions WHERE id IN ({', '.join('?' * len(rows))})",
+            [row[0] for row in rows]
+        )
+
+        # Pages are shared between rows with identical content; a blob goes
+        # only once nothing references it.
+        blobs = 0
+        for blob_hash in {value for row in rows for value in row[1:] if value}:
+            blobs += conn.execute('''
+                DELETE FROM page_blobs
+                WHERE hash = ?
+                AND NOT EXISTS (SELECT 1 FROM extractions WHERE html_hash = ?)
+                AND NOT EXISTS (SELECT 1 FROM extractions WHERE text_hash = ?)
+            ''', (blob_hash, blob_hash, blob_hash)).rowcount
+    return len(rows), blobs
+
+def _prune_changes_batch():
+    # The newest entries are always kept, so MAX(seq), and with it the /data
+    # ETag and clients' Last-Event-ID, keeps moving forward.
+    with transaction() as conn:
+        return conn.execute('''
+            DELETE FROM extraction_changes
+            WHERE seq IN (
+                SELECT seq FROM extraction_changes
+                WHERE seq <= (SELECT MAX(seq) FROM extraction_changes) - ?
+                ORDER BY seq
+                LIMIT ?
+            )
+        ''', (RETENTION_CHANGES_KEEP, RETENTION_BATCH_SIZE)).rowcount
+
+def enable_incremental_vacuum():
+    # Databases created before retention existed need one full VACUUM to
+    # switch modes; it rewrites the file once and blocks writers meanwhile,
+    # so it is only run by hand (scripts/enable_incremental_vacuum.py).
+    conn = get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+def _incremental_vacuum():
+    # Returns free pages to the filesystem a few hundred at a time instead of
+    # holding the write lock for a full VACUUM. A database that was never
+    # converted keeps its free pages for reuse.
+    conn = get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if not free:
+        return 0
+    conn.execute(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})").fetchall()
+    return free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def run_retention():
+    counts = {'failed': 0, 'superseded': 0, 'blobs': 0, 'changes': 0, 'vacuumed_pages': 0}
+    for kind, days in (('failed', RETENTION_FAILED_DAYS), ('superseded', RETENTION_SUPERSEDED_DAYS)):
+        if days <= 0:
+            continue
+        while True:
+            deleted, blobs = _prune_batch(PRUNE_CONDITIONS[kind], f"-{days} days")
+            counts[kind] += deleted
+            counts['blobs'] += blobs
+            counts['vacuumed_pages'] += _incremental_vacuum()
+            if deleted < RETENTION_BATCH_SIZE:
+                break
+            time.sleep(RETENTION_BATCH_PAUSE)
+
+    if RETENTION_CHANGES_KEEP > 0:
+        while True:
+            deleted = _prune_changes_batch()
+            counts['changes'] += deleted
+            if deleted < RETENTION_BATCH_SIZE:
+                break
+            time.sleep(RETENTION_BATCH_PAUSE)
+
+    while True:
+        vacuumed = _incremental_vacuum()
+        counts['vacuumed_pages'] += vacuumed
+        if not vacuumed:
+            break
+        time.sleep(RETENTION_BATCH_PAUSE)
+
+    for kind in ('failed', 'superseded', 'blobs', 'changes'):
+        if counts[kind]:
+            metrics.inc('visionflow_retention_deleted_total', counts[kind], kind=kind)
+    return counts
+
+def _claim_run(now):
+    # Every worker checks, but only the one that moves ran_at forward runs.
+    with transaction() as conn:
+        return conn.execute('''
+            INSERT INTO maintenance (name, ran_at) VALUES ('retention', ?)
+            ON CONFLICT (name) DO UPDATE SET ran_at = excluded.ran_at
+            WHERE maintenance.ran_at <= ?
+        ''', (now, now - RETENTION_INTERVAL)).rowcount == 1
+
+def _retention_loop():
+    while True:
+        # Jittered so workers started together do not all check at once; the
+        # first check is a full interval after startup, off the cold path.
+        time.sleep(RETENTION_CHECK_INTERVAL * random.uniform(0.8, 1.2))
+        try:
+            if not _claim_run(time.time()):
+                continue
+            counts = run_retention()
+            if any(counts.values()):
+                print(
+                    f"🧹 Retention: removed {counts['failed']} failed and {counts['superseded']} superseded rows, "
+                    f"{counts['blobs']} page blobs and {counts['changes']} change log entries; "
+                    f"returned {counts['vacuumed_pages']} pages"
+                )
+        except Exception as e:
+            print(f"⚠️ Retention run failed: {e}")
+
+def start_retention():
+    global _started_pid
+    if not RETENTION_ENABLED:
+        return
+
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        threading.Thread(target=_retention_loop, name="retention", daemon=True).start()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+VisionFlow Backfill
+Re-runs extraction over rows already stored in extractions.db, e.g. after a
+prompt change. Stored pages are re-parsed in a process pool, model calls go
+through a bounded thread pool, and results are written in batched
+transactions together with a checkpoint, so an interrupted run resumes where
+it stopped when the same command is run again.
+
+Usage:
+    python scripts/backfill.py --status failed
+    python scripts/backfill.py --since 2026-01-01 --url-pattern '%/pricing%' --llm-workers 8
+    python scripts/backfill.py --status success --force-llm --offline --dry-run
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import blobstore
+import database
+import extract
+import metrics
+import ratelimit
+from database import get_connection, init_db, transaction, update_extraction
+
+def build_filters(args):
+    """Filters that select the rows to re-extract; they also identify the run"""
+    return {
+        "since": args.since,
+        "until": args.until,
+        "status": args.status,
+        "url_pattern": args.url_pattern,
+        "force_llm": args.force_llm,
+        "offline": args.offline,
+        "dry_run": args.dry_run,
+        "prompt_version": extract.PROMPT_VERSION
+    }
+
+def filter_clause(filters):
+    """SQL conditions and parameters for the row filters"""
+    clauses = []
+    params = []
+    if filters["since"]:
+        clauses.append("extracted_at >= ?")
+        params.append(filters["since"])
+    if filters["until"]:
+        clauses.append("extracted_at < ?")
+        params.append(filters["until"])
+    if filters["status"]:
+        clauses.append("status = ?")
+        params.append(filters["status"])
+    if filters["url_pattern"]:
+        clauses.append("url LIKE ?")
+        params.append(filters["url_pattern"])
+    return ''.join(f" AND {clause}" for clause in clauses), params
+
+def start_run(run_id, filters, restart=False):
+    """Create the checkpoint row for a run, or pick up an existing one"""
+    with transaction() as conn:
+        if restart:
+            conn.execute("DELETE FROM backfill_runs WHERE id = ?", (run_id,))
+            conn.execute("DELETE FROM backfill_failures WHERE run_id = ?", (run_id,))
+
+        row = conn.execute("SELECT * FROM backfill_runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            # Rows added after the run starts are new extractions, not history.
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM extractions").fetchone()[0]
+            conn.execute('''
+                INSERT INTO backfill_runs (id, filters, max_id) VALUES (?, ?, ?)
+            ''', (run_id, json.dumps(filters, sort_keys=True), max_id))
+            row = conn.execute("SELECT * FROM backfill_runs WHERE id = ?", (run_id,)).fetchone()
+    return dict(row)
+
+def count_remaining(run, filters):
+    clause, params = filter_clause(filters)
+    return get_connection().execute(
+        f"SELECT COUNT(*) FROM extractions WHERE id > ? AND id <= ?{clause}",
+        [run["last_id"], run["max_id"]] + params
+    ).fetchone()[0]
+
+def count_failures(run_id, conn=None):
+    return (conn or get_connection()).execute('''
+        SELECT COUNT(*) FROM backfill_failures f JOIN extractions e ON e.id = f.extraction_id
+        WHERE f.run_id = ?
+    ''', (run_id,)).fetchone()[0]
+
+def next_retry_chunk(run_id, after_id, size):
+    """Rows that failed on an earlier pass of this run"""
+    rows = get_connection().execute('''
+        SELECT e.id, e.url, e.html_hash, e.text_hash
+        FROM backfill_failures f JOIN extractions e ON e.id = f.extraction_id
+        WHERE f.run_id = ? AND e.id > ?
+        ORDER BY e.id
+        LIMIT ?
+    ''', (run_id, after_id, size)).fetchall()
+    return [dict(row) for row in rows]
+
+def next_chunk(after_id, max_id, filters, size):
+    clause, params = filter_clause(filters)
+    rows = get_connection().execute(f'''
+        SELECT id, url, html_hash, text_hash FROM extractions
+        WHERE id > ? AND id <= ?{clause}
+        ORDER BY id
+        LIMIT ?
+    ''', [after_id, max_id] + params + [size]).fetchall()
+    return [dict(row) for row in rows]
+
+def init_parse_worker(database_path):
+    """Point pool processes at the same database; their timings are not reported"""
+    database.DATABASE = database_path
+    metrics.METRICS_ENABLED = False
+
+def parse_stored(html_hash, text_hash, force_llm):
+    """Runs in a pool process: decompress a stored page and prepare it for extraction"""
+    try:
+        page = extract.Page(blobstore.get_blob(html_hash) or '', blobstore.get_blob(text_hash) or '')
+        prepared = extract.prepare_page(page, force_llm=force_llm)
+    except Exception as e:
+        return {"error": str(e)}
+    # Only the text length is needed back in the parent.
+    prepared["page"] = extract.Page('', page.text)
+    return prepared
+
+def submit_parses(pool, rows, filters):
+    """Start parsing every stored page in a chunk; rows without one are left for refetching"""
+    futures = {}
+    for row in rows:
+        if row["html_hash"]:
+            futures[row["id"]] = pool.submit(parse_stored, row["html_hash"], row["text_hash"], filters["force_llm"])
+    return futures
+
+def extract_row(row, parse_future, filters):
+    """Runs in the LLM thread pool: finish one row, refetching it if nothing was stored"""
+    html_blob = text_blob = None
+    try:
+        if parse_future is not None:
+            prepared = parse_future.result()
+            if "error" in prepared:
+                return {"status": "failed", "error": prepared["error"]}
+        elif filters["offline"]:
+            return {"status": "skipped"}
+        else:
+            prepared = extract.prepare_url(row["url"], force_llm=filters["force_llm"])
+            html_blob = blobstore.prepare_blob(prepared["page"].html)
+            text_blob = blobstore.prepare_blob(prepared["page"].text)
+
+        data = prepared["data"]
+        if data is None:
+            data = extract.extract_data_with_gemini(prepared["content"])
+        result = extract.finalize_extraction(prepared, data)
+    except ratelimit.RateLimitExceeded as e:
+        return {"status": "rate_limited", "error": str(e)}
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+
+    return {
+        "status": "updated",
+        "data": result["data"],
+        "tier": result["tier"],
+        "html_blob": html_blob,
+        "text_blob": text_blob
+    }
+
+def write_chunk(run, rows, outcomes, dry_run=False):
+    """Apply one chunk's results and advance the checkpoint in a single transaction"""
+    # If the model quota ran out, stop just before the first throttled row so
+    # that a resumed run picks it up again.
+    stop_at = next((row["id"] for row in rows if outcomes[row["id"]]["status"] == "rate_limited"), None)
+    done = [row for row in rows if stop_at is None or row["id"] < stop_at]
+
+    # Failed rows are recorded rather than holding back the checkpoint, and a
+    # retried row that now succeeds is cleared; `failed` is what is left.
+    counts = {"updated": 0, "failed": 0, "skipped": 0}
+    processed = sum(1 for row in done if row["id"] > run["last_id"])
+    last_error = None
+    with transaction() as conn:
+        for row in done:
+            outcome = outcomes[row["id"]]
+            counts[outcome["status"]] += 1
+            if outcome["status"] == "failed":
+                last_error = f"{row['url']}: {outcome['error']}"
+                conn.execute('''
+                    INSERT OR REPLACE INTO backfill_failures (run_id, extraction_id, error) VALUES (?, ?, ?)
+                ''', (run["id"], row["id"], outcome["error"]))
+                continue
+            conn.execute(
+                "DELETE FROM backfill_failures WHERE run_id = ? AND extraction_id = ?", (run["id"], row["id"])
+            )
+            if outcome["status"] == "updated" and not dry_run:
+                update_extraction(
+                    conn, row["id"], outcome["data"], "success", outcome["tier"],
+                    outcome["html_blob"], outcome["text_blob"]
+                )
+
+        last_id = max([run["last_id"]] + [row["id"] for row in done])
+        failed = count_failures(run["id"], conn)
+        conn.execute('''
+            UPDATE backfill_runs
+            SET last_id = ?, processed = processed + ?, updated = updated + ?, failed = ?,
+                skipped = skipped + ?, last_error = COALESCE(?, last_error)
+            WHERE id = ?
+        ''', (last_id, processed, counts["updated"], failed, counts["skipped"], last_error, run["id"]))
+
+    run["last_id"] = last_id
+    run["updated"] += counts["updated"]
+    run["skipped"] += counts["skipped"]
+    run["failed"] = failed
+    run["processed"] += processed
+    if stop_at is not None:
+        return outcomes[stop_at]["error"]
+    return None
+
+def process_chunks(run, filters, args, pools, chunk_after, after_id, progress):
+    """Extract rows chunk by chunk until there are none left or the quota runs out"""
+    parse_pool, llm_pool = pools
+    rows = chunk_after(after_id)
+    parses = submit_parses(parse_pool, rows, filters)
+    while rows:
+        # Parsing of the next chunk overlaps with this chunk's model calls.
+        next_rows = chunk_after(rows[-1]["id"])
+        next_parses = submit_parses(parse_pool, next_rows, filters)
+
+        futures = {
+            row["id"]: llm_pool.submit(extract_row, row, parses.get(row["id"]), filters)
+            for row in rows
+        }
+        outcomes = {row_id: future.result() for row_id, future in futures.items()}
+        stopped = write_chunk(run, rows, outcomes, dry_run=args.dry_run)
+        progress(len(rows))
+        if stopped:
+            for future in next_parses.values():
+                future.cancel()
+            return stopped
+        rows, parses = next_rows, next_parses
+    return None
+
+def main():
+    """Main backfill runner"""
+    parser = argparse.ArgumentParser(description="Re-run extraction over stored rows")
+    parser.add_argument('--db', default=database.DATABASE, help="Path to the SQLite database")
+    parser.add_argument('--since', help="Only rows extracted at or after this date (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument('--until', help="Only rows extracted before this date")
+    parser.add_argument('--status', help="Only rows with this status, e.g. failed")
+    parser.add_argument('--url-pattern', help="Only URLs matching this SQL LIKE pattern, e.g. '%%/pricing%%'")
+    parser.add_argument('--force-llm', action='store_true', help="Skip the structured-data tier")
+    parser.add_argument('--offline', action='store_true', help="Skip rows with no stored page instead of refetching")
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 2, help="Processes for HTML parsing")
+    parser.add_argument('--llm-workers', type=int, default=4, help="Threads for model calls and refetches")
+    parser.add_argument('--batch-size', type=int, default=50, help="Rows per write transaction")
+    parser.add_argument('--run-id', help="Checkpoint name (defaults to a hash of the filters)")
+    parser.add_argument('--restart', action='store_true', help="Discard the checkpoint and start over")
+    parser.add_argument('--dry-run', action='store_true', help="Extract but do not update rows")
+    args = parser.parse_args()
+
+    # Every row the structured tier cannot answer needs the model; without
+    # one they would all be recorded as failed.
+    if extract.get_model() is None:
+        print("❌ GOOGLE_AI_API_KEY is not set; the backfill needs the model")
+        sys.exit(1)
+
+    database.DATABASE = os.path.abspath(args.db)
+    init_db()
+
+    filters = build_filters(args)
+    run_id = args.run_id or hashlib.sha256(json.dumps(filters, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    run = start_run(run_id, filters, restart=args.restart)
+    if run["finished_at"]:
+        print(f"✅ Backfill {run_id} already finished at {run['finished_at']} (use --restart to run it again)")
+        return
+
+    remaining = count_remaining(run, filters)
+    run["failed"] = retries = count_failures(run_id)
+    print("=" * 60)
+    print(f"🔁 Backfill {run_id}: {remaining} rows to go, {retries} to retry, {run['processed']} already done")
+    print("=" * 60)
+
+    started = time.time()
+    handled = [0]
+
+    def progress(count):
+        handled[0] += count
+        elapsed = time.time() - started
+        print(
+            f"  {run['processed']} processed (updated {run['updated']}, failed {run['failed']}, "
+            f"skipped {run['skipped']}), {handled[0] / elapsed:.1f} rows/s"
+        )
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, args.parse_workers),
+        initializer=init_parse_worker,
+        initargs=(database.DATABASE,)
+    ) as parse_pool, ThreadPoolExecutor(max_workers=max(1, args.llm_workers)) as llm_pool:
+        pools = (parse_pool, llm_pool)
+        # Rows that failed on an earlier run are retried before moving on.
+        stopped = process_chunks(
+            run, filters, args, pools,
+            lambda after_id: next_retry_chunk(run_id, after_id, args.batch_size), 0, progress
+        ) or process_chunks(
+            run, filters, args, pools,
+            lambda after_id: next_chunk(after_id, run["max_id"], filters, args.batch_size), run["last_id"], progress
+        )
+
+    if stopped:
+        print(f"⏸️ Stopped on the model quota: {stopped}")
+        print("   Run the same command again to resume from the checkpoint.")
+        sys.exit(1)
+
+    last_error = get_connection().execute('SELECT last_error FROM backfill_runs WHERE id = ?', (run_id,)).fetchone()[0]
+    if run["failed"]:
+        print(f"⚠️ Backfill {run_id}: {run['failed']} rows failed (last error: {last_error})")
+        print("   Run the same command again to retry them.")
+        sys.exit(1)
+
+    with transaction() as conn:
+        conn.execute("UPDATE backfill_runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?", (run_id,))
+    print(f"✅ Backfill {run_id} finished: updated {run['updated']}, skipped {run['skipped']}")
+
+if __name__ == '__main__':
+    main()
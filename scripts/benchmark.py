@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+VisionFlow Offline Benchmark
+Runs the extraction pipeline against a local HTML corpus and a fake model,
+so performance changes can be measured without an API key or network access.
+
+Usage:
+    python scripts/benchmark.py --concurrency 8 --requests 200
+    python scripts/benchmark.py --corpus-dir saved_pages/ --output after.json --compare before.json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process, Queue
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGE_SIZES = {'small': 5_000, 'medium': 50_000, 'large': 500_000, 'huge': 3_000_000}
+
+FILLER = (
+    "Our platform helps teams ship faster with fewer meetings and more automation. "
+    "Trusted by thousands of companies worldwide. Read our blog, careers and press pages. "
+)
+
+def build_page(name, size, structured):
+    """Build a synthetic product page of roughly `size` bytes"""
+    json_ld = ''
+    if structured:
+        json_ld = '<script type="application/ld+json">' + json.dumps({
+            "@context": "https://schema.org",
+            "@type": "Product",
+            "name": f"{name.title()} Cloud",
+            "description": f"{name.title()} Cloud is a hosted workflow platform for growing teams.",
+            "offers": [
+                {"@type": "Offer", "name": "Starter", "price": "0", "priceCurrency": "USD"},
+                {"@type": "Offer", "name": "Pro", "price": "29", "priceCurrency": "USD"}
+            ]
+        }) + '</script>'
+
+    head = (
+        f'<html><head><title>{name.title()} - Pricing</title>'
+        f'<meta name="description" content="{name.title()} pricing and features">{json_ld}'
+        '<style>body { font-family: sans-serif; }</style></head><body>'
+        '<nav><a href="/">Home</a><a href="/pricing">Pricing</a></nav>'
+        f'<h1>{name.title()}</h1><p>The fastest way to automate your team workflows.</p>'
+    )
+    features = '<h2>Features</h2><ul>' + ''.join(
+        f'<li>Feature {i}: automated reporting and integrations</li>' for i in range(12)
+    ) + '</ul>'
+    pricing = (
+        '<h2>Pricing</h2><div class="pricing">'
+        '<div class="plan"><h3>Starter</h3><p>$0/month</p></div>'
+        '<div class="plan"><h3>Pro</h3><p>$29/month per user</p></div>'
+        '<div class="plan"><h3>Enterprise</h3><p>Contact sales</p></div></div>'
+    )
+    tail = '<footer>Copyright VisionFlow Benchmarks</footer></body></html>'
+
+    # Pricing sits after the filler, the way it does on real marketing pages.
+    padding = max(0, size - len(head) - len(features) - len(pricing) - len(tail))
+    filler = ''.join(
+        f'<div class="section"><p>{FILLER}</p></div>' for _ in range(padding // (len(FILLER) + 40) + 1)
+    )
+    return head + features + filler + pricing + tail
+
+def build_corpus(corpus_dir=None):
+    """Synthetic pages of every size, with and without structured data, plus any saved pages"""
+    pages = {}
+    for size_name, size in PAGE_SIZES.items():
+        pages[f'/{size_name}/plain'] = build_page(f'{size_name} plain', size, structured=False)
+        pages[f'/{size_name}/structured'] = build_page(f'{size_name} structured', size, structured=True)
+
+    if corpus_dir:
+        for filename in sorted(os.listdir(corpus_dir)):
+            if filename.endswith(('.html', '.htm')):
+                with open(os.path.join(corpus_dir, filename), encoding='utf-8', errors='replace') as f:
+                    pages[f'/saved/{filename}'] = f.read()
+    return pages
+
+def serve_corpus(pages, port_queue):
+    """Serve the corpus from a separate process so it does not compete for our GIL"""
+    encoded = {path: body.encode('utf-8') for path, body in pages.items()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = encoded.get(self.path.split('?', 1)[0])
+            if body is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # Streaming fetches hang up once FETCH_MAX_BYTES is read.
+            pass
+
+    server = Server(('127.0.0.1', 0), Handler)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class ResourceExhausted(Exception):
+    """Looks like the Gemini quota error to the retry logic"""
+    code = 429
+
+class FakeModel:
+    """Deterministic stand-in for the Gemini model with configurable latency and 429s"""
+
+    def __init__(self, latency=0.2, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, label):
+        digest = hashlib.sha256(label.encode('utf-8')).hexdigest()[:8]
+        return {
+            "name": f"Product {digest}",
+            "description": "A hosted workflow platform for growing teams.",
+            "features": ["Automated reporting", "Integrations", "Audit log"],
+            "pricing": "Starter $0/month, Pro $29/month per user"
+        }
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        rng = random.Random(f"{self.seed}-{call}")
+
+        time.sleep(self.latency)
+        if rng.random() < self.error_rate:
+            raise ResourceExhausted("429 Quota exceeded. Please retry in 1s.")
+
+        page_ids = re.findall(r'=== PAGE (\w+) ===', prompt)
+        if page_ids:
+            return FakeResponse(json.dumps([
+                dict(self._answer(prompt + page_id), page_id=page_id) for page_id in page_ids
+            ]))
+        return FakeResponse(json.dumps(self._answer(prompt)))
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def peak_rss_mb():
+    """Peak resident set size of this process, where the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def run_scenario(name, fn, jobs, concurrency):
+    """Run fn over jobs with a thread pool and summarize latency and throughput"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(job):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = fn(job)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, jobs))
+    seconds = time.perf_counter() - started
+
+    summary = {
+        "requests": len(jobs),
+        "errors": errors,
+        "concurrency": concurrency,
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(jobs) / seconds, 2) if seconds else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None
+    }
+    print(
+        f"  {name:<12} {summary['throughput_rps']:>8} req/s  "
+        f"p50 {summary['p50_ms']}ms  p95 {summary['p95_ms']}ms  p99 {summary['p99_ms']}ms  "
+        f"errors {errors}/{len(jobs)}"
+    )
+    return summary
+
+def git_commit():
+    """Current commit hash, so saved results can be lined up against history"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def compare(results, baseline_path):
+    """Print the change in throughput and latency against a previous results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    print(f"\n📊 Compared with {baseline_path} ({baseline.get('commit') or 'unknown commit'}):")
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            before, after = previous.get(metric), current.get(metric)
+            if before and after:
+                print(f"  {name:<12} {metric:<15} {before:>10} -> {after:<10} ({(after - before) / before:+.1%})")
+
+def main():
+    """Main benchmark runner"""
+    parser = argparse.ArgumentParser(description="Benchmark VisionFlow offline with a fake model")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent requests per scenario")
+    parser.add_argument('--requests', type=int, default=100, help="Requests per scenario")
+    parser.add_argument('--scenarios', default='process_url,extract,data',
+                        help="Comma-separated subset of process_url, extract, data")
+    parser.add_argument('--sizes', default=','.join(PAGE_SIZES),
+                        help="Comma-separated synthetic page sizes to include")
+    parser.add_argument('--corpus-dir', help="Directory of saved .html pages to add to the corpus")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Fake model latency in seconds")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help="Fraction of fake model calls that return 429")
+    parser.add_argument('--rate-per-minute', type=float,
+                        help="LLM_RATE_PER_MINUTE for the limiter (default: off, or 6000 with --llm-error-rate)")
+    parser.add_argument('--warm', action='store_true',
+                        help="Keep the LLM cache, page cache and request coalescing enabled")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark-results.json', help="Where to save results as JSON")
+    parser.add_argument('--compare', help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    # Everything runs against a throwaway database. The limiter is off unless
+    # the fake model is injecting 429s; then a rate high enough not to be the
+    # bottleneck still runs every call through the token bucket, the
+    # concurrency window and the shared cooldown.
+    workdir = tempfile.mkdtemp(prefix='visionflow-bench-')
+    os.chdir(workdir)
+    if args.rate_per_minute is not None:
+        os.environ['LLM_RATE_PER_MINUTE'] = str(args.rate_per_minute)
+    else:
+        os.environ.setdefault('LLM_RATE_PER_MINUTE', '6000' if args.llm_error_rate > 0 else '0')
+    os.environ.setdefault('JOB_WORKERS', '0')
+    os.environ.setdefault('LLM_RETRY_BASE_DELAY', '0.05')
+    sys.path.insert(0, ROOT)
+
+    corpus = build_corpus(args.corpus_dir)
+    sizes = set(args.sizes.split(','))
+    paths = [path for path in corpus if path.startswith('/saved/') or path.split('/')[1] in sizes]
+
+    port_queue = Queue()
+    server = Process(target=serve_corpus, args=(corpus, port_queue), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+
+    import extract
+    import http_client
+    import llm_cache
+    import singleflight
+    import app as app_module
+
+    extract.model = FakeModel(latency=args.llm_latency, error_rate=args.llm_error_rate, seed=args.seed)
+    if not args.warm:
+        llm_cache.LLM_CACHE_ENABLED = False
+        http_client.PAGE_CACHE_ENABLED = False
+        singleflight.COALESCE_ENABLED = False
+
+    client = app_module.app.test_client()
+    rng = random.Random(args.seed)
+    jobs = [f"{base_url}{rng.choice(paths)}?r={i}" for i in range(args.requests)]
+
+    scenarios = {
+        'process_url': lambda url: extract.process_url(url)['success'],
+        'extract': lambda url: client.post('/extract', json={"url": url}).status_code == 200,
+        'data': lambda _: client.get('/data?limit=50').status_code == 200
+    }
+
+    print("=" * 60)
+    print(f"⏱️  VisionFlow benchmark: {len(paths)} pages, {args.requests} requests, concurrency {args.concurrency}")
+    print("=" * 60)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": sys.version.split()[0],
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "pages": paths,
+            "llm_latency": args.llm_latency,
+            "llm_error_rate": args.llm_error_rate,
+            "warm": args.warm,
+            "seed": args.seed
+        },
+        "scenarios": {}
+    }
+
+    try:
+        for name in args.scenarios.split(','):
+            name = name.strip()
+            if name not in scenarios:
+                print(f"⚠️ Unknown scenario: {name}")
+                continue
+            results["scenarios"][name] = run_scenario(name, scenarios[name], jobs, args.concurrency)
+    finally:
+        server.terminate()
+
+    results["llm_calls"] = extract.model.calls
+    results["peak_rss_mb"] = peak_rss_mb()
+    print(f"\n  model calls {results['llm_calls']}, peak RSS {results['peak_rss_mb']} MB")
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results saved to {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+if __name__ == '__main__':
+    main()
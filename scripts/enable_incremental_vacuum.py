@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+VisionFlow: enable incremental vacuum
+Switches a database created before retention existed to incremental vacuum,
+so the pages retention frees are returned to the filesystem. This runs one
+full VACUUM, which rewrites the whole file and blocks every writer until it
+finishes; run it during a maintenance window. Databases created since are
+already in this mode.
+
+Usage:
+    python scripts/enable_incremental_vacuum.py
+    python scripts/enable_incremental_vacuum.py --db /data/extractions.db
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database
+from retention import enable_incremental_vacuum
+
+def main():
+    """Convert the database in place"""
+    parser = argparse.ArgumentParser(description="Switch the database to incremental vacuum")
+    parser.add_argument('--db', default=database.DATABASE, help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    database.DATABASE = os.path.abspath(args.db)
+    database.init_db()
+
+    conn = database.get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        print("✅ Already using incremental vacuum; nothing to do")
+        return
+
+    size = os.path.getsize(database.DATABASE)
+    print(f"🧹 Vacuuming {database.DATABASE} ({size / 1024 / 1024:.1f} MB); writers wait until this finishes")
+    started = time.time()
+    enable_incremental_vacuum()
+    # In WAL mode the rewritten pages reach the main file at a checkpoint.
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    size = os.path.getsize(database.DATABASE)
+    print(f"✅ Switched to incremental vacuum in {time.time() - started:.1f}s ({size / 1024 / 1024:.1f} MB)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import html
+import os
+import re
+
+from database import EXTRACTION_COLUMNS, extraction_to_dict, get_connection
+
+SEARCH_DEFAULT_LIMIT = int(os.getenv('SEARCH_DEFAULT_LIMIT', '20'))
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', '100'))
+SEARCH_SNIPPET_TOKENS = int(os.getenv('SEARCH_SNIPPET_TOKENS', '16'))
+
+# bm25() weights for name, description, features and pricing: a match in the
+# product name counts for more than one buried in the description.
+SEARCH_WEIGHTS = (10.0, 4.0, 2.0, 2.0)
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+# FTS5 wraps matches in these private-use code points, which pages all but
+# never contain; the text is HTML-escaped and only then are they turned into
+# <mark> tags, so markup scraped from a page can never pass for a match.
+_MATCH_START = '\U0010fffc'
+_MATCH_END = '\U0010fffd'
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r'\w+')
+
+def build_match_query(query):
+    # User input is never passed to MATCH as-is: FTS5 query syntax treats
+    # characters such as '-', ':' and '*' as operators. Every term becomes a
+    # quoted phrase of its words, so "usage-based pricing" finds rows with
+    # "usage based" and "pricing", and explicit "quoted phrases" still work.
+    terms = []
+    for phrase, word in _TERM.findall(query):
+        words = _WORD.findall(phrase or word)
+        if words:
+            terms.append('"' + ' '.join(words) + '"')
+    return ' '.join(terms)
+
+def _render_highlight(text):
+    if text is None:
+        return None
+    return html.escape(text).replace(_MATCH_START, HIGHLIGHT_START).replace(_MATCH_END, HIGHLIGHT_END)
+
+def search_extractions(query, limit=SEARCH_DEFAULT_LIMIT, offset=0):
+    match = build_match_query(query)
+    if not match:
+        return [], 0
+
+    conn = get_connection()
+    total = conn.execute(
+        "SELECT COUNT(*) FROM extractions_fts WHERE extractions_fts MATCH ?", (match,)
+    ).fetchone()[0]
+
+    columns = ', '.join('e.' + column for column in EXTRACTION_COLUMNS.split(', '))
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    marks = (_MATCH_START, _MATCH_END)
+    rows = conn.execute(f'''
+        SELECT {columns},
+               bm25(extractions_fts, {weights}) AS score,
+               highlight(extractions_fts, 0, ?, ?),
+               snippet(extractions_fts, 1, ?, ?, '…', ?),
+               snippet(extractions_fts, 2, ?, ?, '…', ?),
+               highlight(extractions_fts, 3, ?, ?)
+        FROM extractions_fts
+        JOIN extractions e ON e.id = extractions_fts.rowid
+        WHERE extractions_fts MATCH ?
+        ORDER BY score, e.id DESC
+        LIMIT ? OFFSET ?
+    ''', (
+        *marks,
+        *marks, SEARCH_SNIPPET_TOKENS,
+        *marks, SEARCH_SNIPPET_TOKENS,
+        *marks,
+        match, limit, offset
+    )).fetchall()
+
+    results = []
+    for row in rows:
+        result = extraction_to_dict(row)
+        # bm25() is lower for better matches; flip it so higher ranks first.
+        result['score'] = -row[9]
+        result['highlights'] = {
+            'name': _render_highlight(row[10]),
+            'description': _render_highlight(row[11]),
+            'features': _render_highlight(row[12]),
+            'pricing': _render_highlight(row[13])
+        }
+        results.append(result)
+    return results, total
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+from database import get_connection, transaction
+
+COALESCE_ENABLED = os.getenv('COALESCE_ENABLED', '1') != '0'
+COALESCE_WINDOW = float(os.getenv('COALESCE_WINDOW', '5'))
+COALESCE_LEASE_SECONDS = float(os.getenv('COALESCE_LEASE_SECONDS', '120'))
+COALESCE_POLL_INTERVAL = float(os.getenv('COALESCE_POLL_INTERVAL', '0.25'))
+
+_lock = threading.Lock()
+_flights = {}
+_async_flights = {}
+
+# Leases this process holds while their fn() runs, renewed in the background.
+_held = {}
+_renewer_pid = None
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def coalesce_key(url):
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if parts.port and (parts.scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((parts.scheme.lower(), host, parts.path or '/', parts.query, ''))
+
+def _live_lease(conn, key, now):
+    return conn.execute(
+        "SELECT status, result FROM extraction_leases WHERE key = ? AND expires_at > ?", (key, now)
+    ).fetchone()
+
+def _acquire(key, owner):
+    # Waiters poll with a plain read, which in WAL mode never takes the write
+    # lock; only a missing or expired lease is claimed in a transaction.
+    now = time.time()
+    row = _live_lease(get_connection(), key, now)
+    if row is None:
+        with transaction() as conn:
+            row = _live_lease(conn, key, now)
+            if row is None:
+                conn.execute('''
+                    INSERT OR REPLACE INTO extraction_leases (key, owner, status, result, expires_at)
+                    VALUES (?, ?, 'running', NULL, ?)
+                ''', (key, owner, now + COALESCE_LEASE_SECONDS))
+                return True, None
+
+    return False, (json.loads(row[1]) if row[0] == 'done' else None)
+
+def _run_across_processes(key, fn):
+    # A lease row in the shared database makes one process the leader for a
+    # key; the others poll until it publishes a result, which stays readable
+    # for COALESCE_WINDOW seconds. An expired lease (leader died) is taken over.
+    owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+    while True:
+        acquired, shared = _acquire(key, owner)
+        if acquired:
+            break
+        if shared is not None:
+            shared['coalesced'] = True
+            return shared
+        time.sleep(COALESCE_POLL_INTERVAL)
+
+    _hold(key, owner)
+    try:
+        result = fn()
+    except BaseException:
+        _release(key)
+        _abandon(key, owner)
+        raise
+
+    _release(key)
+    _publish(key, owner, result)
+    return result
+
+def _hold(key, owner):
+    # A leader keeps its lease alive for as long as fn() runs, so a slow
+    # extraction is never taken over and its result is always published.
+    global _renewer_pid
+    with _lock:
+        _held[key] = owner
+        if _renewer_pid != os.getpid():
+            _renewer_pid = os.getpid()
+            threading.Thread(target=_renew_loop, name="lease-renew", daemon=True).start()
+
+def _release(key):
+    with _lock:
+        _held.pop(key, None)
+
+def _renew_loop():
+    while True:
+        time.sleep(COALESCE_LEASE_SECONDS / 3)
+        with _lock:
+            held = list(_held.items())
+        if not held:
+            continue
+        try:
+            _renew(held)
+        except Exception:
+            pass
+
+def _renew(held):
+    expires_at = time.time() + COALESCE_LEASE_SECONDS
+    with transaction() as conn:
+        conn.executemany('''
+            UPDATE extraction_leases SET expires_at = ?
+            WHERE key = ? AND owner = ? AND status = 'running'
+        ''', [(expires_at, key, owner) for key, owner in held])
+
+def _abandon(key, owner):
+    get_connection().execute(
+        "DELETE FROM extraction_leases WHERE key = ? AND owner = ?", (key, owner)
+    )
+
+def _publish(key, owner, result):
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE extraction_leases SET status = 'done', result = ?, expires_at = ?
+            WHERE key = ? AND owner = ?
+        ''', (json.dumps(result), now + COALESCE_WINDOW, key, owner))
+        conn.execute("DELETE FROM extraction_leases WHERE expires_at < ?", (now - 60,))
+
+def run_once(key, fn):
+    # Callers in this process share one in-memory flight; only its leader
+    # takes part in the cross-process lease.
+    if not COALESCE_ENABLED:
+        return fn()
+
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return dict(flight.result, coalesced=True)
+
+    try:
+        flight.result = _run_across_processes(key, fn)
+        return flight.result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            del _flights[key]
+        flight.done.set()
+
+async def _run_across_processes_async(key, fn):
+    owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+    while True:
+        acquired, shared = await asyncio.to_thread(_acquire, key, owner)
+        if acquired:
+            break
+        if shared is not None:
+            shared['coalesced'] = True
+            return shared
+        await asyncio.sleep(COALESCE_POLL_INTERVAL)
+
+    _hold(key, owner)
+    try:
+        result = await fn()
+    except BaseException:
+        _release(key)
+        await asyncio.to_thread(_abandon, key, owner)
+        raise
+
+    _release(key)
+    await asyncio.to_thread(_publish, key, owner, result)
+    return result
+
+async def run_once_async(key, fn):
+    # Event-loop counterpart of run_once for the ASGI app: requests on this
+    # loop await one shared future, and its leader takes the lease.
+    if not COALESCE_ENABLED:
+        return await fn()
+
+    flight = _async_flights.get(key)
+    if flight is not None:
+        return dict(await asyncio.shield(flight), coalesced=True)
+
+    flight = _async_flights[key] = asyncio.get_running_loop().create_future()
+    try:
+        result = await _run_across_processes_async(key, fn)
+        flight.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        flight.cancel()
+        raise
+    except BaseException as e:
+        flight.set_exception(e)
+        # Mark it retrieved so a flight nobody joined does not log a warning.
+        flight.exception()
+        raise
+    finally:
+        del _async_flights[key]
@@ -0,0 +1,49 @@
+import importlib
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Modules that are imported on first use rather than at startup; the report
+# shows whether this worker has loaded them yet.
+DEFERRED_MODULES = ('google.generativeai', 'bs4')
+
+_started_at = time.time()
+_clock = time.perf_counter()
+_imports = {}
+_phases = {}
+_ready_ms = None
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def import_modules(*names):
+    # Each time is what importing that module added on top of everything
+    # loaded before it, so shared dependencies count against the first user.
+    for name in names:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        _imports[name] = _elapsed_ms(started)
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = _elapsed_ms(started)
+
+def mark_ready():
+    global _ready_ms
+    _ready_ms = _elapsed_ms(_clock)
+
+def get_report():
+    return {
+        "pid": os.getpid(),
+        "started_at": _started_at,
+        "uptime_seconds": round(time.time() - _started_at, 1),
+        "ready_ms": _ready_ms,
+        "imports_ms": dict(_imports),
+        "phases_ms": dict(_phases),
+        "deferred_loaded": {name: name in sys.modules for name in DEFERRED_MODULES}
+    }
@@ -0,0 +1,239 @@
+import json
+import os
+import re
+from html.parser import HTMLParser
+
+STRUCTURED_MIN_CONFIDENCE = float(os.getenv('STRUCTURED_MIN_CONFIDENCE', '0.7'))
+# Features and pricing guessed from class names alone score below the
+# threshold, so only pages that publish them as JSON-LD or microdata skip
+# the model.
+HEURISTIC_CONFIDENCE = 0.5
+
+PRODUCT_TYPES = {'Product', 'SoftwareApplication', 'WebApplication', 'MobileApplication'}
+OFFER_TYPES = {'Offer', 'AggregateOffer'}
+
+_PRICING_HINT = re.compile(r'pric|(^|[\s_-])(plans?|tiers?)([\s_-]|$)', re.IGNORECASE)
+_FEATURE_HINT = re.compile(r'feature', re.IGNORECASE)
+_PRICE_TEXT = re.compile(r'([$€£¥]\s?\d[\d,.]*|\d[\d,.]*\s?(USD|EUR|GBP)|\bfree\b(?!\s+trial))', re.IGNORECASE)
+_CURRENCY_SYMBOLS = {'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥'}
+
+MAX_FEATURES = 15
+MAX_PRICE_SNIPPETS = 6
+
+class StructuredDataParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ''
+        self.meta = {}
+        self.json_ld = []
+        self.microdata = {}
+        self.pricing_snippets = []
+        self.feature_items = []
+        self._stack = []
+        self._in_title = False
+        self._in_json_ld = False
+        self._script_parts = []
+        self._pricing_depth = 0
+        self._feature_depth = 0
+        self._li_parts = None
+        self._price_parts = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        hints = ' '.join(filter(None, [attrs.get('class'), attrs.get('id')]))
+
+        if tag == 'title':
+            self._in_title = True
+        elif tag == 'meta':
+            key = (attrs.get('property') or attrs.get('name') or '').lower()
+            if key and attrs.get('content'):
+                self.meta.setdefault(key, attrs['content'].strip())
+        elif tag == 'script' and (attrs.get('type') or '').lower() == 'application/ld+json':
+            self._in_json_ld = True
+            self._script_parts = []
+
+        itemprop = attrs.get('itemprop')
+        if itemprop in ('price', 'priceCurrency', 'lowPrice', 'highPrice') and attrs.get('content'):
+            self.microdata.setdefault(itemprop, attrs['content'].strip())
+
+        if tag in ('br', 'img', 'input', 'meta', 'link', 'hr', 'source', 'wbr'):
+            return
+
+        pricing = bool(hints and _PRICING_HINT.search(hints))
+        feature = bool(hints and _FEATURE_HINT.search(hints))
+        self._stack.append((tag, pricing, feature))
+        if pricing:
+            self._pricing_depth += 1
+            if self._price_parts is None:
+                self._price_parts = []
+        if feature:
+            self._feature_depth += 1
+        if tag == 'li' and self._feature_depth:
+            self._flush_feature_item()
+            self._li_parts = []
+
+    def _flush_feature_item(self):
+        if self._li_parts is None:
+            return
+        item = ' '.join(''.join(self._li_parts).split())
+        if item and len(item) <= 200 and len(self.feature_items) < MAX_FEATURES:
+            self.feature_items.append(item)
+        self._li_parts = None
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+        elif tag == 'script' and self._in_json_ld:
+            self._in_json_ld = False
+            self._load_json_ld(''.join(self._script_parts))
+
+        # Pop back to the matching open tag, tolerating unclosed children.
+        if not any(open_tag == tag for open_tag, _, _ in self._stack):
+            return
+        while self._stack:
+            open_tag, pricing, feature = self._stack.pop()
+            if open_tag == 'li':
+                self._flush_feature_item()
+            if pricing:
+                self._pricing_depth -= 1
+                if not self._pricing_depth and self._price_parts is not None:
+                    snippet = ' '.join(''.join(self._price_parts).split())
+                    if snippet and _PRICE_TEXT.search(snippet) and len(self.pricing_snippets) < MAX_PRICE_SNIPPETS:
+                        self.pricing_snippets.append(snippet[:200])
+                    self._price_parts = None
+            if feature:
+                self._feature_depth -= 1
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._in_json_ld:
+            self._script_parts.append(data)
+            return
+        if self._in_title:
+            self.title += data
+        if self._li_parts is not None:
+            self._li_parts.append(data)
+        if self._price_parts is not None:
+            self._price_parts.append(data + ' ')
+
+    def _load_json_ld(self, raw):
+        try:
+            self.json_ld.append(json.loads(raw))
+        except ValueError:
+            pass
+
+def _iter_nodes(value):
+    if isinstance(value, list):
+        for item in value:
+            yield from _iter_nodes(item)
+    elif isinstance(value, dict):
+        yield value
+        for key in ('@graph', 'mainEntity', 'itemListElement', 'item'):
+            if key in value:
+                yield from _iter_nodes(value[key])
+
+def _types(node):
+    node_type = node.get('@type', [])
+    return set(node_type if isinstance(node_type, list) else [node_type])
+
+def _text(value):
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('@value')
+    if isinstance(value, str):
+        return ' '.join(value.split()) or None
+    return None
+
+def _format_amount(amount, currency):
+    if amount in (None, ''):
+        return None
+    amount = str(amount).strip()
+    try:
+        if float(amount.replace(',', '')) == 0:
+            return 'Free'
+    except ValueError:
+        pass
+    symbol = _CURRENCY_SYMBOLS.get((currency or '').upper())
+    if symbol:
+        return f"{symbol}{amount}"
+    return f"{amount} {currency}".strip() if currency else amount
+
+def _format_offer(offer):
+    currency = offer.get('priceCurrency')
+    spec = offer.get('priceSpecification')
+    if isinstance(spec, list):
+        spec = spec[0] if spec else None
+    if isinstance(spec, dict):
+        currency = currency or spec.get('priceCurrency')
+
+    if 'AggregateOffer' in _types(offer) or offer.get('lowPrice') is not None:
+        low = _format_amount(offer.get('lowPrice'), currency)
+        high = _format_amount(offer.get('highPrice'), currency)
+        price = f"{low} - {high}" if low and high else low or high
+    else:
+        amount = offer.get('price')
+        if amount is None and isinstance(spec, dict):
+            amount = spec.get('price')
+        price = _format_amount(amount, currency)
+
+    if not price:
+        return None
+    if isinstance(spec, dict) and spec.get('unitText'):
+        price = f"{price}/{spec['unitText']}"
+    label = _text(offer.get('name'))
+    return f"{label}: {price}" if label and label != price else price
+
+def _offers(node):
+    offers = node.get('offers')
+    if isinstance(offers, dict):
+        offers = [offers]
+    return [offer for offer in offers or [] if isinstance(offer, dict)]
+
+def extract_structured_data(html):
+    parser = StructuredDataParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+
+    fields = {}
+
+    def propose(field, value, confidence):
+        if value and confidence > fields.get(field, (None, 0))[1]:
+            fields[field] = (value, confidence)
+
+    for document in parser.json_ld:
+        for node in _iter_nodes(document):
+            types = _types(node)
+            if types & PRODUCT_TYPES:
+                propose('name', _text(node.get('name')), 1.0)
+                propose('description', _text(node.get('description')), 1.0)
+
+                feature_list = node.get('featureList')
+                if isinstance(feature_list, str):
+                    feature_list = [item.strip() for item in re.split(r'[,\n]', feature_list)]
+                if isinstance(feature_list, list):
+                    features = [item for item in (_text(value) for value in feature_list) if item]
+                    propose('features', features[:MAX_FEATURES], 1.0)
+
+                prices = [price for price in map(_format_offer, _offers(node)) if price]
+                propose('pricing', '; '.join(prices[:MAX_PRICE_SNIPPETS]), 1.0)
+            elif types & OFFER_TYPES:
+                propose('pricing', _format_offer(node), 0.9)
+
+    propose('name', parser.meta.get('og:title') or parser.meta.get('og:site_name'), 0.8)
+    propose('name', ' '.join(parser.title.split()), 0.6)
+    propose('description', parser.meta.get('og:description') or parser.meta.get('description'), 0.8)
+
+    if len(parser.feature_items) >= 3:
+        propose('features', parser.feature_items, HEURISTIC_CONFIDENCE)
+
+    if parser.microdata.get('price') or parser.microdata.get('lowPrice'):
+        propose('pricing', _format_offer(parser.microdata), 0.9)
+    if parser.pricing_snippets:
+        propose('pricing', '; '.join(parser.pricing_snippets), HEURISTIC_CONFIDENCE)
+
+    data = {field: fields.get(field, (None, 0))[0] for field in ('name', 'description', 'features', 'pricing')}
+    confidence = min(fields.get(field, (None, 0))[1] for field in data)
+    return data, confidence
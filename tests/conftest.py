@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# Background metric flushes and the LLM result cache would leak state between
+# tests; neither is what these tests are about.
+os.environ.setdefault('METRICS_ENABLED', '0')
+os.environ.setdefault('LLM_CACHE_ENABLED', '0')
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('RETENTION_ENABLED', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import extract
+import ratelimit
+from fakes import PRODUCT, FakeClock, FakeModel
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'test.db'))
+    database._local.__dict__.clear()
+    database.init_db()
+    yield database.get_connection()
+    database.get_connection().close()
+    database._local.__dict__.clear()
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit, 'clock', fake.time)
+    monkeypatch.setattr(ratelimit, 'sleep', fake.sleep)
+    return fake
+
+@pytest.fixture
+def fake_model(clock, monkeypatch):
+    """Call it to install a FakeModel on the fake clock as extract.model"""
+    def install(outcomes=(), default=PRODUCT, latency=0.0):
+        model = FakeModel(clock, outcomes, default=default, latency=latency)
+        monkeypatch.setattr(extract, 'model', model)
+        return model
+    return install
@@ -0,0 +1,51 @@
+import json
+
+# A complete extraction, returned by FakeModel unless a test scripts otherwise.
+PRODUCT = json.dumps({"name": "Acme", "description": "d", "features": ["a"], "pricing": "$10/mo"})
+
+class FakeClock:
+    """Stands in for time.time/time.sleep; sleeping only moves the clock"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += max(0.0, seconds)
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    """Replaces extract.model. Each call takes `latency` seconds on the fake
+    clock and then raises or returns the next scripted outcome; once the
+    script runs out, every call returns `default`."""
+
+    def __init__(self, clock, outcomes=(), default=PRODUCT, latency=0.0):
+        self.clock = clock
+        self.outcomes = list(outcomes)
+        self.default = default
+        self.latency = latency
+        self.prompts = []
+
+    @property
+    def calls(self):
+        return len(self.prompts)
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if self.latency:
+            self.clock.now += self.latency
+        outcome = self.outcomes.pop(0) if self.outcomes else self.default
+        if isinstance(outcome, Exception):
+            raise outcome
+        return Response(outcome(prompt) if callable(outcome) else outcome)
+
+class ResourceExhausted(Exception):
+    """Shaped like google.api_core.exceptions.ResourceExhausted"""
+    code = 429
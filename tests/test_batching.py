@@ -0,0 +1,108 @@
+import json
+import re
+
+import pytest
+
+import extract
+import pipeline
+import ratelimit
+
+def page_ids(prompt):
+    return re.findall(r'=== PAGE (\S+) ===', prompt)
+
+def answer_all(prompt):
+    # Batch prompts get an array keyed by page id, single prompts an object
+    # named after the page content.
+    ids = page_ids(prompt)
+    if ids:
+        return json.dumps([{"page_id": page_id, "name": f"batch {page_id}"} for page_id in ids])
+    return json.dumps({"name": f"single {prompt.rsplit(None, 1)[-1]}"})
+
+@pytest.fixture(autouse=True)
+def batching(db, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'LLM_RATE_PER_MINUTE', 0)
+    monkeypatch.setattr(extract, 'LLM_BATCH_SIZE', 4)
+
+def test_small_pages_share_one_call(fake_model):
+    model = fake_model(default=answer_all)
+
+    results = extract.extract_data_with_gemini_batch([f"page {index}" for index in range(4)])
+
+    assert model.calls == 1
+    assert [result['data']['name'] for result in results] == ['batch p0', 'batch p1', 'batch p2', 'batch p3']
+
+def test_batches_are_split_by_size(fake_model, monkeypatch):
+    monkeypatch.setattr(extract, 'LLM_BATCH_MAX_PAGE_CHARS', 50)
+    model = fake_model(default=answer_all)
+
+    results = extract.extract_data_with_gemini_batch(["page a", "x" * 100 + " big", "page b"])
+
+    # The oversized page goes on its own; the small ones are batched.
+    assert model.calls == 2
+    assert results[1]['data']['name'] == 'single big'
+    assert [results[0]['data']['name'], results[2]['data']['name']] == ['batch p0', 'batch p2']
+
+def test_missing_or_malformed_items_fall_back_to_single_calls(fake_model):
+    partial = json.dumps([
+        {"page_id": "p0", "name": "batch p0"},
+        "not an object",
+        {"page_id": "p9", "name": "unknown page"}
+    ])
+    model = fake_model([partial], default=answer_all)
+
+    results = extract.extract_data_with_gemini_batch(["page zero", "page one", "page two"])
+
+    assert model.calls == 3
+    assert [result['data']['name'] for result in results] == ['batch p0', 'single one', 'single two']
+
+def test_truncated_array_keeps_complete_items(fake_model):
+    truncated = '```json\n[{"page_id": "p0", "name": "batch p0"}, {"page_id": "p1", "name": "bat'
+    model = fake_model([truncated], default=answer_all)
+
+    results = extract.extract_data_with_gemini_batch(["page zero", "page one"])
+
+    assert model.calls == 2
+    assert [result['data']['name'] for result in results] == ['batch p0', 'single one']
+
+def test_failed_batch_call_retries_pages_one_by_one(fake_model):
+    model = fake_model([ValueError("bad request")], default=answer_all)
+
+    results = extract.extract_data_with_gemini_batch(["page zero", "page one"])
+
+    assert model.calls == 3
+    assert all(result['success'] for result in results)
+
+def test_single_page_failures_are_reported_per_item(fake_model):
+    model = fake_model(
+        [ValueError("batch failed"), '{"name": "single ok"}', ValueError("page failed")], default=answer_all
+    )
+
+    results = extract.extract_data_with_gemini_batch(["page zero", "page one"])
+
+    assert model.calls == 3
+    assert results[0] == {"success": True, "data": {"name": "single ok"}}
+    assert results[1]['success'] is False
+    assert "page failed" in results[1]['error']
+
+def test_run_batch_coalesces_duplicate_urls_and_batches_model_calls(fake_model, monkeypatch):
+    fetched = []
+
+    def fetch_page(url, **kwargs):
+        fetched.append(url)
+        return extract.Page(f"<p>{url}</p>", f"page {url.rsplit('/', 1)[-1]}")
+    monkeypatch.setattr(extract, 'fetch_page', fetch_page)
+    model = fake_model(default=answer_all)
+
+    results = pipeline.run_batch(['a.example/1', 'b.example/2', 'a.example/1', 'c.example/3'])
+
+    assert sorted(fetched) == ['https://a.example/1', 'https://b.example/2', 'https://c.example/3']
+    assert model.calls == 1
+    assert all(result['success'] for result in results)
+    assert results[0]['extraction_id'] == results[2]['extraction_id']
+
+def test_parse_batch_response_accepts_wrapped_objects():
+    text = json.dumps({"pages": [{"page_id": "p1", "name": "A", "pricing": None}]})
+
+    assert extract.parse_batch_response(text, ["p1", "p2"]) == {
+        "p1": {"name": "A", "description": None, "features": None, "pricing": None}
+    }
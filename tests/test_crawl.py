@@ -0,0 +1,140 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import crawl
+import ratelimit
+
+class Site:
+    """A local HTTP server with a dict of path -> body (str) or status (int)"""
+
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                site.requests.append((self.path, self.headers.get('User-Agent')))
+                page = site.pages.get(self.path, 404)
+                status, body = (page, b'') if isinstance(page, int) else (200, page.encode())
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def fetched(self, path):
+        return sum(1 for requested, _ in self.requests if requested == path)
+
+@pytest.fixture
+def site(db, fake_model, monkeypatch):
+    monkeypatch.setattr(crawl, 'CRAWL_DELAY', 0)
+    monkeypatch.setattr(crawl, '_robots', {})
+    monkeypatch.setattr(ratelimit, 'LLM_RATE_PER_MINUTE', 0)
+    fake_model()
+    site = Site()
+    yield site
+    site.server.shutdown()
+    site.server.server_close()
+
+def link_page(*paths):
+    return '<html><body>' + ''.join(f'<a href="{path}">{path}</a>' for path in paths) + '</body></html>'
+
+def test_ranks_pricing_and_feature_pages_and_skips_noise(site):
+    site.pages.update({
+        '/robots.txt': 'User-agent: *\nDisallow: /private/\n',
+        '/': link_page('/pricing', '/blog/post-1', '/login', '/private/plans', 'https://other.example/pricing'),
+        '/pricing': link_page('/pricing/enterprise'),
+        '/pricing/enterprise': '<p>Contact us</p>',
+        '/sitemap.xml': f'<urlset><url><loc>{site.url}/features</loc></url></urlset>',
+        '/features': '<p>Lots</p>'
+    })
+
+    result = crawl.crawl_site(site.url + '/', max_pages=4)
+
+    urls = [page['url'].replace(site.url, '') for page in result['pages']]
+    assert result['success'] and result['succeeded'] == len(urls)
+    assert urls[0] == '/'
+    assert set(urls[1:]) == {'/pricing', '/features', '/pricing/enterprise'}
+    assert site.fetched('/private/plans') == 0
+    assert site.fetched('/blog/post-1') == 0
+
+def test_robots_and_sitemaps_are_cached_across_crawls(site):
+    site.pages.update({'/robots.txt': 'User-agent: *\n', '/': link_page()})
+
+    crawl.crawl_site(site.url + '/')
+    crawl._robots.clear()
+    crawl.crawl_site(site.url + '/')
+
+    assert site.fetched('/robots.txt') == 1
+    assert site.fetched('/sitemap.xml') == 1
+
+def test_disallowed_seed_is_refused(site):
+    site.pages.update({'/robots.txt': 'User-agent: *\nDisallow: /\n', '/': link_page()})
+
+    result = crawl.crawl_site(site.url + '/')
+
+    assert result == {"success": False, "error": "robots.txt does not allow crawling this URL"}
+    assert site.fetched('/') == 0
+
+def test_rules_for_the_crawler_user_agent_apply(site, monkeypatch):
+    monkeypatch.setattr(crawl, 'CRAWL_USER_AGENT', 'TestBot')
+    site.pages.update({
+        '/robots.txt': 'User-agent: TestBot\nDisallow: /pricing\n\nUser-agent: *\nAllow: /\n',
+        '/': link_page('/pricing'),
+        '/pricing': '<p>$10</p>'
+    })
+
+    result = crawl.crawl_site(site.url + '/')
+
+    assert [page['url'] for page in result['pages']] == [site.url + '/']
+    assert {agent for _, agent in site.requests} == {'TestBot'}
+
+def test_unreachable_robots_txt_disallows_briefly(site, db):
+    site.pages.update({'/robots.txt': 503, '/': link_page()})
+
+    assert crawl.crawl_site(site.url + '/')['success'] is False
+
+    # Only cached for CRAWL_ERROR_CACHE_TTL: once that passes and the server
+    # recovers, the site is crawlable again.
+    site.pages['/robots.txt'] = 'User-agent: *\n'
+    crawl._robots.clear()
+    db.execute("UPDATE crawl_cache SET fetched_at = fetched_at - ?", (crawl.CRAWL_ERROR_CACHE_TTL + 1,))
+    db.execute("DELETE FROM negative_cache")
+
+    assert crawl.crawl_site(site.url + '/')['success'] is True
+
+def test_missing_robots_txt_allows_everything(site):
+    site.pages['/'] = link_page()
+
+    assert crawl.crawl_site(site.url + '/')['success'] is True
+
+def test_sitemap_indexes_are_followed(site):
+    site.pages.update({
+        '/robots.txt': f'User-agent: *\nSitemap: {site.url}/sitemap_index.xml\n',
+        '/sitemap_index.xml': (
+            f'<sitemapindex><sitemap><loc>{site.url}/sitemap-pages.xml</loc></sitemap></sitemapindex>'
+        ),
+        '/sitemap-pages.xml': f'<urlset><url><loc>{site.url}/plans</loc></url></urlset>',
+        '/': link_page(),
+        '/plans': '<p>$10</p>'
+    })
+
+    result = crawl.crawl_site(site.url + '/')
+
+    assert site.url + '/plans' in [page['url'] for page in result['pages']]
+    assert site.fetched('/sitemap.xml') == 0
+
+def test_score_link_prefers_pricing_over_blog():
+    assert crawl.score_link('https://a.example/pricing') > crawl.score_link('https://a.example/about')
+    assert crawl.score_link('https://a.example/blog/post-1') < 0
+    assert crawl.score_link('https://a.example/blog/pricing-tips') < crawl.score_link('https://a.example/pricing')
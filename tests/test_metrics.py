@@ -0,0 +1,65 @@
+import pytest
+
+import metrics
+
+@pytest.fixture
+def recorder(db, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(metrics, 'METRICS_FLUSH_INTERVAL', 3600)
+    monkeypatch.setattr(metrics, '_counters', {})
+    monkeypatch.setattr(metrics, '_histograms', {})
+    monkeypatch.setattr(metrics, '_last_flush', 0.0)
+    return db
+
+def extractions(total):
+    return total['counters'].get(('visionflow_extractions_total', (('status', 'success'),)), 0)
+
+def test_idle_worker_that_was_retired_is_not_counted_twice(recorder, monkeypatch):
+    worker = metrics._instance
+    metrics.inc('visionflow_extractions_total', status='success')
+    metrics.inc('visionflow_extractions_total', status='success')
+    metrics.flush()
+
+    # The worker went quiet for longer than METRICS_RETIRE_SECONDS, so a
+    # scrape answered by another worker folds its row into 'retired'.
+    recorder.execute(
+        "UPDATE metrics_snapshots SET updated_at = updated_at - ?", (metrics.METRICS_RETIRE_SECONDS + 1,)
+    )
+    monkeypatch.setattr(metrics, '_instance', 'scraper')
+    assert extractions(metrics.collect()) == 2
+    assert recorder.execute(
+        "SELECT COUNT(*) FROM metrics_snapshots WHERE instance = ?", (worker,)
+    ).fetchone()[0] == 0
+
+    # The idle worker wakes up and records one more extraction.
+    monkeypatch.setattr(metrics, '_instance', worker)
+    metrics.inc('visionflow_extractions_total', status='success')
+    metrics.flush()
+    assert extractions(metrics.collect()) == 3
+
+def test_workers_are_summed(recorder, monkeypatch):
+    metrics.inc('visionflow_extractions_total', 2, status='success')
+    metrics.observe('visionflow_fetch_bytes', 2000)
+    metrics.flush()
+
+    monkeypatch.setattr(metrics, '_instance', 'other-worker')
+    metrics.inc('visionflow_extractions_total', status='success')
+    metrics.observe('visionflow_fetch_bytes', 100)
+
+    total = metrics.collect()
+    assert extractions(total) == 3
+    histogram = total['histograms'][('visionflow_fetch_bytes', ())]
+    assert histogram['count'] == 2 and histogram['sum'] == 2100
+
+def test_failed_flush_keeps_its_deltas(recorder, monkeypatch):
+    metrics.inc('visionflow_extractions_total', status='success')
+
+    serialize = metrics._serialize
+    def locked(total):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(metrics, '_serialize', locked)
+    with pytest.raises(RuntimeError):
+        metrics.flush()
+    monkeypatch.setattr(metrics, '_serialize', serialize)
+
+    assert extractions(metrics.collect()) == 1
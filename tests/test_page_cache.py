@@ -0,0 +1,66 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import extract
+import http_client
+
+ETAG = '"v1"'
+
+class Page:
+    """A local HTTP server for one long page that answers If-None-Match with 304"""
+
+    def __init__(self, body):
+        self.body = body.encode()
+        self.requests = []
+        page = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                page.requests.append(self.headers.get('If-None-Match'))
+                if self.headers.get('If-None-Match') == ETAG:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(page.body)))
+                self.send_header('ETag', ETAG)
+                self.end_headers()
+                try:
+                    self.wfile.write(page.body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+@pytest.fixture
+def long_page(db, monkeypatch):
+    monkeypatch.setattr(http_client, 'STREAM_CHUNK_SIZE', 1024)
+    page = Page('<html><body>' + ''.join(f'<p>Paragraph {i} of a long page.</p>' for i in range(5000)) + '</body></html>')
+    yield page
+    page.server.shutdown()
+    page.server.server_close()
+
+def test_budget_truncated_page_revalidates_with_304(long_page):
+    first = extract.fetch_page(long_page.url, streaming=True, max_chars=500)
+    second = extract.fetch_page(long_page.url, streaming=True, max_chars=500)
+
+    assert long_page.requests == [None, ETAG]
+    assert second.text == first.text
+    cached = http_client.load_cached_page(long_page.url)
+    assert cached.truncated and len(http_client.cached_body(cached)) < len(long_page.body)
+
+def test_larger_budget_reads_past_the_cached_prefix(long_page):
+    extract.fetch_page(long_page.url, streaming=True, max_chars=500)
+    page = extract.fetch_page(long_page.url, streaming=True, max_chars=10 ** 6)
+
+    assert long_page.requests == [None, ETAG, None]
+    assert 'Paragraph 4999' in page.text
+    assert not http_client.load_cached_page(long_page.url).truncated
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import extract
+import ratelimit
+from fakes import ResourceExhausted
+
+@pytest.fixture
+def limiter(db, clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'LLM_RATE_PER_MINUTE', 60.0)
+    monkeypatch.setattr(ratelimit, 'LLM_BURST', 5.0)
+    monkeypatch.setattr(ratelimit, 'LLM_MAX_CONCURRENCY', 8.0)
+    monkeypatch.setattr(ratelimit, 'LLM_MAX_RETRIES', 3)
+    monkeypatch.setattr(ratelimit, 'LLM_RETRY_BASE_DELAY', 1.0)
+    return clock
+
+def test_retries_429s_until_the_model_answers(fake_model, limiter):
+    model = fake_model([ResourceExhausted("quota"), ResourceExhausted("quota")], latency=0.5)
+
+    data = extract.extract_data_with_gemini("page content")
+
+    assert data["name"] == "Acme"
+    assert model.calls == 3
+    # Each retry waited out the cooldown the 429 set, not just the backoff.
+    assert limiter.now >= 1_000_000.0 + 3 * 0.5 + 2 * ratelimit.LLM_RETRY_BASE_DELAY
+
+def test_retry_hint_is_a_floor_for_the_backoff(fake_model, limiter):
+    model = fake_model([ResourceExhausted("429 Quota exceeded. Please retry in 7s.")])
+
+    extract.extract_data_with_gemini("page content")
+
+    assert model.calls == 2
+    assert sum(limiter.sleeps) >= 7
+
+def test_429_halves_concurrency_and_sets_a_shared_cooldown(limiter):
+    slot = ratelimit.acquire()
+    ratelimit.release(slot, throttled=True, retry_after=10)
+
+    state = ratelimit.get_state()
+    assert state['concurrency'] == ratelimit.LLM_MAX_CONCURRENCY / 2
+    assert state['cooldown_seconds'] == pytest.approx(10)
+    assert state['tokens'] == 0
+
+    # Another worker (here a thread with its own connection) sees the same
+    # cooldown and waits it out before calling.
+    seen = {}
+    thread = threading.Thread(target=lambda: seen.update(ratelimit.get_state()))
+    thread.start()
+    thread.join()
+    assert seen['cooldown_seconds'] == pytest.approx(10)
+
+    started = limiter.now
+    ratelimit.release(ratelimit.acquire())
+    assert limiter.now - started >= 10
+
+def test_success_grows_concurrency_additively(limiter):
+    slot = ratelimit.acquire()
+    ratelimit.release(slot, throttled=True)
+    ratelimit.release(ratelimit.acquire())
+
+    assert ratelimit.get_state()['concurrency'] == pytest.approx(4 + 1 / 4)
+
+def test_concurrency_never_drops_below_one(limiter):
+    for _ in range(6):
+        ratelimit.release(ratelimit.acquire(), throttled=True, retry_after=1)
+
+    assert ratelimit.get_state()['concurrency'] == 1
+
+def test_token_bucket_paces_calls_after_the_burst(fake_model, limiter, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'LLM_BURST', 2.0)
+    model = fake_model()
+
+    for index in range(5):
+        extract.extract_data_with_gemini(f"page {index}")
+
+    assert model.calls == 5
+    # Two calls from the burst, then one per second at 60 per minute.
+    assert limiter.now - 1_000_000.0 == pytest.approx(3, abs=0.01)
+
+def test_in_flight_calls_are_capped_by_the_window(limiter, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'LLM_MAX_CONCURRENCY', 2.0)
+    monkeypatch.setattr(ratelimit, 'LLM_LIMITER_MAX_WAIT', 1.0)
+    held = [ratelimit.acquire(), ratelimit.acquire()]
+
+    with pytest.raises(ratelimit.RateLimitExceeded):
+        ratelimit.acquire()
+
+    ratelimit.release(held.pop())
+    assert ratelimit.acquire() is not None
+
+def test_gives_up_with_rate_limit_exceeded_and_retry_after(fake_model, limiter):
+    model = fake_model([ResourceExhausted("Please retry in 3s")] * 10)
+
+    with pytest.raises(ratelimit.RateLimitExceeded) as raised:
+        extract.extract_data_with_gemini("page content")
+
+    assert raised.value.retry_after == 3
+    assert model.calls == ratelimit.LLM_MAX_RETRIES + 1
+
+def test_limiter_wait_beyond_max_wait_raises(limiter, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'LLM_LIMITER_MAX_WAIT', 5.0)
+    ratelimit.release(ratelimit.acquire(), throttled=True, retry_after=30)
+
+    with pytest.raises(ratelimit.RateLimitExceeded) as raised:
+        ratelimit.acquire()
+
+    assert raised.value.retry_after == pytest.approx(30)
+
+def test_transient_errors_are_retried_without_cooldown(fake_model, limiter):
+    class ServiceUnavailable(Exception):
+        code = 503
+
+    model = fake_model([ServiceUnavailable("try later")])
+
+    assert extract.extract_data_with_gemini("page content")["name"] == "Acme"
+    assert model.calls == 2
+    assert ratelimit.get_state()['concurrency'] == ratelimit.LLM_MAX_CONCURRENCY
+
+def test_other_errors_fail_without_retrying(fake_model, limiter):
+    model = fake_model([ValueError("bad request")])
+
+    with pytest.raises(Exception, match="Gemini extraction failed: bad request"):
+        extract.extract_data_with_gemini("page content")
+
+    assert model.calls == 1
+
+def test_async_path_shares_the_limiter(fake_model, limiter, monkeypatch):
+    # asyncio.sleep is not faked, so this one runs on the real clock with a
+    # short backoff.
+    monkeypatch.setattr(ratelimit, 'clock', time.time)
+    monkeypatch.setattr(ratelimit, 'LLM_RETRY_BASE_DELAY', 0.01)
+    model = fake_model([ResourceExhausted("quota")])
+
+    data = asyncio.run(extract.extract_data_with_gemini_async("page content"))
+
+    assert data["name"] == "Acme"
+    assert model.calls == 2
+    assert ratelimit.get_state()['concurrency'] < ratelimit.LLM_MAX_CONCURRENCY
+
+def test_retry_hints_are_read_from_attributes_headers_and_messages():
+    class WithDelay(Exception):
+        retry_delay = type('Duration', (), {'seconds': 12})()
+
+    class WithHeader(Exception):
+        response = type('Response', (), {'headers': {'Retry-After': '4'}})()
+
+    assert ratelimit.retry_hint(WithDelay()) == 12
+    assert ratelimit.retry_hint(WithHeader()) == 4
+    assert ratelimit.retry_hint(Exception("retry_delay { seconds: 9 }")) == 9
+    assert ratelimit.retry_hint(Exception("no hint here")) is None
@@ -0,0 +1,30 @@
+import threading
+import time
+
+import singleflight
+
+def test_lease_is_renewed_while_a_slow_leader_runs(db, monkeypatch):
+    monkeypatch.setattr(singleflight, 'COALESCE_LEASE_SECONDS', 0.3)
+    monkeypatch.setattr(singleflight, 'COALESCE_POLL_INTERVAL', 0.02)
+    # Start a renewer on this test's database and lease length.
+    monkeypatch.setattr(singleflight, '_renewer_pid', None)
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(1)
+        return {"success": True, "calls": len(calls)}
+
+    # Two callers that do not share an in-memory flight, as if in two workers.
+    results = []
+    leader = threading.Thread(target=lambda: results.append(singleflight._run_across_processes('k', slow)))
+    leader.start()
+    started.wait()
+    waiter = singleflight._run_across_processes('k', slow)
+    leader.join()
+
+    assert len(calls) == 1
+    assert results == [{"success": True, "calls": 1}]
+    assert waiter == {"success": True, "calls": 1, "coalesced": True}